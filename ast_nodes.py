@@ -1,8 +1,60 @@
+import math
+
+# Most digits the result of raising an integer to an integer power may have, so a
+# power that would take minutes to work out fails straight away (None for no limit)
+MAX_POWER_DIGITS = 1000000
+
+
+def power(base, exponent):
+    """
+    Raises one Python integer to the power of another, checking the size of the
+    result first.
+
+    Args:
+        base (int): Number to raise.
+        exponent (int): Power to raise it to.
+
+    Returns:
+        (int or float): base ** exponent (a float if the exponent is negative).
+    """
+    if MAX_POWER_DIGITS is not None and exponent > 0 and (base > 1 or base < -1):
+        digits = exponent * math.log10(abs(base))
+        if digits >= MAX_POWER_DIGITS:
+            raise OverflowError(
+                f"This power would have about {int(digits) + 1} digits, more than the "
+                f"limit of {MAX_POWER_DIGITS}!"
+            )
+    return base ** exponent
+
+
+def power_mod(base, exponent, modulus):
+    """
+    Works out base ^ exponent mod modulus for Python integers, exactly as
+    Integer.pow() followed by Integer.mod() would, but without building the whole
+    power when it doesn't need to.
+
+    Args:
+        base (int): Number to raise.
+        exponent (int): Power to raise it to.
+        modulus (int): Number to take the remainder by.
+
+    Returns:
+        (int): The remainder.
+    """
+    if exponent >= 0 and modulus != 0:
+        return pow(base, exponent, modulus)
+    return int(power(base, exponent)) % modulus
+
+
 # State instance which gets passed to parser
 class ParserState(object):
-    def __init__(self):
+    def __init__(self, output=None):
         self.variables = {}  # Hold a dict of declared variables
         self.repeat_stack = []
+        self.output = output  # Stream to print to (None prints to sys.stdout)
+        self.procedures = {}  # Hold a dict of defined procedures
+        self.procedure = None  # Procedure whose block is running, if any
+        self.input = None  # Reader values are read from (see reader.InputReader)
 
 
 # Integers
@@ -98,7 +150,7 @@ class Integer:
 
     def pow(self, right):
         if type(right) is Integer:
-            return Integer(self.value ** right.value)
+            return Integer(power(self.value, right.value))
         elif type(right) is Decimal:
             return Decimal(self.value ** right.value)
         raise TypeError(
@@ -400,14 +452,24 @@ class GreaterThan(BinaryOp):
         return self.left.eval().greater_than(self.right.eval())
 
 
+# 'and' and 'or' short-circuit: the right side is only evaluated if the left side
+# doesn't already decide the result. So 'false and x' is false and 'true or x' is true
+# even if x isn't a condition (or would raise an error), but any operand which *is*
+# evaluated must still be a condition
 class And(BinaryOp):
     def eval(self):
-        return self.left.eval().logical_and(self.right.eval())
+        left = self.left.eval()
+        if type(left) is Condition and not left.value:
+            return Condition(False)
+        return left.logical_and(self.right.eval())
 
 
 class Or(BinaryOp):
     def eval(self):
-        return self.left.eval().logical_or(self.right.eval())
+        left = self.left.eval()
+        if type(left) is Condition and left.value:
+            return Condition(True)
+        return left.logical_or(self.right.eval())
 
 
 class Add(BinaryOp):
@@ -434,9 +496,26 @@ class Pow(BinaryOp):
     def eval(self):
         return self.left.eval().pow(self.right.eval())
 
+    def mod(self, modulus):
+        # a ^ b mod m, which only works out a ^ b in full if they aren't all integers
+        base = self.left.eval()
+        exponent = self.right.eval()
+        if type(base) is Integer and type(exponent) is Integer:
+            try:
+                right = modulus.eval()
+            except Exception:
+                base.pow(exponent)  # Any error working out the power has to come first
+                raise
+            if type(right) is Integer:
+                return Integer(power_mod(base.value, exponent.value, right.value))
+            return base.pow(exponent).mod(right)
+        return base.pow(exponent).mod(modulus.eval())
+
 
 class Mod(BinaryOp):
     def eval(self):
+        if type(self.left) is Pow:
+            return self.left.mod(self.right)
         return self.left.eval().mod(self.right.eval())
 
 
@@ -463,11 +542,12 @@ class UnarySub(UnaryOp):
 
 # Print
 class Output:
-    def __init__(self, value):
+    def __init__(self, value, output=None):
         self.value = value
+        self.output = output
 
     def eval(self):
-        print(self.value.eval())
+        print(self.value.eval(), file=self.output)
 
 
 # Variables
@@ -482,6 +562,98 @@ class Variable:
         return self.value.eval()
 
 
+# Variables referred to by name rather than by their value when the line was parsed,
+# for programs which are compiled before they run (see compiler.py)
+class Name:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+# Reading values from input into variables
+class Read:
+    def __init__(self, names, state):
+        self.names = names
+        self.state = state
+
+    def eval(self):
+        # Every value is read before any variable is assigned
+        values = self.state.input.read(len(self.names))
+        for name, value in zip(self.names, values):
+            self.state.variables[name] = value
+
+
+# Procedures
+# First line of a procedure's definition (its block is found by run.Session.define())
+class Definition:
+    def __init__(self, name, parameters):
+        self.name = name
+        self.parameters = parameters
+
+    def eval(self):
+        return None
+
+
+# Raised by a 'return' statement, and caught where the procedure was called
+class Returned(Exception):
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
+
+
+class Return:
+    def __init__(self, value):
+        self.value = value
+
+    def eval(self):
+        raise Returned(self.value.eval())
+
+
+# Call of a procedure within an expression. The procedure only runs the first time it's
+# evaluated, as statements evaluate their expression again after it's parsed
+class Call:
+    def __init__(self, procedure, arguments, output=None):
+        self.procedure = procedure
+        self.arguments = arguments
+        self.output = output
+        self.value = None
+
+    def run(self):
+        arguments = [argument.eval() for argument in self.arguments]
+        return self.procedure.call(arguments, self.output)
+
+    def eval(self):
+        if self.value is None:
+            value = self.run()
+            if value is None:
+                raise ValueError(
+                    f"Procedure {self.procedure.name} didn't return a value."
+                )
+            self.value = value
+        return self.value
+
+
+# Call of a procedure on its own line, which doesn't have to return a value
+class CallStatement:
+    def __init__(self, call):
+        self.call = call
+
+    def eval(self):
+        self.call.run()
+
+
+# Procedure calls referred to by name, for programs which are compiled before they run
+class CallName:
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = arguments
+
+    def __repr__(self):
+        return f"{self.name}({', '.join(map(repr, self.arguments))})"
+
+
 # Do nothing
 class DoNothing:
     def eval(self):
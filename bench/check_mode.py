@@ -0,0 +1,152 @@
+"""
+Checks that Checker reports every syntax and structure error the interpreter stops on,
+at the same line and worded the same way, and reports nothing for the test programs,
+then compares how long checking a program takes with running it.
+
+Usage: python3 bench/check_mode.py [--fuzz N] [--repeat N] [files ...]
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from check import Checker  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from typed_engine import random_program  # noqa: E402
+
+# Ways of breaking a line of a random program
+MUTATIONS = [
+    lambda line: "\t" + line,
+    lambda line: line.replace("\t", "", 1),
+    lambda line: line.rstrip("\n") + " )\n",
+    lambda line: line.rstrip("\n") + " $\n",
+    lambda line: "else\n",
+    lambda line: "else if true\n",
+    lambda line: line.replace("output", "return", 1),
+    lambda line: "procedure f(a, a)\n",
+    lambda line: "\n",
+]
+
+# Line counting down the counter of a 'repeat until' loop
+COUNT_DOWN = re.compile(r"n\d = n\d - 1")
+
+# Start of the messages of errors which only depend on a program's syntax and structure
+STRUCTURAL = (
+    "Ran into a ",
+    "You cannot follow 'else'",
+    "You can only 'return'",
+    "You cannot define a procedure",
+    "Procedure f has two parameters",
+)
+
+
+def mutated_program(rng):
+    lines = random_program(rng)
+    # Loops counting down are left as they are, so they still finish
+    safe = [
+        idx
+        for idx, line in enumerate(lines)
+        if "repeat until" not in line and COUNT_DOWN.search(line) is None
+    ]
+    if not safe:
+        return lines
+    for _ in range(rng.randint(0, 3)):
+        idx = rng.choice(safe)
+        lines[idx] = rng.choice(MUTATIONS)(lines[idx])
+    if rng.random() < 0.2:
+        idx = rng.choice(safe)
+        lines[idx:idx] = ["procedure g()\n", "\treturn 1\n", "\tprocedure h()\n"]
+    return lines
+
+
+def run(grammar, lines):
+    session = Session(grammar, io.StringIO())
+    try:
+        session.run(lines)
+    except Exception as err:
+        return type(err).__name__, str(err), session.error_lineno
+    return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("files", nargs="*")
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    checker = Checker(grammar)
+    rng = random.Random(args.seed)
+    problems = []
+
+    missed = stopped = 0
+    for number in range(args.fuzz):
+        lines = mutated_program(rng)
+        error = run(grammar, lines)
+        found = [
+            (lineno, type(err).__name__, str(err))
+            for lineno, err in checker.check(lines)
+        ]
+        if error is None:
+            continue
+        name, message, lineno = error
+        if name == "LexingError":
+            # The interpreter doesn't give a line number for these
+            expected = bool(found)
+        elif message.startswith(STRUCTURAL):
+            expected = (lineno, name, message) in found
+        else:
+            continue
+        stopped += 1
+        if not expected:
+            missed += 1
+            if missed <= 5:
+                print(f"Missed on {number}:\n{''.join(lines)}")
+                print(f"  interpreter: {error!r}\n  check: {found!r}")
+    print(
+        f"Checked {args.fuzz} random programs, {stopped} stopped by a syntax or "
+        f"structure error: {missed} missed"
+    )
+    if missed:
+        problems.append("errors missed")
+
+    files = args.files or [os.path.join(ROOT, "test.trv")] + sorted(
+        glob.glob(os.path.join(ROOT, "examples", "*.trv"))
+    )
+    for path in files:
+        with open(path, "r") as file:
+            lines = file.readlines()
+        errors = checker.check(lines)
+        if errors:
+            problems.append(f"errors reported for {os.path.basename(path)}")
+
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            checker.check(lines)
+        checked = (time.perf_counter() - start_time) / args.repeat
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            run(grammar, lines)
+        ran = (time.perf_counter() - start_time) / args.repeat
+        print(
+            f"{os.path.basename(path)}: checked in {checked * 1000:.3f} ms, "
+            f"ran in {ran * 1000:.3f} ms"
+        )
+
+    for problem in problems:
+        print(f"Problem: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Checks that a program stopped at a checkpoint and resumed from it in a new session
+(checkpoint.CheckpointSession) prints exactly the same output, and stops with the same
+error on the same line, as running it without stopping, on randomly generated programs
+stopped at random statements. Then compares how long a loop takes to run with and
+without checkpointing.
+
+Usage: python3 bench/checkpoint_resume.py [--fuzz N] [--iterations N]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checkpoint import Checkpoint, CheckpointSession, Stopped  # noqa: E402
+from jit_tier import loop_program  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from typed_engine import random_program, run  # noqa: E402
+
+LOOP = """i = 1
+total = 0
+repeat until i >= {iterations}
+\tif i mod 3 = 0 or i mod 5 = 0
+\t\ttotal = total + i
+\ti = i + 1
+output total
+"""
+
+
+class StopAt(CheckpointSession):
+    # Saves a checkpoint and stops after a given number of lines have started
+    def __init__(self, grammar, output, path, lines):
+        self.countdown = lines
+        super().__init__(grammar, output, path)
+        self.stopping = True
+
+    @property
+    def pending(self):
+        self.countdown -= 1
+        return self.countdown < 0
+
+    @pending.setter
+    def pending(self, value):
+        pass
+
+
+def stopped_and_resumed(grammar, lines, stop_at, path):
+    output = io.StringIO()
+    session = StopAt(grammar, output, path, stop_at)
+    try:
+        session.run(lines)
+        return output.getvalue(), None, session.error_lineno
+    except Stopped:
+        pass
+    except Exception as err:
+        return output.getvalue(), (type(err).__name__, str(err)), session.error_lineno
+
+    resumed = CheckpointSession(grammar, output)
+    try:
+        resumed.resume(lines, Checkpoint.load(path))
+        error = None
+    except Exception as err:
+        error = (type(err).__name__, str(err))
+    return output.getvalue(), error, resumed.error_lineno
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--iterations", type=int, default=5000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+    path = os.path.join(tempfile.mkdtemp(), "checkpoint")
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        if number % 2:
+            lines = random_program(rng)
+            stop_at = rng.randint(0, 40)
+        else:
+            # Mostly stops deep inside nested loops
+            lines = loop_program(rng)
+            stop_at = rng.randint(0, 200)
+        expected = run(Session, grammar, lines)
+        actual = stopped_and_resumed(grammar, lines, stop_at, path)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {number}, stopped at {stop_at}:\n{''.join(lines)}")
+                print(f"  session: {expected!r}\n  resumed: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+
+    lines = LOOP.format(iterations=args.iterations).splitlines(keepends=True)
+    for name, session_class in (
+        ("Session", Session),
+        ("CheckpointSession", CheckpointSession),
+    ):
+        start_time = time.perf_counter()
+        run(session_class, grammar, lines)
+        print(f"{name}: {time.perf_counter() - start_time:.3f} seconds")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
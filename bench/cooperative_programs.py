@@ -0,0 +1,144 @@
+"""
+Checks that programs run a slice at a time (cooperative.ResumableSession) give exactly
+the same output, errors and error line numbers as on Session, that many programs
+running together on one event loop (cooperative.Program) take fair turns and can be
+paused and cancelled, then compares how long they take with running them one after
+another.
+
+Usage: python3 bench/cooperative_programs.py [--fuzz N] [--programs N]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cooperative import Program, ResumableSession  # noqa: E402
+from jit_tier import loop_program  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from typed_engine import random_program, run  # noqa: E402
+
+COUNTER = """n = 0
+repeat {iterations}
+\tn = n + 1
+\tif n mod 2 = 0
+\t\tm = n / 2
+output n
+"""
+
+
+async def run_together(grammar, programs, slice):
+    outputs = [io.StringIO() for _ in programs]
+    running = [
+        Program(lines, grammar, output, slice)
+        for lines, output in zip(programs, outputs)
+    ]
+    results = await asyncio.gather(*running, return_exceptions=True)
+    return [
+        (
+            output.getvalue(),
+            None if result is None else (type(result).__name__, str(result)),
+            program.error_lineno,
+        )
+        for output, result, program in zip(outputs, results, running)
+    ], running
+
+
+async def pause_and_cancel(grammar):
+    # A paused program makes no progress while others run, and carries on once
+    # resumed; a cancelled one stops
+    lines = COUNTER.format(iterations=20000).splitlines(keepends=True)
+    paused, cancelled, other = [
+        Program(lines, grammar, io.StringIO(), slice=10) for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    paused.pause()
+    statements = paused.statements
+    for _ in range(100):
+        await asyncio.sleep(0)
+    problems = []
+    if paused.statements != statements:
+        problems.append("paused program kept running")
+    cancelled.cancel()
+    try:
+        await cancelled
+        problems.append("cancelled program finished")
+    except asyncio.CancelledError:
+        pass
+    paused.resume()
+    await paused
+    await other
+    if paused.session.state.output.getvalue() != "20000\n":
+        problems.append("resumed program gave the wrong output")
+    return problems
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--programs", type=int, default=200)
+    arg_parser.add_argument("--iterations", type=int, default=1000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        lines = random_program(rng) if number % 2 else loop_program(rng)
+        expected = run(Session, grammar, lines)
+        slice = rng.randint(1, 5)
+        actual = run(
+            lambda grammar, output: ResumableSession(grammar, output, slice),
+            grammar,
+            lines,
+        )
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {number}:\n{''.join(lines)}")
+                print(f"  interpreter: {expected!r}\n  resumable: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+
+    programs = [random_program(rng) for _ in range(args.programs // 2)]
+    programs += [
+        COUNTER.format(iterations=args.iterations).splitlines(keepends=True)
+        for _ in range(args.programs - len(programs))
+    ]
+
+    start_time = time.perf_counter()
+    expected = [run(Session, grammar, lines) for lines in programs]
+    print(f"{len(programs)} programs, one after another: ", end="")
+    print(f"{time.perf_counter() - start_time:.3f} seconds")
+
+    start_time = time.perf_counter()
+    actual, running = asyncio.run(run_together(grammar, programs, slice=100))
+    print(f"{len(programs)} programs, together: ", end="")
+    print(f"{time.perf_counter() - start_time:.3f} seconds")
+    different = sum(1 for pair in zip(expected, actual) if pair[0] != pair[1])
+    if different:
+        mismatches += different
+        print(f"{different} programs gave different results together")
+
+    # Identical programs started together take the same number of turns
+    turns = [program.turns for program in running[len(programs) // 2 :]]
+    if turns:
+        print(f"Turns taken by identical programs: {min(turns)} to {max(turns)}")
+
+    problems = asyncio.run(pause_and_cancel(grammar))
+    for problem in problems:
+        print(f"Problem: {problem}")
+    print(f"Pause and cancel: {'failed' if problems else 'ok'}")
+
+    sys.exit(1 if mismatches or problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Checks that 'repeat for' loops give exactly the same output, errors and error line
+numbers with each parser, on each engine and when stopped at a checkpoint and resumed,
+then compares how long counting with 'repeat for' takes with counting a variable up in
+a 'repeat until' loop.
+
+Usage: python3 bench/counted_loops.py [--fuzz N] [--iterations N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checkpoint_resume import stopped_and_resumed  # noqa: E402
+from compiler import CompiledSession  # noqa: E402
+from cooperative import ResumableSession  # noqa: E402
+from flat import FlatSession  # noqa: E402
+from hooks import Hooks  # noqa: E402
+from jit import JitSession  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from stack import StackSession  # noqa: E402
+from typed_engine import run  # noqa: E402
+
+
+def traced(grammar, output):
+    # Traced with an assign callback, so the counter is set every iteration
+    hooks = Hooks()
+    hooks.on("assign", lambda lineno, name, value: None)
+    return hooks.session(grammar, output)
+
+
+ENGINES = (
+    ("typed", CompiledSession),
+    ("jit", lambda grammar, output: JitSession(grammar, output, threshold=2)),
+    ("flat", FlatSession),
+    ("stack", StackSession),
+    ("traced", traced),
+    ("resumable", ResumableSession),
+)
+
+# Parts of random 'repeat for' statements, including some which fail: decimals and
+# text, a step of 0, an undefined variable and a misspelt word
+STARTS = ["1", "0", "-2", "n", "n - 4", "1.5", "y"]
+STOPS = ["3", "0", "-3", "n", "n * 2", "'a'"]
+STEPS = ["", "", " step 2", " step -1", " step n", " step 0"]
+WORDS = [("from", "to", "step")] * 30 + [("form", "to", "step"), ("from", "by", "in")]
+
+UNTIL = """i = 1
+total = 0
+repeat until i > {iterations}
+\ttotal = total + i
+\ti = i + 1
+output total
+"""
+
+FOR = """total = 0
+repeat for i from 1 to {iterations}
+\ttotal = total + i
+output total
+"""
+
+# The counter isn't read, so it's only set once
+FOR_UNREAD = """total = 0
+repeat for i from 1 to {iterations}
+\ttotal = total + 1
+output total
+"""
+
+
+def random_loop(rng, lines, depth):
+    indent = "\t" * depth
+    name = rng.choice(["i", "j", "n"])
+    start, to, step = rng.choice(WORDS)
+    line = f"{indent}repeat for {name} {start} {rng.choice(STARTS)} {to} "
+    line += rng.choice(STOPS)
+    step_part = rng.choice(STEPS)
+    line += step_part.replace("step", step)
+    lines.append(line)
+    for _ in range(rng.randint(1, 3)):
+        choice = rng.random()
+        if choice < 0.3:
+            lines.append(f"{indent}\toutput {name}")
+        elif choice < 0.45:
+            lines.append(f"{indent}\t{name} = {name} * 10")
+        elif choice < 0.6:
+            lines.append(f"{indent}\ttotal = total + 1")
+        elif choice < 0.7:
+            lines.append(f"{indent}\tif {name} mod 2 = 0")
+            lines.append(f"{indent}\t\toutput 'even'")
+        elif choice < 0.75:
+            lines.append(f"{indent}\toutput 1 / ({name} - 2)")
+        elif depth < 2:
+            random_loop(rng, lines, depth + 1)
+        else:
+            lines.append(f"{indent}\toutput total")
+
+
+def random_counted_program(rng):
+    lines = ["n = 4", "total = 0"]
+    for _ in range(rng.randint(1, 2)):
+        random_loop(rng, lines, 0)
+        lines.append(f"output {rng.choice(['i', 'j', 'n', 'total'])}")
+    return [line + "\n" for line in lines]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=2000)
+    arg_parser.add_argument("--iterations", type=int, default=20000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammars = {
+        (lexer, parser): Grammar(lexer_backend=lexer, parser_backend=parser)
+        for lexer in ("rply", "fast")
+        for parser in ("rply", "pratt")
+    }
+    grammar = grammars["fast", "pratt"]
+    rng = random.Random(args.seed)
+    path = os.path.join(tempfile.mkdtemp(), "checkpoint")
+    problems = []
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        lines = random_counted_program(rng)
+        expected = run(Session, grammar, lines)
+        results = [
+            (f"{lexer} lexer, {parser} parser", run(Session, other, lines))
+            for (lexer, parser), other in grammars.items()
+        ]
+        results += [(name, run(engine, grammar, lines)) for name, engine in ENGINES]
+        stop_at = rng.randint(0, 30)
+        results.append(
+            (
+                f"resumed at {stop_at}",
+                stopped_and_resumed(grammar, lines, stop_at, path),
+            )
+        )
+        for name, actual in results:
+            if expected != actual:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"Mismatch on {number}:\n{''.join(lines)}")
+                    print(f"  interpreter: {expected!r}\n  {name}: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+    if mismatches:
+        problems.append("results differ")
+
+    outputs = []
+    for name, program in (
+        ("repeat until", UNTIL),
+        ("repeat for", FOR),
+        ("repeat for, counter unread", FOR_UNREAD),
+    ):
+        lines = program.format(iterations=args.iterations).splitlines(keepends=True)
+        start_time = time.perf_counter()
+        output, error, _ = run(Session, grammar, lines)
+        elapsed = time.perf_counter() - start_time
+        print(f"{name}: {elapsed:.3f} seconds")
+        outputs.append((output, error))
+    if outputs[0] != outputs[1]:
+        problems.append("'repeat for' and 'repeat until' totals differ")
+
+    for problem in problems:
+        print(f"Problem: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
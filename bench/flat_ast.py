@@ -0,0 +1,138 @@
+"""
+Checks that the flat engine (flat.FlatSession) gives exactly the same output, errors
+and error line numbers as the interpreter on randomly generated programs and runs an
+expression nested far deeper than Python's recursion limit, then compares the memory
+each node of a large generated program's expressions takes as a tree of objects and
+in a flat.FlatTree, and how long each engine takes to run it.
+
+Usage: python3 bench/flat_ast.py [--fuzz N] [--statements N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler import CompiledSession  # noqa: E402
+from flat import FlatSession, FlatTree  # noqa: E402
+from jit_tier import loop_program  # noqa: E402
+from parser import SyntaxParser  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from typed_engine import random_program, run  # noqa: E402
+
+
+def arithmetic(rng, depth=0):
+    # Integer arithmetic on a, b and c, which never fails
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice(["a", "b", "c", str(rng.randint(0, 99))])
+    operator = rng.choice([" + ", " - ", " * "])
+    return f"({arithmetic(rng, depth + 1)}{operator}{arithmetic(rng, depth + 1)})"
+
+
+def large_program(rng, statements):
+    # Straight-line assignments and outputs, like a machine-generated program
+    lines = ["a = 1", "b = 2", "c = 3"]
+    for number in range(statements):
+        expression = f"{arithmetic(rng)} mod 997"
+        if number % 10 == 0:
+            lines.append(f"output {expression}")
+        else:
+            lines.append(f"{rng.choice('abc')} = {expression}")
+    return [line + "\n" for line in lines]
+
+
+def count_nodes(expr):
+    count = 0
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for child in ("left", "right", "value"):
+            child = getattr(node, child, None)
+            if hasattr(child, "__dict__"):
+                stack.append(child)
+    return count
+
+
+def memory(lines, grammar):
+    # Bytes traced keeping every line's expression, as trees and in a FlatTree
+    syntax = SyntaxParser()
+    parsed = [syntax.parse(grammar.lexer.lex(line))[2] for line in lines]
+    nodes = sum(count_nodes(expr) for expr in parsed)
+    del parsed
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parsed = [syntax.parse(grammar.lexer.lex(line))[2] for line in lines]
+    objects = tracemalloc.get_traced_memory()[0] - before
+    del parsed
+
+    before = tracemalloc.get_traced_memory()[0]
+    tree = FlatTree()
+    roots = [tree.add(syntax.parse(grammar.lexer.lex(line))[2]) for line in lines]
+    flat = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del roots
+    return nodes, objects, flat, tree
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--statements", type=int, default=100000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        lines = random_program(rng) if number % 2 else loop_program(rng)
+        expected = run(Session, grammar, lines)
+        actual = run(FlatSession, grammar, lines)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {number}:\n{''.join(lines)}")
+                print(f"  interpreter: {expected!r}\n  flat: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+
+    # Nested far deeper than Python's recursion limit, as FlatTree adds and evaluates
+    # expressions without recursion
+    lines = ["output " + " + ".join(["1"] * 50000) + "\n"]
+    output, error, _ = run(FlatSession, grammar, lines)
+    print(f"50000 terms added up on FlatSession: {error[0] if error else output.strip()}")
+    if output != "50000\n":
+        mismatches += 1
+        print("The deeply nested expression didn't run")
+
+    lines = large_program(rng, args.statements)
+    nodes, objects, flat, tree = memory(lines, grammar)
+    print(f"{len(lines)} statements, {nodes} nodes:")
+    print(f"  Tree of objects: {objects / nodes:.1f} bytes per node")
+    print(
+        f"  FlatTree: {flat / nodes:.1f} bytes per node, of which the arrays are "
+        f"{tree.nbytes() / len(tree):.1f} ({len(tree.pool)} constants and names)"
+    )
+
+    results = []
+    for session_class in (Session, CompiledSession, FlatSession):
+        start_time = time.perf_counter()
+        results.append(run(session_class, grammar, lines))
+        elapsed = time.perf_counter() - start_time
+        print(f"{session_class.__name__}: {elapsed:.3f} seconds")
+    if any(result != results[0] for result in results):
+        mismatches += 1
+        print("Mismatch on the large program")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
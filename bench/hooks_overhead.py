@@ -0,0 +1,155 @@
+"""
+Checks that running a program with execution hooks (hooks.TracedSession) gives exactly
+the same output, errors and error line numbers as running it without, and that the
+assign events account for every variable's final value, on randomly generated
+programs, and that assignments in procedures and of their results are reported at the
+right lines, and that 'else if' lines and conditions checked again are reported as
+statements. Then compares how long a loop takes to run with no hooks and with a
+callback for every event.
+
+Usage: python3 bench/hooks_overhead.py [--fuzz N] [--iterations N]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from hooks import EVENTS, Hooks  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from typed_engine import random_program  # noqa: E402
+
+LOOP = """i = 1
+total = 0
+repeat until i >= {iterations}
+\tif i mod 3 = 0 or i mod 5 = 0
+\t\ttotal = total + i
+\telse if i mod 7 = 0
+\t\ttotal = total - 1
+\ti = i + 1
+output total
+"""
+
+# Assignments in a procedure are reported at their own lines, and the assignment of
+# its result at the line of the call. f(x) is f(3), so the second is given its kept
+# result without running
+PROCEDURE = """procedure f(a)
+\tb = a + 1
+\treturn b
+x = f(2)
+y = f(x) + f(3)
+"""
+PROCEDURE_ASSIGNS = [
+    (2, "b", "3"),
+    (4, "x", "3"),
+    (2, "b", "4"),
+    (5, "y", "8"),
+]
+
+# 'else if' lines are statements, as is a 'repeat until' line each time its condition
+# is checked
+BRANCHES = """x = 2
+if x = 1
+\toutput 1
+else if x = 2
+\toutput 2
+i = 0
+repeat until i > 1
+\ti = i + 1
+"""
+BRANCHES_STATEMENTS = [1, 2, 4, 5, 6, 7, 8, 7, 8, 7]
+
+
+def run(session, lines):
+    try:
+        session.run(lines)
+        error = None
+    except Exception as err:
+        error = (type(err).__name__, str(err))
+    return session.state.output.getvalue(), error, session.error_lineno
+
+
+def recording_hooks():
+    hooks = Hooks()
+    events = []
+    for event in EVENTS:
+        hooks.on(event, lambda *args, event=event: events.append((event,) + args))
+    return hooks, events
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--iterations", type=int, default=5000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+    assert type(Hooks().session(grammar)) is Session
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        lines = random_program(rng)
+        expected = run(Session(grammar, io.StringIO()), lines)
+        hooks, events = recording_hooks()
+        session = hooks.session(grammar, io.StringIO())
+        actual = run(session, lines)
+
+        assigned = {}
+        for event in events:
+            if event[0] == "assign":
+                assigned[event[2]] = event[3]
+        errors = [event for event in events if event[0] == "error"]
+        if (
+            expected != actual
+            or assigned != dict(session.state.variables)
+            or len(errors) != (expected[1] is not None)
+        ):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {number}:\n{''.join(lines)}")
+                print(f"  session: {expected!r}\n  traced: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+
+    hooks, events = recording_hooks()
+    run(hooks.session(grammar, io.StringIO()), PROCEDURE.splitlines(keepends=True))
+    assigns = [
+        (event[1], event[2], repr(event[3])) for event in events if event[0] == "assign"
+    ]
+    print(f"Assignments in and from procedures: {assigns}")
+    if assigns != PROCEDURE_ASSIGNS:
+        mismatches += 1
+        print(f"  expected: {PROCEDURE_ASSIGNS}")
+
+    hooks, events = recording_hooks()
+    run(hooks.session(grammar, io.StringIO()), BRANCHES.splitlines(keepends=True))
+    statements = [event[1] for event in events if event[0] == "statement"]
+    print(f"Statements in branches and loops: {statements}")
+    if statements != BRANCHES_STATEMENTS:
+        mismatches += 1
+        print(f"  expected: {BRANCHES_STATEMENTS}")
+
+    lines = LOOP.format(iterations=args.iterations).splitlines(keepends=True)
+    for name, make in (
+        ("Session", lambda: Session(grammar, io.StringIO())),
+        ("Hooks().session()", lambda: Hooks().session(grammar, io.StringIO())),
+        (
+            "TracedSession, every event",
+            lambda: recording_hooks()[0].session(grammar, io.StringIO()),
+        ),
+    ):
+        start_time = time.perf_counter()
+        run(make(), lines)
+        print(f"{name}: {time.perf_counter() - start_time:.3f} seconds")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
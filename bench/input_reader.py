@@ -0,0 +1,166 @@
+"""
+Checks that values read from input are converted exactly as the same literals are in a
+program, and that programs reading input give exactly the same output, errors and error
+line numbers on every engine, then compares summing a column of numbers read from input
+with summing the same numbers written into the program.
+
+Usage: python3 bench/input_reader.py [--fuzz N] [--column N]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checkpoint import CheckpointSession  # noqa: E402
+from compiler import CompiledSession  # noqa: E402
+from cooperative import ResumableSession  # noqa: E402
+from flat import FlatSession  # noqa: E402
+from hooks import TracedSession  # noqa: E402
+from jit import JitSession  # noqa: E402
+from reader import InputReader, convert  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from stack import StackSession  # noqa: E402
+from typed_engine import random_expression  # noqa: E402
+
+ENGINES = (
+    ("typed", CompiledSession),
+    ("jit", lambda grammar, output: JitSession(grammar, output, threshold=2)),
+    ("flat", FlatSession),
+    ("stack", StackSession),
+    ("traced", TracedSession),
+    ("resumable", ResumableSession),
+    ("checkpoint", CheckpointSession),
+)
+
+SUM_COLUMN = """read n
+total = 0
+repeat n
+\tread x
+\ttotal = total + x
+output total
+"""
+
+
+def random_literal(rng):
+    choice = rng.random()
+    if choice < 0.3:
+        return rng.choice(["", "-"]) + str(rng.randint(0, 10 ** rng.randint(1, 20)))
+    if choice < 0.55:
+        return f"{rng.choice(['', '-'])}{rng.randint(0, 999)}.{rng.randint(0, 999)}"
+    if choice < 0.7:
+        word = rng.choice(["true", "false"])
+        return "".join(rng.choice([c, c.upper()]) for c in word)
+    quote = rng.choice(['"', "'", '"""'])
+    return quote + rng.choice(["", "a b", "1", "true", "x;y"]) + quote
+
+
+def random_value(rng):
+    # A line of input: usually a literal, sometimes plain text
+    if rng.random() < 0.85:
+        return random_literal(rng)
+    return rng.choice(["hello world", "3 apples", "1.", "--2", "tru", " 7 "])
+
+
+def random_reading_program(rng):
+    lines = [f"n = {rng.randint(0, 4)}", "t = 0"]
+    lines.append("repeat until n <= 0")
+    lines.append(f"\tread {rng.choice(['x', 'x, y', 'y, x'])}")
+    lines.append("\tn = n - 1")
+    if rng.random() < 0.5:
+        lines.append("\tt = t + x")
+    else:
+        lines.append(f"\toutput {random_expression(rng)}")
+    lines.append("output t")
+    if rng.random() < 0.3:
+        lines.append("read z")
+    return [line + "\n" for line in lines]
+
+
+def run(session_class, grammar, lines, data):
+    output = io.StringIO()
+    session = session_class(grammar, output)
+    session.state.input = InputReader(io.StringIO(data))
+    try:
+        session.run(lines)
+        error = None
+    except Exception as err:
+        error = (type(err).__name__, str(err))
+    return output.getvalue(), error, session.error_lineno
+
+
+def describe(value):
+    # Tells 0.0 from -0.0, which are equal
+    return type(value).__name__, repr(value.value)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=2000)
+    arg_parser.add_argument("--column", type=int, default=20000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+    problems = []
+
+    mismatches = 0
+    for _ in range(args.fuzz):
+        literal = random_literal(rng)
+        session = Session(grammar, io.StringIO())
+        session.run([f"x = {literal}\n"])
+        expected = describe(session.state.variables["x"])
+        actual = describe(convert(literal + "\n"))
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {literal!r}: program {expected}, input {actual}")
+    print(f"Compared {args.fuzz} literals: {mismatches} mismatches")
+    if mismatches:
+        problems.append("values are converted differently")
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        lines = random_reading_program(rng)
+        data = "".join(random_value(rng) + "\n" for _ in range(rng.randint(0, 10)))
+        expected = run(Session, grammar, lines, data)
+        for name, engine in ENGINES:
+            actual = run(engine, grammar, lines, data)
+            if expected != actual:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"Mismatch on {number}:\n{''.join(lines)}input:\n{data}")
+                    print(f"  interpreter: {expected!r}\n  {name}: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+    if mismatches:
+        problems.append("results differ")
+
+    numbers = [str(rng.randint(0, 1000)) for _ in range(args.column)]
+    data = f"{len(numbers)}\n" + "".join(number + "\n" for number in numbers)
+    written = ["total = 0\n"] + [f"total = total + {number}\n" for number in numbers]
+    written.append("output total\n")
+    reading = SUM_COLUMN.splitlines(keepends=True)
+    outputs = set()
+    for name, engine in (("Session", Session), ("CompiledSession", CompiledSession)):
+        for how, lines in (("written in", written), ("read from input", reading)):
+            start_time = time.perf_counter()
+            output, error, _ = run(engine, grammar, lines, data)
+            elapsed = time.perf_counter() - start_time
+            outputs.add(error or output)
+            print(f"{args.column} numbers {how}, {name}: {elapsed:.3f} seconds")
+    if len(outputs) != 1:
+        problems.append("sums differ")
+
+    for problem in problems:
+        print(f"Problem: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
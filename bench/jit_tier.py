@@ -0,0 +1,143 @@
+"""
+Checks that the jit engine (jit.JitSession) gives exactly the same output, errors and
+error line numbers as the interpreter on randomly generated programs, with a threshold
+low enough that almost every loop is compiled, then compares how long each takes to
+run a few hot loops.
+
+Usage: python3 bench/jit_tier.py [--fuzz N] [--iterations N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jit import JitSession  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from typed_engine import random_program, run  # noqa: E402
+
+HOT_LOOPS = {
+    "euler": """i = 1
+total = 0
+repeat until i >= {iterations}
+\tif i mod 3 = 0 or i mod 5 = 0
+\t\ttotal = total + i
+\ti = i + 1
+output total
+""",
+    "decimals": """x = 0.5
+repeat {iterations}
+\tx = x * 3.9 * (1 - x)
+output x
+""",
+    "text": """word = ""
+n = 0
+repeat {iterations}
+\tn = n + 1
+\tif n mod 1000 = 0
+\t\tword = word + "x"
+output word
+""",
+}
+
+
+# Mostly well-typed statements for loop-heavy programs, so loops run long enough to be
+# compiled, with the occasional change of type to fail the guards
+SAFE_EXPRESSIONS = [
+    "a + 1",
+    "a * 2 - b",
+    "b mod 7",
+    "a + b * 3",
+    "(a - b) mod 5",
+    "-a",
+    "b / 4",
+    "a ^ 2 mod 11",
+]
+CONDITIONS = ["a > b", "a mod 2 = 0", "b <= 3 and a not= 1", "not (a = b) or b > 10"]
+TYPE_CHANGES = ["a = 'x'", "b = 2.5", "a = true", "b = 1", "a = 0"]
+
+
+def loop_program(rng):
+    lines = ["a = 0", "b = 1", f"repeat {rng.randint(3, 8)}"]
+
+    def block(indent, depth):
+        tabs = "\t" * indent
+        for _ in range(rng.randint(1, 3)):
+            choice = rng.random()
+            if choice < 0.4:
+                variable = rng.choice("ab")
+                lines.append(f"{tabs}{variable} = {rng.choice(SAFE_EXPRESSIONS)}")
+            elif choice < 0.5:
+                lines.append(f"{tabs}output {rng.choice(SAFE_EXPRESSIONS)}")
+            elif choice < 0.6:
+                lines.append(f"{tabs}{rng.choice(TYPE_CHANGES)}")
+            elif choice < 0.75 and depth < 3:
+                lines.append(f"{tabs}repeat {rng.randint(2, 6)}")
+                block(indent + 1, depth + 1)
+            elif choice < 0.85 and depth < 3:
+                counter = f"n{depth}"
+                lines.append(f"{tabs}{counter} = {rng.randint(1, 6)}")
+                lines.append(f"{tabs}repeat until {counter} <= 0")
+                lines.append(f"{tabs}\t{counter} = {counter} - 1")
+                block(indent + 1, depth + 1)
+            elif depth < 3:
+                lines.append(f"{tabs}if {rng.choice(CONDITIONS)}")
+                block(indent + 1, depth + 1)
+                if rng.random() < 0.5:
+                    lines.append(f"{tabs}else if {rng.choice(CONDITIONS)}")
+                    block(indent + 1, depth + 1)
+                if rng.random() < 0.5:
+                    lines.append(f"{tabs}else")
+                    block(indent + 1, depth + 1)
+
+    block(1, 0)
+    lines.append("output a + b")
+    return [line + "\n" for line in lines]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--iterations", type=int, default=100000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+
+    def jit_session(grammar, output):
+        return JitSession(grammar, output, threshold=1)
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        lines = random_program(rng) if number % 2 else loop_program(rng)
+        expected = run(Session, grammar, lines)
+        actual = run(jit_session, grammar, lines)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {number}:\n{''.join(lines)}")
+                print(f"  interpreter: {expected!r}\n  jit: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+
+    for name, source in HOT_LOOPS.items():
+        lines = source.format(iterations=args.iterations).splitlines(keepends=True)
+        results = []
+        for session_class in (Session, JitSession):
+            start_time = time.perf_counter()
+            results.append(run(session_class, grammar, lines))
+            elapsed = time.perf_counter() - start_time
+            print(f"{name}, {session_class.__name__}: {elapsed:.3f} seconds")
+        if results[0] != results[1]:
+            mismatches += 1
+            print(f"Mismatch on {name}: {results!r}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Checks that FastLexer produces exactly the same tokens as the rply lexer, then
+measures the throughput of both in tokens per second.
+
+Usage: python3 bench/lexer_throughput.py [--fuzz N] [--repeat N] [files ...]
+"""
+
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rply.errors import LexingError  # noqa: E402
+
+from lexer import FastLexer, Lexer  # noqa: E402
+
+# Fragments used to build random lines, chosen to hit keyword edge cases
+FUZZ_FRAGMENTS = [
+    "output",
+    "print",
+    "say",
+    "true",
+    "FaLsE",
+    "mod",
+    "modx",
+    "and",
+    "android",
+    "or",
+    "order",
+    "not",
+    "notable",
+    "not=",
+    "repeat",
+    "repeat until",
+    "until",
+    "if",
+    "else",
+    "else if",
+    "but if",
+    "otherwise",
+    "otherwise if",
+    "x",
+    "_y1",
+    "12",
+    "3.5",
+    "7.",
+    "'a'",
+    '"b c"',
+    '"""d"""',
+    "+",
+    "-",
+    "*",
+    "/",
+    "//c",
+    "^",
+    "=",
+    "<",
+    "<=",
+    ">",
+    ">=",
+    "(",
+    ")",
+    " ",
+    "  ",
+    "\t",
+    "\n",
+    "$",
+    "é",
+]
+
+
+def describe(stream):
+    """
+    Lists everything a token stream produces, including where it raises an error.
+    """
+    result = []
+    while True:
+        try:
+            token = next(stream)
+        except StopIteration:
+            return result
+        except LexingError as err:
+            pos = err.getsourcepos()
+            return result + [("error", pos.idx, pos.lineno, pos.colno)]
+        pos = token.getsourcepos()
+        result.append(
+            (token.gettokentype(), token.getstr(), pos.idx, pos.lineno, pos.colno)
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--fuzz", type=int, default=20000)
+    arg_parser.add_argument("--repeat", type=int, default=50)
+    args = arg_parser.parse_args()
+
+    files = args.files or [os.path.join(ROOT, "test.trv")] + sorted(
+        glob.glob(os.path.join(ROOT, "examples", "*.trv"))
+    )
+    lines = []
+    for name in files:
+        with open(name) as source:
+            lines.extend(source.readlines())
+
+    rply_lexer = Lexer().get_lexer()
+    fast_lexer = FastLexer()
+
+    rng = random.Random(0)
+    fuzz_lines = [
+        "".join(rng.choice(FUZZ_FRAGMENTS) for _ in range(rng.randint(1, 8)))
+        for _ in range(args.fuzz)
+    ]
+
+    mismatches = 0
+    for line in lines + fuzz_lines:
+        want = describe(rply_lexer.lex(line))
+        got = describe(fast_lexer.lex(line))
+        if want != got:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"Mismatch on {line!r}:\n  rply: {want}\n  fast: {got}")
+    print(
+        f"Compared {len(lines)} lines from {len(files)} files and "
+        f"{len(fuzz_lines)} fuzzed lines: {mismatches} mismatches"
+    )
+
+    token_count = sum(len(describe(rply_lexer.lex(line))) for line in lines)
+    for name, lexer in (("rply", rply_lexer), ("fast", fast_lexer)):
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            for line in lines:
+                for _ in lexer.lex(line):
+                    pass
+        elapsed = time.perf_counter() - start_time
+        rate = token_count * args.repeat / elapsed
+        print(f"{name}: {rate:,.0f} tokens/second")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Checks that programs run through an output cache (cache.OutputCache) give exactly the
+same output, errors and error line numbers as on Session, both when they're run and
+when their kept results are printed back, that programs using nondeterministic
+features and programs stopped by running out of recursion are never kept, and that
+the least recently used results are removed once they take too much space. Then
+compares how long running and printing back take.
+
+Usage: python3 bench/output_cache.py [--fuzz N]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lexer  # noqa: E402
+from cache import OutputCache, program_key  # noqa: E402
+from jit_tier import loop_program  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from stack import StackSession  # noqa: E402
+from typed_engine import random_program, run  # noqa: E402
+
+
+def cached_run(cache, grammar, lines, session_class=Session):
+    # As typed_engine.run(), through the cache
+    output = io.StringIO()
+    session = session_class(grammar, output)
+    try:
+        cache.run(session, lines)
+        error = None
+    except Exception as err:
+        error = (type(err).__name__, str(err))
+    return output.getvalue(), error, session.error_lineno
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=1000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+    programs = [
+        random_program(rng) if number % 2 else loop_program(rng)
+        for number in range(args.fuzz)
+    ]
+    problems = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = OutputCache(directory, max_bytes=1024**3)
+        mismatches = 0
+        for number, lines in enumerate(programs):
+            expected = run(Session, grammar, lines)
+            for attempt in ("run", "printed back"):
+                actual = cached_run(cache, grammar, lines)
+                if expected != actual:
+                    mismatches += 1
+                    if mismatches <= 5:
+                        print(f"Mismatch on {number} ({attempt}):\n{''.join(lines)}")
+                        print(f"  interpreter: {expected!r}\n  cached: {actual!r}")
+        print(
+            f"Compared {args.fuzz} random programs: {mismatches} mismatches, "
+            f"{cache.hits} printed back, {cache.misses} run"
+        )
+        if mismatches:
+            problems.append("cached results differ")
+
+        # A token type standing in for a future nondeterministic feature
+        lexer.NONDETERMINISTIC.add("OUTPUT")
+        try:
+            lines = ["output 1\n"]
+            cached_run(cache, grammar, lines)
+            if cache.get(program_key(lines)) is not None:
+                problems.append("a nondeterministic program was kept")
+        finally:
+            lexer.NONDETERMINISTIC.discard("OUTPUT")
+
+        # Too deeply nested for the interpreter with Python's default recursion
+        # limit, but not for the stack engine, so the interpreter's error mustn't be
+        # printed back when it's run on that
+        lines = ["\t" * depth + "if 1 = 1\n" for depth in range(250)]
+        lines.append("\t" * 250 + "output 7\n")
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(1000)
+        try:
+            cached_run(cache, grammar, lines)
+        finally:
+            sys.setrecursionlimit(limit)
+        if cache.get(program_key(lines)) is not None:
+            problems.append("a program stopped by a RecursionError was kept")
+        if cached_run(cache, grammar, lines, StackSession) != ("7\n", None, None):
+            problems.append("the stack engine didn't run a deeply nested program")
+
+        start_time = time.perf_counter()
+        for lines in programs:
+            run(Session, grammar, lines)
+        print(f"Running: {time.perf_counter() - start_time:.3f} seconds")
+        start_time = time.perf_counter()
+        for lines in programs:
+            cached_run(cache, grammar, lines)
+        print(f"Printing back: {time.perf_counter() - start_time:.3f} seconds")
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = OutputCache(directory, max_bytes=4096)
+        first = ["output 'first'\n"]
+        cached_run(cache, grammar, first)
+        for number in range(100):
+            cached_run(cache, grammar, [f"output {number} + 'x' * 100\n"])
+            cache.get(program_key(first))  # Keeps it the most recently used
+            time.sleep(0.001)  # So modification times differ
+        size = sum(entry.stat().st_size for entry in os.scandir(directory))
+        if size > cache.max_bytes:
+            problems.append(f"results take {size} bytes, more than the limit")
+        if cache.get(program_key(first)) is None:
+            problems.append("the most recently used result was removed")
+        if cache.get(program_key(["output 0 + 'x' * 100\n"])) is not None:
+            problems.append("the least recently used result was kept")
+        print(f"Eviction: {len(os.listdir(directory))} results in {size} bytes")
+
+    for problem in problems:
+        print(f"Problem: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Checks that running a program's independent regions in parallel
+(parallel.ParallelSession) gives exactly the same output, errors and error line
+numbers as running it on a single session, on the example programs and on randomly
+generated ones, then compares how long each takes to run a program made of several
+independent parts.
+
+Usage: python3 bench/parallel_regions.py [--fuzz N] [--parts N] [--workers N]
+"""
+
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from parallel import ParallelSession  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from typed_engine import random_program, run  # noqa: E402
+
+# One part of a multi-part exercise, with variables of its own
+PART = """// Part {part}
+i_{part} = 1
+total_{part} = 0
+repeat until i_{part} >= {limit}
+\tif i_{part} mod 3 = 0 or i_{part} mod 5 = 0
+\t\ttotal_{part} = total_{part} + i_{part}
+\ti_{part} = i_{part} + 1
+output "Part {part}: " + total_{part}
+
+"""
+
+
+def random_parts(rng):
+    # Several random programs one after another, most with variables of their own
+    lines = []
+    for part in range(rng.randint(2, 4)):
+        for line in random_program(rng):
+            if rng.random() < 0.8:
+                line = re.sub(r"\b([a-d]|n[0-9])\b", rf"\g<1>_{part}", line)
+            lines.append(line)
+    return lines
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=1000)
+    arg_parser.add_argument("--parts", type=int, default=4)
+    arg_parser.add_argument("--limit", type=int, default=3000)
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+
+    def parallel_session(grammar, output):
+        return ParallelSession(grammar, output, workers=args.workers)
+
+    programs = []
+    for filename in [os.path.join(ROOT, "test.trv")] + sorted(
+        glob.glob(os.path.join(ROOT, "examples", "*.trv"))
+    ):
+        with open(filename) as file:
+            programs.append(file.readlines())
+    programs += [random_parts(rng) for _ in range(args.fuzz)]
+
+    mismatches = 0
+    for number, lines in enumerate(programs):
+        expected = run(Session, grammar, lines)
+        actual = run(parallel_session, grammar, lines)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {number}:\n{''.join(lines)}")
+                print(f"  session: {expected!r}\n  parallel: {actual!r}")
+    print(f"Compared {len(programs)} programs: {mismatches} mismatches")
+
+    source = "".join(
+        PART.format(part=part, limit=args.limit) for part in range(1, args.parts + 1)
+    )
+    lines = source.splitlines(keepends=True)
+    results = []
+    for name, session_class in (
+        ("Session", Session),
+        ("ParallelSession", parallel_session),
+    ):
+        start_time = time.perf_counter()
+        results.append(run(session_class, grammar, lines))
+        elapsed = time.perf_counter() - start_time
+        print(f"{args.parts} parts, {name}: {elapsed:.3f} seconds")
+    if results[0] != results[1]:
+        mismatches += 1
+        print(f"Mismatch on the {args.parts} parts: {results!r}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Checks that PrattParser gives exactly the same results and errors as the RPly LALR
+parser, then compares how long each takes to parse the statements in the test
+programs.
+
+Usage: python3 bench/parser_speed.py [--fuzz N] [--repeat N] [files ...]
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import sys
+import time
+from copy import copy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ast_nodes import Integer, ParserState  # noqa: E402
+from lexer import FastLexer  # noqa: E402
+from parser import Parser, PrattParser  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+
+# Fragments used to build random lines: statements are followed by a random mix of
+# expression fragments, including one defined and one undefined variable
+STATEMENTS = [
+    "output ",
+    "x = ",
+    "if ",
+    "else if ",
+    "else ",
+    "repeat ",
+    "repeat until ",
+    "repeat for i from ",
+    "",
+]
+EXPRESSION_FRAGMENTS = [
+    "x",
+    "y",
+    "1",
+    "2.5",
+    "0",
+    "'a'",
+    "true",
+    "+",
+    "-",
+    "*",
+    "/",
+    "^",
+    " mod ",
+    "=",
+    " not= ",
+    "<",
+    "<=",
+    ">",
+    ">=",
+    " and ",
+    " or ",
+    "not ",
+    " to ",
+    " step ",
+    "(",
+    ")",
+    "\n",
+    "\t",
+]
+
+
+OPERANDS = ["x", "1", "2.5", "0", "'a'", "true", "3"]
+PREFIX_OPERATORS = ["-", "+", "not "]
+BINARY_OPERATORS = [
+    "+",
+    "-",
+    "*",
+    "/",
+    "^",
+    " mod ",
+    "=",
+    " not= ",
+    "<",
+    "<=",
+    ">",
+    ">=",
+    " and ",
+    " or ",
+]
+
+
+def random_expression(rng, depth=3):
+    """
+    Builds a random well-formed expression, to exercise operator precedence.
+    """
+    roll = rng.random()
+    if depth == 0 or roll < 0.3:
+        return rng.choice(OPERANDS)
+    if roll < 0.45:
+        return rng.choice(PREFIX_OPERATORS) + random_expression(rng, depth - 1)
+    if roll < 0.55:
+        return "(" + random_expression(rng, depth - 1) + ")"
+    return (
+        random_expression(rng, depth - 1)
+        + rng.choice(BINARY_OPERATORS)
+        + random_expression(rng, depth - 1)
+    )
+
+
+def describe(node):
+    """
+    Describes a parse result by its node types and values, for comparison.
+    """
+    if isinstance(node, (int, float, str)) or node is None:
+        return node
+    fields = sorted(
+        (name, describe(value))
+        for name, value in vars(node).items()
+        if name != "output"
+    )
+    return (type(node).__name__, tuple(fields))
+
+
+def outcome(parser, tokens, variables):
+    """
+    Parses a line, returning a description of the result or of the error raised,
+    along with the variables afterwards.
+    """
+    state = ParserState(io.StringIO())
+    state.variables = dict(variables)
+    try:
+        result = ("result", describe(parser.parse(tokens, state=state)))
+    except Exception as err:
+        result = ("error", type(err).__name__, str(err))
+    return result, describe_variables(state.variables)
+
+
+def describe_variables(variables):
+    return sorted((name, describe(value)) for name, value in variables.items())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--fuzz", type=int, default=20000)
+    arg_parser.add_argument("--repeat", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    files = args.files or [os.path.join(ROOT, "test.trv")] + sorted(
+        glob.glob(os.path.join(ROOT, "examples", "*.trv"))
+    )
+
+    pg = Parser()
+    pg.parse()
+    parsers = {"rply": pg.get_parser(), "pratt": PrattParser()}
+    lexer = FastLexer()
+
+    # Whole programs must print the same thing and fail in the same way
+    mismatches = 0
+    for name in files:
+        with open(name) as source:
+            lines = source.readlines()
+        outputs = []
+        for backend in parsers:
+            output = io.StringIO()
+            session = Session(Grammar("fast", backend), output)
+            try:
+                session.run(lines)
+            except Exception as err:
+                output.write(f"{type(err).__name__}: {err}")
+            outputs.append(output.getvalue())
+        if outputs[0] != outputs[1]:
+            mismatches += 1
+            print(f"Output of {name} differs")
+
+    # Single lines must give the same results, errors and variables
+    rng = random.Random(0)
+    variables = {"x": Integer(2)}
+    for _ in range(args.fuzz):
+        if rng.random() < 0.5:
+            line = rng.choice(STATEMENTS) + random_expression(rng)
+        else:
+            line = rng.choice(STATEMENTS) + "".join(
+                rng.choice(EXPRESSION_FRAGMENTS) for _ in range(rng.randint(1, 6))
+            )
+        outcomes = [
+            outcome(parser, lexer.lex(line), variables) for parser in parsers.values()
+        ]
+        if outcomes[0] != outcomes[1]:
+            mismatches += 1
+            if mismatches <= 10:
+                print(
+                    f"Mismatch on {line!r}:\n  rply:  {outcomes[0]}\n  pratt: {outcomes[1]}"
+                )
+    print(
+        f"Compared {len(files)} programs and {args.fuzz} fuzzed lines: "
+        f"{mismatches} mismatches"
+    )
+
+    # Time parsing alone: every statement line in the programs, with their variables
+    # already defined
+    statements = []
+    state = ParserState(io.StringIO())
+    for name in files:
+        with open(name) as source:
+            lines = source.readlines()
+        session = Session(Grammar("fast", "pratt"), io.StringIO())
+        session.run(lines)
+        state.variables.update(session.state.variables)
+        for line in lines:
+            if not line.strip() or line.lstrip().startswith("//"):
+                continue
+            tokens = lexer.lex(line.lstrip("\t"))
+            # Lines which only parse inside a procedure call are left out
+            try:
+                parsers["pratt"].parse(copy(tokens), state=state)
+            except Exception:
+                continue
+            statements.append(tokens)
+
+    for backend, parser in parsers.items():
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            for tokens in statements:
+                parser.parse(copy(tokens), state=state)
+        elapsed = time.perf_counter() - start_time
+        rate = len(statements) * args.repeat / elapsed
+        print(f"{backend}: {rate:,.0f} statements/second")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
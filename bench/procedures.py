@@ -0,0 +1,152 @@
+"""
+Checks that programs using procedures give exactly the same output, errors and error
+line numbers with each parser and on each engine, including procedures which call
+themselves as deeply as they can and one call deeper, then compares how long a recursive
+procedure takes when its results are kept (as it's pure) and when they aren't (as it
+prints).
+
+Usage: python3 bench/procedures.py [--fuzz N] [--fib N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checkpoint import CheckpointSession  # noqa: E402
+from compiler import CompiledSession  # noqa: E402
+from cooperative import ResumableSession  # noqa: E402
+from flat import FlatSession  # noqa: E402
+from hooks import TracedSession  # noqa: E402
+from jit import JitSession  # noqa: E402
+from procedures import MAX_CALL_DEPTH  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from stack import StackSession  # noqa: E402
+from typed_engine import random_expression, run  # noqa: E402
+
+ENGINES = (
+    ("typed", CompiledSession),
+    ("jit", lambda grammar, output: JitSession(grammar, output, threshold=2)),
+    ("flat", FlatSession),
+    ("stack", StackSession),
+    ("traced", TracedSession),
+    ("resumable", ResumableSession),
+    ("checkpoint", CheckpointSession),
+)
+
+FIB = """procedure fib(n)
+{effect}\tif n < 2
+\t\treturn n
+\treturn fib(n - 1) + fib(n - 2)
+output fib({n})
+"""
+
+
+def random_procedure_program(rng):
+    # A few procedures calling each other and the program calling them, with some
+    # mistakes: undefined procedures, wrong numbers of values and stray 'return's
+    lines = []
+    names = []
+    for number in range(rng.randint(1, 3)):
+        name = f"p{number}"
+        parameters = ["a", "b"][: rng.randint(0, 2)]
+        lines.append(f"procedure {name}({', '.join(parameters)})")
+        if rng.random() < 0.3:
+            lines.append(f"\toutput {random_expression(rng)}")
+        if names and rng.random() < 0.5:
+            lines.append(f"\tc = {procedure_call(rng, names)}")
+        if rng.random() < 0.4:
+            lines.append(f"\tif {random_expression(rng)}")
+            lines.append(f"\t\treturn {random_expression(rng)}")
+        if rng.random() < 0.4:
+            lines.append("\trepeat 2")
+            lines.append(f"\t\ta = {random_expression(rng)}")
+        if rng.random() < 0.8:
+            lines.append(f"\treturn {random_expression(rng)}")
+        else:
+            lines.append("\tc = 1")
+        names.append(name)
+    for _ in range(rng.randint(1, 4)):
+        choice = rng.random()
+        if choice < 0.4:
+            lines.append(f"output {procedure_call(rng, names)}")
+        elif choice < 0.6:
+            lines.append(procedure_call(rng, names))
+        elif choice < 0.8:
+            lines.append(f"if {procedure_call(rng, names)} = 1")
+            lines.append(f"\toutput {procedure_call(rng, names)}")
+        elif choice < 0.9:
+            lines.append(f"{rng.choice(['a', 'b'])} = {random_expression(rng)}")
+        else:
+            lines.append(f"return {random_expression(rng)}")
+    return [line + "\n" for line in lines]
+
+
+def procedure_call(rng, names):
+    name = rng.choice(names + ["q"])  # q is never defined
+    values = [random_expression(rng) for _ in range(rng.randint(0, 2))]
+    return f"{name}({', '.join(values)})"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=2000)
+    arg_parser.add_argument("--fib", type=int, default=16)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammars = {
+        (lexer, parser): Grammar(lexer_backend=lexer, parser_backend=parser)
+        for lexer in ("rply", "fast")
+        for parser in ("rply", "pratt")
+    }
+    grammar = grammars["fast", "pratt"]
+    rng = random.Random(args.seed)
+    problems = []
+
+    mismatches = 0
+    # fib(n) has n calls running at once
+    deepest = [
+        FIB.format(effect="", n=n).splitlines(keepends=True)
+        for n in (MAX_CALL_DEPTH, MAX_CALL_DEPTH + 1)
+    ]
+    for number in range(-len(deepest), args.fuzz):
+        lines = deepest[number] if number < 0 else random_procedure_program(rng)
+        expected = run(Session, grammar, lines)
+        results = [
+            (f"{lexer} lexer, {parser} parser", run(Session, other, lines))
+            for (lexer, parser), other in grammars.items()
+        ]
+        results += [(name, run(engine, grammar, lines)) for name, engine in ENGINES]
+        for name, actual in results:
+            if expected != actual:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"Mismatch on {number}:\n{''.join(lines)}")
+                    print(f"  interpreter: {expected!r}\n  {name}: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+    if mismatches:
+        problems.append("results differ")
+
+    outputs = []
+    for name, effect in (("pure", ""), ("printing", "\toutput n\n")):
+        lines = FIB.format(effect=effect, n=args.fib).splitlines(keepends=True)
+        start_time = time.perf_counter()
+        output, error, _ = run(Session, grammar, lines)
+        elapsed = time.perf_counter() - start_time
+        print(f"fib({args.fib}), {name}: {elapsed:.3f} seconds")
+        outputs.append(error or output.splitlines()[-1])
+    if outputs[0] != outputs[1]:
+        problems.append("memoized results differ")
+
+    for problem in problems:
+        print(f"Problem: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Stress test for concurrent sessions. Runs many programs at once on a thread pool,
+all sharing one Grammar and all using the same variable names, and checks that every
+session printed exactly what it prints when run on its own.
+
+Usage: python3 bench/sessions_stress.py [--sessions N] [--threads N] [--rounds N]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run import Grammar, Session  # noqa: E402
+
+PROGRAM = """total = {k}
+i = 1
+repeat until i > 60
+\tif i mod 3 = 0
+\t\ttotal = total + i * {k}
+\telse if i mod 5 = 0
+\t\ttotal = total - {k}
+\telse
+\t\ttotal = total + 1
+\ti = i + 1
+output "session {k}: " + total
+repeat 3
+\toutput total mod ({k} + 7)
+"""
+
+
+def run_program(grammar, source):
+    output = io.StringIO()
+    Session(grammar, output).run(source.splitlines(keepends=True))
+    return output.getvalue()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--sessions", type=int, default=64)
+    arg_parser.add_argument("--threads", type=int, default=16)
+    arg_parser.add_argument("--rounds", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    # Switch threads as often as possible so sessions interleave mid-statement
+    sys.setswitchinterval(1e-6)
+
+    grammar = Grammar()
+    sources = [PROGRAM.format(k=k) for k in range(args.sessions)]
+    expected = [run_program(grammar, source) for source in sources]
+
+    failures = 0
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        for _ in range(args.rounds):
+            results = pool.map(lambda source: run_program(grammar, source), sources)
+            for k, (result, want) in enumerate(zip(results, expected)):
+                if result != want:
+                    failures += 1
+                    print(f"Session {k} printed {result!r}, expected {want!r}")
+    elapsed = time.perf_counter() - start_time
+
+    runs = args.sessions * args.rounds
+    print(
+        f"{runs} sessions on {args.threads} threads in {elapsed:.2f}s, "
+        f"{failures} with cross-talk"
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
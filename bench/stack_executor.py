@@ -0,0 +1,118 @@
+"""
+Checks that programs run without recursion (stack.StackSession) give exactly the same
+output, errors and error line numbers as on Session, that deeply nested blocks run,
+and that the time to run a chain of nested 'if' statements grows about linearly with
+the size of the program (not with the cube of its depth), then compares how long
+nested loops take on each.
+
+Usage: python3 bench/stack_executor.py [--fuzz N] [--depth N] [--chain N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jit_tier import loop_program  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+from stack import StackSession  # noqa: E402
+from typed_engine import random_program, run  # noqa: E402
+
+NESTED_LOOPS = """n = 0
+repeat {iterations}
+\trepeat 10
+\t\trepeat 10
+\t\t\tn = n + 1
+output n
+"""
+
+
+def nested_program(depth):
+    # Blocks nested depth deep, alternating loops and ifs
+    lines = ["n = 0\n"]
+    for level in range(depth):
+        header = "repeat 1" if level % 2 else "if n = 0"
+        lines.append("\t" * level + header + "\n")
+    lines.append("\t" * depth + "n = n + 1\n")
+    lines.append("output n\n")
+    return lines
+
+
+def if_chain(depth):
+    # A chain of 'if true' blocks, each nested in the last
+    lines = ["\t" * level + "if true\n" for level in range(depth)]
+    lines.append("\t" * depth + "output 1\n")
+    return lines
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--depth", type=int, default=500)
+    arg_parser.add_argument("--chain", type=int, default=1000)
+    arg_parser.add_argument("--iterations", type=int, default=300)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+    problems = []
+
+    mismatches = 0
+    for number in range(args.fuzz):
+        lines = random_program(rng) if number % 2 else loop_program(rng)
+        expected = run(Session, grammar, lines)
+        actual = run(StackSession, grammar, lines)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {number}:\n{''.join(lines)}")
+                print(f"  interpreter: {expected!r}\n  stack: {actual!r}")
+    print(f"Compared {args.fuzz} random programs: {mismatches} mismatches")
+    if mismatches:
+        problems.append("results differ")
+
+    lines = nested_program(args.depth)
+    for name, engine in (("Session", Session), ("StackSession", StackSession)):
+        output, error, _ = run(engine, grammar, lines)
+        result = error[0] if error else output.strip()
+        print(f"{args.depth} nested blocks on {name}: {result}")
+    if output != "1\n" or error is not None:
+        problems.append("deeply nested blocks didn't run")
+
+    # Each block's extent is found once, so each line is only lexed twice. A chain
+    # four times as deep is 16 times as long (each line has four times as many tabs),
+    # so should take about 16 times as long, rather than 64 if every level lexed its
+    # block again
+    times = []
+    for depth in (args.chain // 4, args.chain):
+        lines = if_chain(depth)
+        start_time = time.perf_counter()
+        output, error, _ = run(StackSession, grammar, lines)
+        times.append(time.perf_counter() - start_time)
+        print(
+            f"Chain of {depth} ifs ({sum(map(len, lines))} characters) on "
+            f"StackSession: {times[-1]:.3f} seconds"
+        )
+        if output != "1\n" or error is not None:
+            problems.append(f"the chain of {depth} ifs didn't run")
+    if times[1] > 32 * times[0]:
+        problems.append("time to run nested ifs grows faster than the program")
+
+    lines = NESTED_LOOPS.format(iterations=args.iterations).splitlines(keepends=True)
+    for name, engine in (("Session", Session), ("StackSession", StackSession)):
+        start_time = time.perf_counter()
+        run(engine, grammar, lines)
+        print(f"Nested loops on {name}: {time.perf_counter() - start_time:.3f} seconds")
+
+    for problem in problems:
+        print(f"Problem: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Checks that the typed engine (compiler.CompiledSession) gives exactly the same output,
+errors and error line numbers as the interpreter on the example programs and on
+randomly generated ones, then compares how long each takes to run the examples and a
+long program with no loops, where every statement runs once.
+
+Usage: python3 bench/typed_engine.py [--fuzz N] [--repeat N] [--lines N] [files ...]
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler import CompiledSession  # noqa: E402
+from run import Grammar, Session  # noqa: E402
+
+VARIABLES = ["a", "b", "c"]
+VALUES = ["0", "1", "2", "7", "2.5", "'t'", "true", "false"]
+BINARY = ["+", "-", "*", "/", "^", " mod ", "=", " not= ", "<", ">=", " and ", " or "]
+UNARY = ["-", "+", "not "]
+
+
+def random_expression(rng, depth=0):
+    choice = rng.random()
+    if depth > 2 or choice < 0.35:
+        return rng.choice(VALUES + VARIABLES + ["d"])  # d is never defined
+    if choice < 0.45:
+        return rng.choice(UNARY) + random_expression(rng, depth + 1)
+    if choice < 0.55:
+        return "(" + random_expression(rng, depth + 1) + ")"
+    return (
+        random_expression(rng, depth + 1)
+        + rng.choice(BINARY)
+        + random_expression(rng, depth + 1)
+    )
+
+
+def random_block(rng, indent, depth, lines):
+    for _ in range(rng.randint(1, 4)):
+        tabs = "\t" * indent
+        choice = rng.random()
+        if choice < 0.3:
+            lines.append(f"{tabs}{rng.choice(VARIABLES)} = {random_expression(rng)}")
+        elif choice < 0.5:
+            lines.append(f"{tabs}output {random_expression(rng)}")
+        elif choice < 0.6 and depth < 3:
+            lines.append(f"{tabs}repeat {rng.choice(['1', '2', '3', 'a', '0'])}")
+            random_block(rng, indent + 1, depth + 1, lines)
+        elif choice < 0.65 and depth < 3:
+            # Counts down a variable of its own, so it always finishes
+            counter = f"n{depth}"
+            lines.append(f"{tabs}{counter} = {rng.randint(0, 3)}")
+            lines.append(f"{tabs}repeat until {counter} <= 0")
+            lines.append(f"{tabs}\t{counter} = {counter} - 1")
+            random_block(rng, indent + 1, depth + 1, lines)
+        elif choice < 0.85 and depth < 3:
+            lines.append(f"{tabs}if {random_expression(rng)}")
+            random_block(rng, indent + 1, depth + 1, lines)
+            for _ in range(rng.randint(0, 2)):
+                lines.append(f"{tabs}else if {random_expression(rng)}")
+                random_block(rng, indent + 1, depth + 1, lines)
+            if rng.random() < 0.5:
+                lines.append(f"{tabs}else")
+                random_block(rng, indent + 1, depth + 1, lines)
+            if rng.random() < 0.05:
+                lines.append(f"{tabs}else")
+        elif choice < 0.9:
+            lines.append(f"{tabs}output {random_expression(rng)} )")  # Syntax error
+        elif choice < 0.95:
+            lines.append(f"{tabs}// comment")
+        else:
+            lines.append("")
+
+
+def random_program(rng):
+    lines = [
+        f"{name} = {rng.choice(VALUES)}" for name in VARIABLES if rng.random() < 0.8
+    ]
+    random_block(rng, 0, 0, lines)
+    return [line + "\n" for line in lines]
+
+
+def straight_line_program(lines):
+    # Assignments, outputs and ifs of numbers and text, each run once
+    program = ["a = 1", "b = 2.5", "c = 't'"]
+    while len(program) < lines:
+        number = len(program)
+        program.append(f"a = a + {number} * 2 - b mod 7")
+        program.append("b = b * 1.5 - a / 3")
+        program.append("output a + b")
+        program.append("if a > b")
+        program.append(f"\tc = c + '{number % 10}'")
+        program.append("output c")
+    return [line + "\n" for line in program]
+
+
+def run(session_class, grammar, lines):
+    output = io.StringIO()
+    session = session_class(grammar, output)
+    try:
+        session.run(lines)
+        error = None
+    except Exception as err:
+        error = (type(err).__name__, str(err))
+    return output.getvalue(), error, session.error_lineno
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--fuzz", type=int, default=3000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--lines", type=int, default=20000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("files", nargs="*")
+    args = arg_parser.parse_args()
+
+    files = args.files or [os.path.join(ROOT, "test.trv")] + sorted(
+        glob.glob(os.path.join(ROOT, "examples", "*.trv"))
+    )
+    programs = {}
+    for filename in files:
+        with open(filename) as file:
+            programs[filename] = file.readlines()
+
+    grammar = Grammar(lexer_backend="fast", parser_backend="pratt")
+    rng = random.Random(args.seed)
+    fuzzed = [random_program(rng) for _ in range(args.fuzz)]
+
+    mismatches = 0
+    for name, lines in list(programs.items()) + list(enumerate(fuzzed)):
+        expected = run(Session, grammar, lines)
+        actual = run(CompiledSession, grammar, lines)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch on {name}:\n{''.join(lines)}")
+                print(f"  interpreter: {expected!r}\n  typed: {actual!r}")
+    print(
+        f"Compared {len(programs)} programs and {len(fuzzed)} random programs: "
+        f"{mismatches} mismatches"
+    )
+
+    for session_class in (Session, CompiledSession):
+        elapsed = 0.0
+        for lines in programs.values():
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                run(session_class, grammar, lines)
+                elapsed += time.perf_counter() - start_time
+        print(f"{session_class.__name__}: {elapsed / args.repeat:.3f} seconds")
+
+    # Every statement runs once, so this is mostly the cost of compiling the program,
+    # which shouldn't make it any slower than on the interpreter
+    lines = straight_line_program(args.lines)
+    results = []
+    for session_class in (Session, CompiledSession):
+        start_time = time.perf_counter()
+        results.append(run(session_class, grammar, lines))
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"{len(lines)} lines run once, {session_class.__name__}: "
+            f"{elapsed:.3f} seconds"
+        )
+    if results[0] != results[1]:
+        mismatches += 1
+        print("Mismatch on the program run once")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
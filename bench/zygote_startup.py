@@ -0,0 +1,154 @@
+"""
+Checks that programs run through the zygote (python3 zygote.py, with python3 run.py
+--zygote waiting) print exactly the same to stdout and stderr, and exit with the same
+status, as running python3 run.py directly, including programs which read input, stop
+with an error or are interrupted with Ctrl-C, and that a client which connects but
+sends nothing doesn't hold up others. Then compares how long a one-line program takes
+to start and finish each way.
+
+Usage: python3 bench/zygote_startup.py [--runs N]
+"""
+
+import argparse
+import glob
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zygote import run_remote  # noqa: E402
+
+RUN = os.path.join(ROOT, "run.py")
+CLIENT = os.path.join(ROOT, "zygote.py")
+
+PROGRAMS = {
+    "one.trv": "output 1\n",
+    "error.trv": "output 'a'\nrepeat for i from 1 to 3\n\toutput i\noutput i * x\n",
+    "broken.trv": "output 1\n\toutput 2\nelse\noutput )\n",
+    "read.trv": "read a, b\noutput a + b\nread c\n",
+    "forever.trv": "x = 0\nrepeat until x < 0\n\tx = x + 1\n",
+}
+
+# Arguments each way of running is checked with, and the input given to it
+CASES = [
+    (["one.trv"], ""),
+    (["error.trv"], ""),
+    (["--engine", "typed", "error.trv"], ""),
+    (["--lexer", "fast", "--parser", "pratt", "broken.trv"], ""),
+    (["--check", "broken.trv"], ""),
+    (["read.trv"], "3\n4\n"),
+    (["read.trv"], "3\n4\n5\n"),
+    (["--no-such-option"], ""),
+    (["missing.trv"], ""),
+]
+
+
+def invoke(command, argv, input, directory, env, interrupt=None):
+    # Runs a command, giving its stdout, stderr and exit status
+    process = subprocess.Popen(
+        command + argv,
+        cwd=directory,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if interrupt is not None:
+        time.sleep(interrupt)
+        process.send_signal(signal.SIGINT)
+    stdout, stderr = process.communicate(input.encode())
+    return stdout.decode(), stderr.decode(), process.returncode
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--runs", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    for name, source in PROGRAMS.items():
+        with open(os.path.join(directory, name), "w") as file:
+            file.write(source)
+    cases = CASES + [([path], "") for path in sorted(glob.glob(f"{ROOT}/examples/*"))]
+    path = os.path.join(directory, "zygote.sock")
+    env = dict(os.environ, TRAVERSAL_ZYGOTE=path)
+    direct = [sys.executable, RUN]
+    client = [sys.executable, CLIENT]
+    problems = []
+
+    zygote = subprocess.Popen(
+        direct + ["--zygote", "--unix", path], stdout=subprocess.PIPE, text=True
+    )
+    try:
+        zygote.stdout.readline()  # Ready
+
+        mismatches = 0
+        checks = [(argv, input, None) for argv, input in cases]
+        checks.append((["forever.trv"], "", 1.0))
+        for argv, input, interrupt in checks:
+            expected = invoke(direct, argv, input, directory, env, interrupt)
+            actual = invoke(client, argv, input, directory, env, interrupt)
+            if interrupt is not None:
+                # Whether the line is reported depends on exactly where Ctrl-C lands
+                expected, actual = expected[1:], actual[1:]
+            if expected != actual:
+                mismatches += 1
+                print(f"Mismatch on {' '.join(argv)}:")
+                print(f"  run.py:    {expected!r}\n  zygote.py: {actual!r}")
+        print(f"Compared {len(checks)} runs: {mismatches} mismatches")
+        if mismatches:
+            problems.append("results differ")
+
+        # A client that connects but never sends its request mustn't hold up others
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+            idle.connect(path)
+            try:
+                result = subprocess.run(
+                    client + ["one.trv"],
+                    cwd=directory,
+                    env=env,
+                    capture_output=True,
+                    timeout=10,
+                )
+                print(f"With an idle client connected: exit status {result.returncode}")
+                if result.returncode != 0:
+                    problems.append("a run failed with an idle client connected")
+            except subprocess.TimeoutExpired:
+                print("With an idle client connected: timed out")
+                problems.append("an idle client held up the zygote")
+
+        for name, command in (("run.py", direct), ("zygote.py", client)):
+            start_time = time.perf_counter()
+            for _ in range(args.runs):
+                invoke(command, ["one.trv"], "", directory, env)
+            elapsed = (time.perf_counter() - start_time) / args.runs
+            print(f"{name}: {elapsed * 1000:.1f} ms per run of one.trv")
+
+        # Without starting Python for the client, e.g. from a long-running tool
+        with open(os.devnull, "r+") as null:
+            fds = (null.fileno(),) * 3
+            os.chdir(directory)
+            start_time = time.perf_counter()
+            for _ in range(args.runs):
+                run_remote(["one.trv"], path, fds)
+            elapsed = (time.perf_counter() - start_time) / args.runs
+        print(f"run_remote(): {elapsed * 1000:.1f} ms per run of one.trv")
+    finally:
+        zygote.terminate()
+        zygote.wait()
+
+    if os.path.exists(path):
+        problems.append("the zygote didn't remove its socket")
+    for problem in problems:
+        print(f"Problem: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import builtins
+import hashlib
+import json
+import os
+import sys
+
+import ast_nodes
+from lexer import NONDETERMINISTIC
+
+# Modules whose code decides what a program prints, so changing any of them changes
+# the key of every program
+INTERPRETER_MODULES = (
+    "ast_nodes",
+    "lexer",
+    "parser",
+    "run",
+    "procedures",
+    "source",
+    "compiler",
+    "jit",
+    "flat",
+    "stack",
+    "parallel",
+)
+
+# Errors which depend on the engine a program runs on or the resources it has rather
+# than only on the program (e.g. the interpreter's recursion limit, which the stack
+# engine doesn't have), so results they stop are never kept
+RESOURCE_ERRORS = (RecursionError, MemoryError)
+
+_version = None
+
+
+def interpreter_version():
+    """
+    Returns:
+        (string): Hash of the interpreter's code and the Python version running it,
+            which changes whenever either could change what a program prints.
+    """
+    global _version
+    if _version is None:
+        digest = hashlib.sha256(sys.version.encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in INTERPRETER_MODULES:
+            with open(os.path.join(directory, name + ".py"), "rb") as file:
+                digest.update(file.read())
+        _version = digest.hexdigest()
+    return _version
+
+
+def deterministic(input, lexer):
+    """
+    Finds whether a program always prints the same thing, i.e. whether it uses none
+    of the lexer.NONDETERMINISTIC features.
+
+    Args:
+        input (list): Array containing each line of code input.
+        lexer: Lexer to lex the program with.
+
+    Returns:
+        (bool): True if the program is deterministic. False if it isn't, or if it
+            can't be lexed, as then it can't be told.
+    """
+    try:
+        for line in input:
+            for token in lexer.lex(line):
+                if token.gettokentype() in NONDETERMINISTIC:
+                    return False
+    except Exception:
+        return False
+    return True
+
+
+def program_key(input):
+    """
+    Args:
+        input (list): Array containing each line of code input.
+
+    Returns:
+        (string): Hash of a program's source, the interpreter's version and the
+            settings which change what programs print.
+    """
+    digest = hashlib.sha256(interpreter_version().encode())
+    digest.update(f"\0{ast_nodes.MAX_POWER_DIGITS}\0".encode())
+    for line in input:
+        digest.update(line.encode())
+    return digest.hexdigest()
+
+
+def rebuild_error(error):
+    """
+    Args:
+        error (dict): Type, message and line number of an error, as stored.
+
+    Returns:
+        (Exception): An error of the same type with the same message.
+    """
+    kind = getattr(builtins, error["type"], None)
+    if not (isinstance(kind, type) and issubclass(kind, Exception)):
+        kind = RuntimeError
+    return kind(error["message"])
+
+
+class _Tee:
+    # Output stream printing to another stream while keeping a copy of everything
+    def __init__(self, output):
+        self.output = output
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        return self.output.write(text)
+
+    def flush(self):
+        self.output.flush()
+
+
+class OutputCache:
+    """
+    Results of programs (everything they printed, and the error that stopped them, if
+    any) kept in a directory, keyed by program_key(), so running the same program again
+    gives them straight back. Once the results take more than max_bytes, the least
+    recently used are removed. Any number of processes can share a directory.
+
+    Programs using lexer.NONDETERMINISTIC features, and programs stopped by errors
+    which aren't Python's built-in exceptions or are RESOURCE_ERRORS, are always run
+    and never kept.
+
+    Args:
+        directory (string): Directory to keep results in. Made if it doesn't exist.
+        max_bytes (int): Most bytes of results to keep.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """
+        Returns:
+            (dict): The "output" and "error" kept for a key, or None if there
+                aren't any.
+        """
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                result = json.load(file)
+            os.utime(path)  # Most recently used
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key, result):
+        """
+        Keeps a result, then removes the least recently used results until they all
+        fit in max_bytes.
+
+        Args:
+            key (string): As program_key() returns.
+            result (dict): What the program printed ("output"), and the error that
+                stopped it ("error"), as {"type", "message", "line"} or None.
+        """
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(result, file)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # Removed by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def run(self, session, input):
+        """
+        Runs a program on a session, or prints its result if it's been kept, exactly
+        as session.run() would, including raising the same error and setting
+        session.error_lineno.
+
+        Args:
+            session (run.Session): Session to run the program on.
+            input (list): Array containing each line of code input.
+        """
+        if not deterministic(input, session.lexer):
+            return session.run(input)
+
+        key = program_key(input)
+        output = session.state.output
+        stream = output if output is not None else sys.stdout
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            stream.write(result["output"])
+            error = result["error"]
+            if error is not None:
+                session.error_lineno = error["line"]
+                raise rebuild_error(error)
+            return
+
+        self.misses += 1
+        tee = _Tee(stream)
+        session.state.output = tee
+        try:
+            session.run(input)
+        except Exception as err:
+            if type(err) is getattr(
+                builtins, type(err).__name__, None
+            ) and not isinstance(err, RESOURCE_ERRORS):
+                error = {
+                    "type": type(err).__name__,
+                    "message": str(err),
+                    "line": session.error_lineno,
+                }
+                self.put(key, {"output": "".join(tee.parts), "error": error})
+            raise
+        finally:
+            session.state.output = output
+        self.put(key, {"output": "".join(tee.parts), "error": None})
@@ -0,0 +1,194 @@
+from rply import Token
+from rply.errors import LexingError
+
+from ast_nodes import ParserState
+from lexer import TokenStream
+from parser import SyntaxParser, return_value, unexpected
+from run import ELSE_FOLLOW_UP_ERROR, check_definition
+
+# Statements followed by an indented block
+BLOCK_STATEMENTS = (
+    "REPEAT",
+    "REPEATUNTIL",
+    "REPEATFOR",
+    "IF",
+    "ELSEIF",
+    "ELSE",
+    "PROCEDURE",
+)
+
+ELSE_WITHOUT_IF_ERROR = "You can only use 'else if' or 'else' after an 'if' statement"
+
+
+def raised(function, *args):
+    # The error a function raises, so errors are worded just as the interpreter's are
+    try:
+        function(*args)
+    except Exception as error:
+        return error
+
+
+class Checker:
+    """
+    Checks a program's syntax and structure without running any of it. Every line is
+    lexed and parsed once, and the blocks of loops, conditionals and procedures are
+    found just as run.Session.parse() finds them, so every error is reported, with its
+    line number, rather than only the first one the program reaches.
+
+    Errors are worded as the interpreter words them. Errors which depend on values
+    (e.g. variables which aren't defined yet, or an 'if' followed by a number) are only
+    found by running the program. An 'else if' or 'else' which doesn't follow an 'if'
+    is reported, although the interpreter only fails on any block after it.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. Only the lexer is used.
+    """
+
+    def __init__(self, grammar):
+        self.lexer = grammar.lexer
+        self.syntax = SyntaxParser()
+
+    def check(self, input, start_lineno=1):
+        """
+        Checks a program.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+
+        Returns:
+            (list): (line number, exception) of every error found, in line order.
+        """
+        self.start_lineno = start_lineno
+        self.lines = [self.line(line) for line in input]
+        self.errors = []
+        idx = 0
+        while idx < len(self.lines):
+            idx = self.statement(idx, len(self.lines), 0, False)
+        return self.errors
+
+    def line(self, line):
+        """
+        Lexes and parses a line, once its indents are removed.
+
+        Returns:
+            (tuple): The line's indent level as run.find_indent_level() finds it
+                (which is None for a line with only one token after its indents, e.g.
+                a comment), its number of indents, the type of its first token after
+                the indents, the name and parameters of a procedure it defines, and
+                the error raised parsing it, if any.
+        """
+        tokens = []
+        error = None
+        try:
+            for token in self.lexer.lex(line):
+                tokens.append(token)
+        except LexingError as err:
+            error = err
+
+        indent = 0
+        while indent < len(tokens) and tokens[indent].gettokentype() == "INDENT":
+            indent += 1
+        indent_level = indent if len(tokens) - indent > 1 else None
+        if indent == len(tokens):
+            return None, indent, None, None, None, self.lexing_error(line, error)
+
+        kind = tokens[indent].gettokentype()
+        name = parameters = None
+        try:
+            parsed = self.syntax.parse(TokenStream(tokens[indent:], error))
+        except LexingError as err:
+            error = self.lexing_error(line, err)
+        except Exception as err:
+            error = err
+        else:
+            error = None
+            # Only a procedure's name and parameters are kept, not expressions
+            if kind == "PROCEDURE":
+                name, parameters = parsed[1:]
+        return indent_level, indent, kind, name, parameters, error
+
+    def lexing_error(self, line, error):
+        if error is None:
+            return None
+        return SyntaxError(f"Unexpected character {line[error.source_pos.idx]!r}")
+
+    def statement(self, idx, end, depth, in_procedure, chained=False):
+        """
+        Checks a statement, and the block after it if it has one.
+
+        Args:
+            idx (int): Index of the statement's line.
+            end (int): Index after the last line of the block the statement is in.
+            depth (int): Number of blocks the statement is nested in.
+            in_procedure (bool): Whether the statement is in a procedure's block.
+            chained (bool): Whether the statement is an 'else if' or 'else' following
+                an 'if'.
+
+        Returns:
+            (int): Index of the line after the statement and its block.
+        """
+        _, indent, kind, name, parameters, error = self.lines[idx]
+        lineno = self.start_lineno + idx
+
+        # Lines indented more than the block they're in start with an INDENT token
+        if indent > depth:
+            self.errors.append((lineno, raised(unexpected, Token("INDENT", "\t"))))
+            return idx + 1
+
+        if error is not None:
+            self.errors.append((lineno, error))
+        elif kind == "RETURN" and not in_procedure:
+            self.errors.append((lineno, raised(return_value, ParserState(), None)))
+        elif kind == "PROCEDURE":
+            error = raised(check_definition, name, parameters, in_procedure)
+            if error is not None:
+                self.errors.append((lineno, error))
+        if (kind == "ELSEIF" or kind == "ELSE") and not chained:
+            # The interpreter runs these as statements of their own, with no block
+            self.errors.append((lineno, SyntaxError(ELSE_WITHOUT_IF_ERROR)))
+            return idx + 1
+        if kind not in BLOCK_STATEMENTS:
+            return idx + 1
+
+        block_end = self.block_end(idx + 1, end, depth)
+        inner = idx + 1
+        while inner < block_end:
+            inner = self.statement(
+                inner, block_end, depth + 1, in_procedure or kind == "PROCEDURE"
+            )
+        if kind == "IF":
+            return self.if_chain(block_end, end, depth, in_procedure)
+        return block_end
+
+    def if_chain(self, idx, end, depth, in_procedure):
+        # Checks any 'else if' and 'else' statements after an 'if' and its block,
+        # returning the index of the line after them
+        while idx < end and self.kind_at(idx, depth) == "ELSEIF":
+            idx = self.statement(idx, end, depth, in_procedure, chained=True)
+        if idx < end and self.kind_at(idx, depth) == "ELSE":
+            idx = self.statement(idx, end, depth, in_procedure, chained=True)
+            if idx < end and self.kind_at(idx, depth) in ("ELSEIF", "ELSE"):
+                lineno = self.start_lineno + idx
+                self.errors.append((lineno, SyntaxError(ELSE_FOLLOW_UP_ERROR)))
+                idx = self.statement(idx, end, depth, in_procedure, chained=True)
+        return idx
+
+    def kind_at(self, idx, depth):
+        # Type of the first token of a line in a block nested depth blocks deep
+        indent, kind = self.lines[idx][1:3]
+        return kind if indent == depth else None
+
+    def block_end(self, idx, end, depth):
+        # Index after the last line of the block starting at idx, found just as
+        # run.Session.get_indent_block() finds it
+        previous_indent_level = depth
+        while idx < end:
+            indent_level = self.lines[idx][0]
+            if indent_level is None:
+                indent_level = previous_indent_level
+            if indent_level <= depth:
+                break
+            previous_indent_level = indent_level
+            idx += 1
+        return idx
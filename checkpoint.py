@@ -0,0 +1,437 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+from ast_nodes import Condition, Decimal, Integer, Text
+from procedures import Procedure
+from run import Session, find_indent_level
+from copy import copy
+
+# Checkpoint files start with MAGIC and then the version of the format they use, which
+# is increased whenever the format changes so older checkpoints are refused cleanly
+MAGIC = b"TRVCKPT"
+VERSION = 4
+
+# Tag each type of value is saved with
+VALUE_TAGS = {Integer: "i", Decimal: "d", Text: "t", Condition: "c"}
+VALUE_TYPES = {tag: kind for kind, tag in VALUE_TAGS.items()}
+
+
+def _encode(value):
+    # Integers are saved in hexadecimal, as JSON can't hold all of them in decimal
+    if type(value) is Integer:
+        return format(value.value, "x")
+    return value.value
+
+
+def _decode(tag, value):
+    if tag == "i":
+        return Integer(int(value, 16))
+    return VALUE_TYPES[tag](value)
+
+
+def source_hash(input):
+    """
+    Returns:
+        (string): SHA-256 of a program's lines, so a checkpoint is only resumed with the
+            program it was saved from.
+    """
+    digest = hashlib.sha256()
+    for line in input:
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """
+    Everything needed to carry on running a program from the start of a statement.
+
+    Args:
+        program (string): Path of the program's file, if it came from one.
+        source_hash (string): As source_hash() returns for the program.
+        variables (dict): The program's variables, as ast_nodes values.
+        frames (list): One list for each loop or 'if' statement the statement is
+            inside, outermost first: ["repeat", line number, number of times to
+            repeat, iterations finished], ["until", line number, iterations finished],
+            ["for", line number, the counter's name, the start, stop and step of the
+            range it counts through (in hexadecimal), iterations finished] or ["if",
+            line number, line number of the branch taken].
+        lineno (int): Line number of the statement to run next.
+        procedures (list): [name, parameters, line number of the block's first line,
+            lines of the block] for each procedure the program has defined.
+        input_position (int): Number of values the program has read.
+    """
+
+    def __init__(
+        self,
+        program,
+        source_hash,
+        variables,
+        frames,
+        lineno,
+        procedures,
+        input_position,
+    ):
+        self.program = program
+        self.source_hash = source_hash
+        self.variables = variables
+        self.frames = frames
+        self.lineno = lineno
+        self.procedures = procedures
+        self.input_position = input_position
+
+    def dumps(self):
+        """
+        Returns:
+            (bytes): The checkpoint: MAGIC, the version, then zlib-compressed JSON.
+        """
+        data = {
+            "program": self.program,
+            "source_hash": self.source_hash,
+            "variables": [
+                [name, VALUE_TAGS[type(value)], _encode(value)]
+                for name, value in self.variables.items()
+            ],
+            "frames": self.frames,
+            "lineno": self.lineno,
+            "procedures": self.procedures,
+            "input_position": self.input_position,
+        }
+        text = json.dumps(data, separators=(",", ":"))
+        return MAGIC + bytes([VERSION]) + zlib.compress(text.encode("utf-8"), 9)
+
+    @classmethod
+    def loads(cls, data):
+        """
+        Args:
+            data (bytes): As dumps() returns.
+
+        Returns:
+            (Checkpoint): The checkpoint.
+        """
+        if not data.startswith(MAGIC):
+            raise ValueError("This isn't a Traversal checkpoint")
+        version = data[len(MAGIC)]
+        if version != VERSION:
+            raise ValueError(
+                f"This checkpoint uses version {version} of the format, but only "
+                f"version {VERSION} can be resumed"
+            )
+        data = json.loads(zlib.decompress(data[len(MAGIC) + 1 :]).decode("utf-8"))
+        variables = {
+            name: _decode(tag, value) for name, tag, value in data["variables"]
+        }
+        return cls(
+            data["program"],
+            data["source_hash"],
+            variables,
+            data["frames"],
+            data["lineno"],
+            data["procedures"],
+            data["input_position"],
+        )
+
+    def save(self, path):
+        # Written to a temporary file first, so a crash never leaves half a checkpoint
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(self.dumps())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls.loads(file.read())
+
+
+class Stopped(Exception):
+    """
+    Raised once a checkpoint has been saved because the program was asked to stop.
+    """
+
+
+class CheckpointSession(Session):
+    """
+    Runs a program exactly as Session does, but can save a checkpoint at the start of
+    any statement and carry on from one later.
+
+    A checkpoint is saved at the start of the next statement after checkpoint() or
+    stop() is called (e.g. from a signal handler), and every so often if every is
+    given. The session keeps track of the loops and 'if' statements it is inside, so
+    resuming jumps straight to the statement without re-running anything before it.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        path (string): File checkpoints are saved to, or None to never save any.
+        every (float): Seconds between checkpoints, or None to only save them when
+            asked to.
+        program (string): Path of the program's file, saved in checkpoints.
+    """
+
+    def __init__(self, grammar=None, output=None, path=None, every=None, program=None):
+        super().__init__(grammar, output)
+        self.path = path
+        self.every = every
+        self.program = program
+        self.source_hash = None
+        self.frames = []  # Loops and 'if' statements being run, as in Checkpoint
+        self.pending = False  # Whether to save a checkpoint at the next statement
+        self.stopping = False  # Whether to stop once it's saved
+        self.resume_frames = None  # Frames still to be resumed into
+        self.resume_lineno = None
+        self.resumed_branch = None  # Line number of the branch to take when resuming
+
+    def checkpoint(self):
+        self.pending = True
+
+    def stop(self):
+        self.pending = True
+        self.stopping = True
+
+    def run(self, input, start_lineno=1):
+        """
+        Runs a program from the start.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+        """
+        self.source_hash = source_hash(input)
+        self._run(input, start_lineno)
+
+    def resume(self, input, checkpoint, start_lineno=1):
+        """
+        Carries on running a program from a checkpoint. Values the program had read
+        are skipped, so it has to be given the same input.
+
+        Args:
+            input (list): Array containing each line of code input.
+            checkpoint (Checkpoint): Checkpoint saved while running the same program.
+            start_lineno (int): Line number of the first line.
+        """
+        self.source_hash = source_hash(input)
+        if checkpoint.source_hash != self.source_hash:
+            raise ValueError("The program has changed since this checkpoint was saved")
+        self.state.variables.update(checkpoint.variables)
+        for name, parameters, block_lineno, block in checkpoint.procedures:
+            self.state.procedures[name] = Procedure(
+                name, parameters, block, block_lineno, self, self.state.procedures
+            )
+        self.resume_frames = [list(frame) for frame in checkpoint.frames]
+        self.resume_lineno = checkpoint.lineno
+        self.state.input.skip(checkpoint.input_position)
+        self._run(input, start_lineno)
+
+    def _run(self, input, start_lineno):
+        timer = None
+        if self.path is not None and self.every is not None:
+            timer = threading.Event()
+
+            def tick():
+                while not timer.wait(self.every):
+                    self.pending = True
+
+            threading.Thread(target=tick, daemon=True).start()
+        try:
+            self.parse(input, start_lineno, self.state)
+        finally:
+            if timer is not None:
+                timer.set()
+
+    def save(self, lineno):
+        """
+        Saves a checkpoint for the start of a statement, stopping the program
+        afterwards if it was asked to.
+
+        Args:
+            lineno (int): Line number of the statement about to run.
+        """
+        self.pending = False
+        if self.path is not None:
+            Checkpoint(
+                self.program,
+                self.source_hash,
+                dict(self.state.variables),
+                [list(frame) for frame in self.frames],
+                lineno,
+                [
+                    [
+                        procedure.name,
+                        procedure.parameters,
+                        procedure.start_lineno,
+                        procedure.lines,
+                    ]
+                    for procedure in self.state.procedures.values()
+                ],
+                self.state.input.position,
+            ).save(self.path)
+        if self.stopping:
+            raise Stopped(f"Stopped on line {lineno}")
+
+    def resume_target(self):
+        # Line number to resume from in the block about to be parsed, and the frame of
+        # the statement there if the program stopped inside it
+        depth = len(self.frames)
+        if depth < len(self.resume_frames):
+            frame = self.resume_frames[depth]
+            return frame[1], frame
+        lineno = self.resume_lineno
+        self.resume_frames = None
+        return lineno, None
+
+    # The loops and 'if' statements being run are kept track of by adding their frames
+    # as they start, and taking them off once they've run
+
+    def repeat(
+        self,
+        repeat_count,
+        repeat_indent_level,
+        input,
+        start_lineno,
+        state,
+        resumed=None,
+    ):
+        self.frames.append(["repeat", start_lineno - 1, repeat_count, 0])
+        lines_skipped = super().repeat(
+            repeat_count, repeat_indent_level, input, start_lineno, state, resumed
+        )
+        self.frames.pop()
+        return lines_skipped
+
+    def repeatuntil(
+        self,
+        repeatuntil_condition,
+        repeat_indent_level,
+        input,
+        start_lineno,
+        state,
+        resumed=None,
+    ):
+        self.frames.append(["until", start_lineno - 1, 0])
+        lines_skipped = super().repeatuntil(
+            repeatuntil_condition,
+            repeat_indent_level,
+            input,
+            start_lineno,
+            state,
+            resumed,
+        )
+        self.frames.pop()
+        return lines_skipped
+
+    def repeatfor(
+        self,
+        name,
+        counts,
+        repeat_indent_level,
+        input,
+        start_lineno,
+        state,
+        resumed=None,
+    ):
+        bounds = (counts.start, counts.stop, counts.step)
+        frame = ["for", start_lineno - 1, name]
+        frame += [format(value, "x") for value in bounds] + [0]
+        self.frames.append(frame)
+        lines_skipped = super().repeatfor(
+            name, counts, repeat_indent_level, input, start_lineno, state, resumed
+        )
+        self.frames.pop()
+        return lines_skipped
+
+    def if_elseif_else(self, if_condition, if_indent_level, input, start_lineno, state):
+        # branch() adds the frame of the branch taken, if any
+        depth = len(self.frames)
+        lines_skipped = super().if_elseif_else(
+            if_condition, if_indent_level, input, start_lineno, state
+        )
+        del self.frames[depth:]
+        return lines_skipped
+
+    def before_iteration(self, lineno, number, state):
+        self.frames[-1][-1] = number - 1
+
+    def branch(self, lineno, taken, state):
+        self.resumed_branch = None
+        if taken is not None:
+            self.frames.append(["if", lineno, taken])
+
+    def evaluate_condition(self, tokens, lineno, line, state):
+        # Resuming inside an 'if' statement picks the branch it had taken again,
+        # without evaluating any conditions
+        if self.resumed_branch is not None:
+            return Condition(lineno == self.resumed_branch)
+        return super().evaluate_condition(tokens, lineno, line, state)
+
+    def call_procedure(self, procedure, state):
+        # A 'return' leaves the loops and 'if' statements it's inside without taking
+        # their frames off
+        depth = len(self.frames)
+        try:
+            return super().call_procedure(procedure, state)
+        finally:
+            del self.frames[depth:]
+
+    def begin(self, lineno, line, state):
+        # Checkpoints are only saved between the program's own statements, not
+        # inside procedure calls
+        if self.pending and state is self.state:
+            self.save(lineno)
+
+    def parse(self, input, start_lineno, state):
+        if self.resume_frames is None:
+            return super().parse(input, start_lineno, state)
+
+        lineno, resuming = self.resume_target()
+        first = lineno - start_lineno
+        if resuming is not None:
+            # The statement the checkpoint was saved inside, whose line has already
+            # been run
+            indent_level = find_indent_level(copy(self.lexer.lex(input[first])))
+            first += 1 + self.resume_statement(
+                resuming, indent_level, input, first, lineno, state
+            )
+        super().parse(input[first:], start_lineno + first, state)
+
+    def resume_statement(self, frame, indent_level, input, idx, lineno, state):
+        # Carries on running the loop or 'if' statement on a line from the frame it
+        # was saved with, returning the number of lines within its blocks
+        if frame[0] == "repeat":
+            return self.repeat(
+                frame[2],
+                indent_level,
+                input[idx + 1 :],
+                lineno + 1,
+                state,
+                resumed=frame[3] + 1,
+            )
+        if frame[0] == "until":
+            # The iteration resumed runs before the condition is evaluated again
+            return self.repeatuntil(
+                Condition(False),
+                indent_level,
+                input[idx:],
+                lineno + 1,
+                state,
+                resumed=frame[2] + 1,
+            )
+        if frame[0] == "for":
+            # The counter was saved with the program's variables, and may have been
+            # assigned to since the iteration started
+            counts = range(*(int(value, 16) for value in frame[3:6]))
+            return self.repeatfor(
+                frame[2],
+                counts,
+                indent_level,
+                input[idx + 1 :],
+                lineno + 1,
+                state,
+                resumed=frame[6] + 1,
+            )
+        self.resumed_branch = frame[2]
+        return self.if_elseif_else(
+            Condition(frame[2] == lineno), indent_level, input[idx:], lineno + 1, state
+        )
@@ -0,0 +1,259 @@
+import io
+import os
+import sys
+import time
+
+from reader import InputReader
+from run import ENGINES, Grammar, Session, engine_factory
+
+
+def configurations(jit_threshold=100, workers=None, lexer="rply", parser="rply"):
+    """
+    Gives every way of running a program compared by Comparison: the reference
+    interpreter (with RPly's lexer and parser), each of the ENGINES, and the
+    interpreter with the other lexer and parser backends and with --parallel.
+
+    Args:
+        jit_threshold (int): Iterations a loop runs before the jit engine compiles it.
+        workers (int): Most worker processes for the parallel run.
+        lexer (string): Lexer backend the engines use.
+        parser (string): Parser backend the engines use.
+
+    Returns:
+        (list): (name, grammar, function making a session given the grammar and the
+            output stream) of each, starting with the reference interpreter.
+    """
+    from parallel import ParallelSession
+
+    reference = Grammar()
+    grammar = reference
+    if (lexer, parser) != ("rply", "rply"):
+        grammar = Grammar(lexer_backend=lexer, parser_backend=parser)
+    fast = Grammar(lexer_backend="fast", parser_backend="pratt")
+
+    def parallel(grammar, output=None):
+        return ParallelSession(grammar, output, workers=workers)
+
+    result = [("interpreter", reference, Session)]
+    for name in ENGINES:
+        if name != "interpreter" or grammar is not reference:
+            suffix = "" if grammar is reference else f" ({lexer}, {parser})"
+            result.append((name + suffix, grammar, engine_factory(name, jit_threshold)))
+    if grammar is reference:
+        result.append(("interpreter (fast, pratt)", fast, Session))
+    result.append(("parallel", grammar, parallel))
+    return result
+
+
+class Outcome:
+    """
+    What one run of a program printed, the error which stopped it (if any) and how
+    long it took.
+    """
+
+    def __init__(self, output, error, error_lineno, time):
+        self.output = output
+        self.error = error  # (type name, message), or None
+        self.error_lineno = error_lineno
+        self.time = time
+
+    def difference(self, reference):
+        """
+        Describes how the run differs from the reference run.
+
+        Args:
+            reference (Outcome): The reference interpreter's run.
+
+        Returns:
+            (string): The first difference, or None if the runs are identical.
+        """
+        if self.output != reference.output:
+            lines = self.output.splitlines()
+            expected = reference.output.splitlines()
+            for lineno, (line, expected_line) in enumerate(zip(lines, expected), 1):
+                if line != expected_line:
+                    return (
+                        f"output line {lineno} is {line!r}, not {expected_line!r}"
+                    )
+            if len(lines) != len(expected):
+                return f"printed {len(lines)} lines, not {len(expected)}"
+            return "output differs in its line endings"
+        if (self.error, self.error_lineno) != (reference.error, reference.error_lineno):
+            return (
+                f"stopped with {self.describe_error()}, not "
+                f"{reference.describe_error()}"
+            )
+        return None
+
+    def describe_error(self):
+        if self.error is None:
+            return "no error"
+        name, message = self.error
+        return f"{name}: {message} (line {self.error_lineno})"
+
+
+class Comparison:
+    """
+    Runs a program every way given by configurations(), checking each prints exactly
+    what the reference interpreter prints and stops with the same error, worded the
+    same way and on the same line.
+
+    Args:
+        input (list): Array containing each line of code input.
+        name (string): Name of the program, e.g. its file name.
+        configurations (list): As given by configurations().
+        data (string): Input the program reads values from, given to every run.
+    """
+
+    def __init__(self, input, name, configurations, data=""):
+        self.input = input
+        self.name = name
+        self.configurations = configurations
+        self.data = data
+        self.outcomes = []  # (name, Outcome) of each run, in order
+
+    def run(self):
+        """
+        Runs the program every way.
+
+        Returns:
+            (bool): Whether every run was identical to the reference run.
+        """
+        self.outcomes = []
+        for name, grammar, engine in self.configurations:
+            output = io.StringIO()
+            session = engine(grammar, output)
+            session.state.input = InputReader(io.StringIO(self.data))
+            error = None
+            start_time = time.perf_counter()
+            try:
+                session.run(self.input)
+            except Exception as err:
+                error = (type(err).__name__, str(err))
+            elapsed = time.perf_counter() - start_time
+            outcome = Outcome(output.getvalue(), error, session.error_lineno, elapsed)
+            self.outcomes.append((name, outcome))
+        return not self.differences
+
+    @property
+    def reference(self):
+        return self.outcomes[0][1]
+
+    @property
+    def differences(self):
+        # (name, difference) of each run which isn't identical to the reference run
+        result = []
+        for name, outcome in self.outcomes[1:]:
+            difference = outcome.difference(self.reference)
+            if difference is not None:
+                result.append((name, difference))
+        return result
+
+    def report(self, file=None):
+        """
+        Prints how long each run took, and how any run differed.
+
+        Args:
+            file (file): Stream to print to. Defaults to sys.stdout.
+        """
+        file = file if file is not None else sys.stdout
+        differences = dict(self.differences)
+        width = max(len(name) for name, _ in self.outcomes)
+        print(self.name, file=file)
+        for idx, (name, outcome) in enumerate(self.outcomes):
+            if idx == 0:
+                result = "reference"
+            elif name in differences:
+                result = f"DIFFERS: {differences[name]}"
+            else:
+                result = f"same, {self.speedup(outcome)}"
+            print(
+                f"  {name:<{width}}  {outcome.time * 1000:10.3f} ms  {result}",
+                file=file,
+            )
+        print(f"  Reference stopped with {self.reference.describe_error()}", file=file)
+
+    def speedup(self, outcome):
+        if outcome.time == 0:
+            return "too fast to time"
+        return f"{self.reference.time / outcome.time:.2f}x as fast"
+
+
+def programs(directory):
+    # Every program in a directory and the directories in it, in order
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith(".trv"):
+                yield os.path.join(root, filename)
+
+
+def reads_input(paths, lexer):
+    """
+    Finds whether any of some programs reads values, so input is only read for
+    programs which use it. Lines which can't be lexed are skipped, as a program stops
+    before running them.
+
+    Args:
+        paths (list): Path of each program.
+        lexer: Lexer to lex the programs with.
+
+    Returns:
+        (bool): True if any program has a 'read' (or 'input') statement.
+    """
+    for path in paths:
+        try:
+            with open(path, "r") as user_input:
+                for line in user_input:
+                    try:
+                        for token in lexer.lex(line):
+                            if token.gettokentype() == "READ":
+                                return True
+                    except Exception:
+                        continue
+        except OSError:
+            continue  # Reported when the program is run
+    return False
+
+
+def compare_directory(directory, configurations, data="", file=None):
+    """
+    Compares the runs of every program in a directory, printing a line for each and
+    a summary of the total time taken each way and of every difference.
+
+    Args:
+        directory (string): Path of the directory.
+        configurations (list): As given by configurations().
+        data (string): Input every program reads values from.
+        file (file): Stream to print to. Defaults to sys.stdout.
+
+    Returns:
+        (bool): Whether every program ran identically every way.
+    """
+    file = file if file is not None else sys.stdout
+    totals = {name: 0.0 for name, _, _ in configurations}
+    diverged = []
+    count = 0
+    for path in programs(directory):
+        count += 1
+        with open(path, "r") as user_input:
+            input = user_input.readlines()
+        comparison = Comparison(input, path, configurations, data)
+        same = comparison.run()
+        for name, outcome in comparison.outcomes:
+            totals[name] += outcome.time
+        if same:
+            print(f"same     {path}", file=file)
+        else:
+            names = ", ".join(name for name, _ in comparison.differences)
+            print(f"DIFFERS  {path} ({names})", file=file)
+            diverged.append(comparison)
+
+    width = max(len(name) for name in totals)
+    print(f"\n{count} programs, {len(diverged)} with differences", file=file)
+    for name, total in totals.items():
+        print(f"  {name:<{width}}  {total * 1000:10.3f} ms in total", file=file)
+    for comparison in diverged:
+        print(file=file)
+        comparison.report(file)
+    return not diverged
@@ -0,0 +1,1161 @@
+from ast_nodes import *
+from parser import (
+    SyntaxParser,
+    if_elseif_condition,
+    repeat_count,
+    repeat_until_condition,
+    variable,
+)
+from run import (
+    ELSE_FOLLOW_UP_ERROR,
+    Session,
+    block_ends,
+    dedent_line,
+)
+from itertools import chain, islice
+from rply.errors import LexingError
+
+# A value of each type, for working out what an operation on values of those types
+# gives (or which error it raises) by running it
+SAMPLES = {
+    Integer: Integer(1),
+    Decimal: Decimal(1.5),
+    Text: Text("a"),
+    Condition: Condition(True),
+}
+
+# Unchecked Python for operations whose operand types have been proven, as a template
+# taking the unboxed operands, and the type of the result. Each gives exactly what the
+# checked method in ast_nodes would have given for those types
+FAST_BINARY = {}
+for left in (Integer, Decimal):
+    for right in (Integer, Decimal):
+        number = Integer if left is Integer and right is Integer else Decimal
+        FAST_BINARY[Add, left, right] = ("({0} + {1})", number)
+        FAST_BINARY[Sub, left, right] = ("({0} - {1})", number)
+        FAST_BINARY[Mul, left, right] = ("({0} * {1})", number)
+        FAST_BINARY[Mod, left, right] = ("({0} % {1})", number)
+        FAST_BINARY[Div, left, right] = ("({0} / {1})", Decimal)
+        # Integer powers can be fractional, and decimal powers complex, before the
+        # result is converted
+        FAST_BINARY[Pow, left, right] = (
+            "int(power({0}, {1}))" if number is Integer else "float({0} ** {1})",
+            number,
+        )
+        for node, operator in (
+            (Equals, "=="),
+            (NotEquals, "!="),
+            (LessThanEquals, "<="),
+            (LessThan, "<"),
+            (GreaterThanEquals, ">="),
+            (GreaterThan, ">"),
+        ):
+            FAST_BINARY[node, left, right] = (f"({{0}} {operator} {{1}})", Condition)
+    FAST_BINARY[Add, left, Text] = ("(str({0}) + {1})", Text)
+    FAST_BINARY[Add, Text, left] = ("({0} + str({1}))", Text)
+FAST_BINARY[Add, Text, Text] = ("({0} + {1})", Text)
+FAST_BINARY[Add, Text, Condition] = ("({0} + ('true' if {1} else 'false'))", Text)
+FAST_BINARY[Mul, Integer, Text] = ("({0} * {1})", Text)
+FAST_BINARY[Mul, Text, Integer] = ("({0} * {1})", Text)
+for operand in (Text, Condition):
+    FAST_BINARY[Equals, operand, operand] = ("({0} == {1})", Condition)
+    FAST_BINARY[NotEquals, operand, operand] = ("({0} != {1})", Condition)
+FAST_BINARY[And, Condition, Condition] = ("({0} and {1})", Condition)
+FAST_BINARY[Or, Condition, Condition] = ("({0} or {1})", Condition)
+
+FAST_UNARY = {(Not, Condition): ("(not {0})", Condition)}
+for operand in (Integer, Decimal, Text):
+    FAST_UNARY[UnaryAdd, operand] = ("({0} * 1)", operand)
+    FAST_UNARY[UnarySub, operand] = ("({0} * -1)", operand)
+
+COMPARISONS = (
+    Equals,
+    NotEquals,
+    LessThanEquals,
+    LessThan,
+    GreaterThanEquals,
+    GreaterThan,
+)
+
+# Checked Python for every other operation, as a template taking the boxed operands
+CHECKED_BINARY = {
+    Add: "{0}.add({1})",
+    Sub: "{0}.sub({1})",
+    Mul: "{0}.mul({1})",
+    Div: "{0}.div({1})",
+    Pow: "{0}.pow({1})",
+    Mod: "{0}.mod({1})",
+    Equals: "{0}.equals({1})",
+    NotEquals: "NotEquals({0}, {1}).eval()",
+    LessThanEquals: "{0}.less_than_equals({1})",
+    LessThan: "{0}.less_than({1})",
+    GreaterThanEquals: "{0}.greater_than_equals({1})",
+    GreaterThan: "{0}.greater_than({1})",
+    And: "And({0}, _Deferred(lambda: {1})).eval()",
+    Or: "Or({0}, _Deferred(lambda: {1})).eval()",
+}
+
+CHECKED_UNARY = {
+    Not: "{0}.logical_not()",
+    UnaryAdd: "UnaryAdd({0}).eval()",
+    UnarySub: "UnarySub({0}).eval()",
+}
+
+
+class _Deferred:
+    # Operand which is only evaluated if the node asks for it, for 'and' and 'or'
+    __slots__ = ("eval",)
+
+    def __init__(self, function):
+        self.eval = function
+
+
+# Names available to generated code
+NAMESPACE = {
+    "Integer": Integer,
+    "Decimal": Decimal,
+    "Text": Text,
+    "Condition": Condition,
+    "NotEquals": NotEquals,
+    "Pow": Pow,
+    "And": And,
+    "Or": Or,
+    "UnaryAdd": UnaryAdd,
+    "UnarySub": UnarySub,
+    "_Deferred": _Deferred,
+    "power": power,
+    "power_mod": power_mod,
+    "variable": variable,
+    "Read": Read,
+    "if_elseif_condition": if_elseif_condition,
+    "repeat_until_condition": repeat_until_condition,
+    "repeat_count": repeat_count,
+}
+
+
+# Compiled statements
+class Statement:
+    """
+    A compiled statement. Its function is generated the second time it runs (see
+    CodeGenerator.function()).
+
+    Args:
+        lineno (int): Line number of the statement.
+        line (string): The statement's source line.
+        expr: The statement's expression, or None if the line has a syntax error
+            (in which case it's left to the interpreter, which will raise the error).
+    """
+
+    def __init__(self, lineno, line, expr=None):
+        self.lineno = lineno
+        self.line = line
+        self.expr = expr
+        self.function = None
+        self.walked = False  # Whether it has run without generating code
+
+    def execute(self, session, state):
+        self.call(session, state)
+
+    def call(self, session, state):
+        """
+        Runs the statement's function, reporting the line number of any error.
+
+        Args:
+            session (CompiledSession): Session running the program.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            Whatever the function returns.
+        """
+        try:
+            if self.function is None:
+                self.function = session.generator.function(self)
+            return self.function(state)
+        except:
+            session.error_at(self.lineno, state)
+            raise
+
+
+class OutputStatement(Statement):
+    pass
+
+
+class AssignStatement(Statement):
+    def __init__(self, lineno, line, name, expr):
+        super().__init__(lineno, line, expr)
+        self.name = name
+
+
+class ReadStatement(Statement):
+    """
+    A 'read' statement, which reads into the variables named. Values read can be of
+    any type, so the statement is run as the interpreter runs it.
+    """
+
+    def __init__(self, lineno, line, names):
+        super().__init__(lineno, line)
+        self.names = names
+
+    def execute(self, session, state):
+        try:
+            Read(self.names, state).eval()
+        except:
+            session.error_at(self.lineno, state)
+            raise
+
+
+class InterpretedStatement(Statement):
+    """
+    A line the compiler doesn't handle itself (a syntax error, or an 'else if' without
+    an 'if'), which is run on the interpreter's own parser instead.
+    """
+
+
+class RepeatStatement(Statement):
+    def __init__(self, lineno, line, expr, body):
+        super().__init__(lineno, line, expr)
+        self.body = body
+
+    def execute(self, session, state):
+        body = self.body
+        for _ in range(self.call(session, state)):
+            session.execute(body, state)
+
+
+class RepeatUntilStatement(Statement):
+    def __init__(self, lineno, line, expr, body):
+        super().__init__(lineno, line, expr)
+        self.body = body
+
+    def execute(self, session, state):
+        body = self.body
+        while not self.call(session, state):
+            session.execute(body, state)
+
+
+class Branch(Statement):
+    """
+    The 'if' or an 'else if' of an IfStatement, with the block run if it's taken.
+    """
+
+    def __init__(self, lineno, line, expr, body):
+        super().__init__(lineno, line, expr)
+        self.body = body
+
+
+class IfStatement:
+    """
+    An 'if' statement with any 'else if' and 'else' statements following it.
+
+    Args:
+        branches (list[Branch]): The 'if' followed by each 'else if'.
+        else_body (list): Block of the 'else' statement, or None if there isn't one.
+        follow_up_lineno (int): Line number of an 'else' or 'else if' illegally
+            following the 'else' statement, if there is one.
+    """
+
+    def __init__(self, branches, else_body, follow_up_lineno=None):
+        self.branches = branches
+        self.else_body = else_body
+        self.follow_up_lineno = follow_up_lineno
+        self.lineno = branches[0].lineno
+
+    def execute(self, session, state):
+        branches = self.branches
+        taken = branches[0].call(session, state)
+        if self.follow_up_lineno is not None:
+            session.error_at(self.follow_up_lineno, state)
+            raise SyntaxError(ELSE_FOLLOW_UP_ERROR)
+
+        if taken:
+            session.execute(branches[0].body, state)
+            return
+        for branch in branches[1:]:
+            if branch.call(session, state):
+                session.execute(branch.body, state)
+                return
+        if self.else_body is not None:
+            session.execute(self.else_body, state)
+
+
+def walk_statements(statements):
+    # Every statement in a block, including those in nested blocks
+    for statement in statements:
+        yield statement
+        if type(statement) is IfStatement:
+            for branch in statement.branches:
+                yield branch
+                yield from walk_statements(branch.body)
+            if statement.else_body is not None:
+                yield from walk_statements(statement.else_body)
+        elif hasattr(statement, "body"):
+            yield from walk_statements(statement.body)
+
+
+def bound(node, state):
+    # An expression as the interpreter's parser builds it, looking up each variable
+    # (and raising an error if it isn't defined) in the order they appear
+    kind = type(node)
+    if kind is Name:
+        return variable(state, node.name)
+    if isinstance(node, BinaryOp):
+        return kind(bound(node.left, state), bound(node.right, state))
+    if isinstance(node, UnaryOp):
+        return kind(bound(node.value, state))
+    return node
+
+
+def variable_names(node):
+    # Name of every variable an expression reads
+    if type(node) is Name:
+        yield node.name
+    elif isinstance(node, BinaryOp):
+        yield from variable_names(node.left)
+        yield from variable_names(node.right)
+    elif isinstance(node, UnaryOp):
+        yield from variable_names(node.value)
+
+
+def calls_procedure(node):
+    # Whether an expression calls a procedure. Without recursion, as the flat engine
+    # compiles expressions nested too deeply to walk recursively
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is CallName:
+            return True
+        elif isinstance(node, BinaryOp):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, UnaryOp):
+            stack.append(node.value)
+    return False
+
+
+def statement_spans(statements, length, start_lineno=1):
+    """
+    Finds the lines of each of a block's statements, including the lines of any
+    blocks nested inside them and the empty lines up to the next statement.
+
+    Args:
+        statements (list): Compiled statements (see Compiler.block()).
+        length (int): Number of lines in the block.
+        start_lineno (int): Line number of the first line.
+
+    Returns:
+        (list): (index of first line, index after last line) of each statement.
+    """
+    starts = [statement.lineno - start_lineno for statement in statements]
+    return list(zip(starts, starts[1:] + [length]))
+
+
+class _Env:
+    """
+    What's known about the variables at one point in a program: the type of every
+    variable which may have been assigned (None where it isn't proven), and which
+    variables have certainly been assigned.
+    """
+
+    __slots__ = ("types", "defined")
+
+    def __init__(self, types=None, defined=None):
+        self.types = types if types is not None else {}
+        self.defined = defined if defined is not None else set()
+
+    def copy(self):
+        return _Env(dict(self.types), set(self.defined))
+
+    def join(self, other):
+        """
+        Returns:
+            (_Env): What's known when control can arrive from either point.
+        """
+        types = dict(self.types)
+        for name, type_ in other.types.items():
+            if name not in types:
+                types[name] = type_
+            elif types[name] is not type_:
+                types[name] = None
+        return _Env(types, self.defined & other.defined)
+
+    def __eq__(self, other):
+        return self.types == other.types and self.defined == other.defined
+
+
+class TypeInference:
+    """
+    Flow-sensitive type inference over a compiled program. Works out the type of each
+    variable at each point in the program, joining them where control flow meets and
+    iterating loops until nothing changes, and from those the type of each expression.
+
+    Along the way, reports errors which are certain to be raised whenever the
+    statement runs, e.g. "a" - 1, an undefined variable, or 'repeat' followed by text.
+
+    Attributes:
+        types (dict): Proven type of each expression node, by id(). None where the
+            type isn't proven.
+        heads (dict): What's known about the variables at the start of every
+            iteration of each loop statement, by id().
+        defined (set): id() of each Name node whose variable is certainly defined
+            whenever it's read.
+        errors (list): (line number, exception) for each certain error.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.heads = {}
+        self.defined = set()
+        self.errors = []
+        self._reported = set()
+        self._results = {}
+
+    def program(self, statements):
+        """
+        Infers the types in a whole program.
+
+        Args:
+            statements (list): The compiled program.
+        """
+        self.block(statements, _Env())
+        self.errors.sort(key=lambda error: error[0])
+
+    def block(self, statements, env):
+        env = env.copy()
+        for statement in statements:
+            env = self.statement(statement, env)
+        return env
+
+    def statement(self, statement, env):
+        kind = type(statement)
+
+        if kind is AssignStatement:
+            type_ = self.expression(statement.expr, env, statement.lineno)
+            env.types[statement.name] = type_
+            env.defined.add(statement.name)
+        elif kind is OutputStatement:
+            self.expression(statement.expr, env, statement.lineno)
+        elif kind is ReadStatement:
+            for name in statement.names:
+                env.types[name] = None
+                env.defined.add(name)
+        elif kind is IfStatement:
+            exits = []
+            for branch in statement.branches:
+                self.header(branch, env, if_elseif_condition)
+                exits.append(self.block(branch.body, env))
+            if statement.else_body is not None:
+                exits.append(self.block(statement.else_body, env))
+            else:
+                exits.append(env)
+            env = exits[0]
+            for exit in exits[1:]:
+                env = env.join(exit)
+        elif kind is RepeatStatement:
+            # The block runs at least once, from the state before the loop and then
+            # from the state after the previous iteration
+            self.header(statement, env, repeat_count)
+            head = env
+            while True:
+                exit = self.block(statement.body, head)
+                joined = head.join(exit)
+                if joined == head:
+                    break
+                head = joined
+            self.heads[id(statement)] = head
+            env = exit
+        elif kind is RepeatUntilStatement:
+            # The condition is checked before every iteration, and the loop can only
+            # be left from there
+            head = env
+            while True:
+                self.header(statement, head, repeat_until_condition)
+                exit = self.block(statement.body, head)
+                joined = head.join(exit)
+                if joined == head:
+                    break
+                head = joined
+            self.heads[id(statement)] = head
+            env = head
+
+        return env
+
+    def header(self, statement, env, check):
+        # The expression of an 'if', 'else if' or loop, which check() is run on
+        if statement.expr is None:
+            return
+        type_ = self.expression(statement.expr, env, statement.lineno)
+        if type_ is not None:
+            try:
+                check(SAMPLES[type_])
+            except Exception as error:
+                self.report(statement.lineno, error)
+
+    def expression(self, node, env, lineno, certain=True):
+        """
+        Infers the type of an expression.
+
+        Args:
+            node: The expression's node.
+            env (_Env): What's known about the variables.
+            lineno (int): Line number of the expression, for errors.
+            certain (bool): Whether the expression is certain to be evaluated when
+                its statement runs.
+
+        Returns:
+            (type): Type of the expression's value, or None if it isn't proven.
+        """
+        kind = type(node)
+
+        if kind in SAMPLES:
+            type_ = kind
+        elif kind is Name:
+            # Variables are looked up as the line is parsed, so an undefined variable
+            # raises an error even where it wouldn't be evaluated
+            if node.name not in env.types:
+                try:
+                    variable(ParserState(), node.name)
+                except ValueError as error:
+                    self.report(lineno, error)
+            if node.name in env.defined:
+                self.defined.add(id(node))
+            type_ = env.types.get(node.name)
+        elif isinstance(node, BinaryOp):
+            short_circuit = kind is And or kind is Or
+            left = self.expression(node.left, env, lineno, certain)
+            right = self.expression(
+                node.right, env, lineno, certain and not short_circuit
+            )
+            if short_circuit:
+                # Gives a condition whenever it doesn't raise an error, but the right
+                # side is only certain to be checked if the left side isn't a condition
+                type_ = Condition
+                if left is not None and left is not Condition:
+                    type_ = self.result(kind, lineno, certain, left, Condition)
+            elif left is not None and right is not None:
+                type_ = self.result(kind, lineno, certain, left, right)
+            elif kind in COMPARISONS:
+                type_ = (
+                    Condition  # Comparisons give a condition whenever they don't fail
+                )
+            else:
+                type_ = None
+        elif isinstance(node, UnaryOp):
+            operand = self.expression(node.value, env, lineno, certain)
+            type_ = None
+            if operand is not None:
+                type_ = self.result(kind, lineno, certain, operand)
+        else:
+            type_ = None
+
+        self.types[id(node)] = type_
+        return type_
+
+    def result(self, kind, lineno, certain, *operand_types):
+        """
+        Works out the type an operation gives by running it on sample values,
+        reporting the error it raises if it always raises one.
+
+        Returns:
+            (type): Type of the result, or None if the operation raises an error.
+        """
+        key = (kind,) + operand_types
+        if key not in self._results:
+            try:
+                node = kind(*(SAMPLES[type_] for type_ in operand_types))
+                self._results[key] = (type(node.eval()), None)
+            except Exception as error:
+                self._results[key] = (None, error)
+
+        type_, error = self._results[key]
+        if error is not None and certain:
+            self.report(lineno, error)
+        return type_
+
+    def report(self, lineno, error):
+        key = (lineno, type(error), str(error))
+        if key not in self._reported:
+            self._reported.add(key)
+            self.errors.append((lineno, error))
+
+
+class CodeGenerator:
+    """
+    Generates a Python function for each compiled statement. Expressions whose types
+    have been proven are computed on plain Python values without any type checks,
+    and only boxed into ast_nodes values where they meet the rest of the program;
+    everything else calls the same checked methods the interpreter does.
+
+    Args:
+        session (CompiledSession): Session running the program, for statements left
+            to the interpreter.
+        inference (TypeInference): Types inferred for the program.
+    """
+
+    def __init__(self, session, inference):
+        self.session = session
+        self.types = inference.types
+        self.defined = inference.defined
+        self._factories = {}  # Compiled code by source, shared by identical statements
+
+    def function(self, statement):
+        """
+        Generating code takes far longer than running a statement once, so it only
+        pays off for statements which run again: the first time, the function given
+        evaluates the statement's expression just as the interpreter would, and code
+        is generated the next time the statement runs.
+
+        Returns:
+            (function): Function of the parser state which runs the statement, or
+                for a condition or loop, gives its (unboxed) condition or count.
+        """
+        if statement.expr is None:
+            return self.interpreted(statement)
+        if not statement.walked:
+            statement.walked = True
+            return self.walker(statement)
+
+        self.constants = []
+        self._raw = {}
+        expr = statement.expr
+        kind = type(statement)
+        try:
+            if kind is OutputStatement:
+                body = f"print({self.printed(expr)}, file=state.output)"
+            elif kind is AssignStatement:
+                body = f"v[{statement.name!r}] = {self.boxed(expr)}"
+            elif kind is RepeatStatement:
+                body = f"return repeat_count({self.boxed(expr)})"
+            else:
+                check = if_elseif_condition
+                if kind is RepeatUntilStatement:
+                    check = repeat_until_condition
+                body = f"return {self.condition(expr, check)}"
+            source = self.source(expr, body)
+
+            factory = self._factories.get(source)
+            if factory is None:
+                namespace = dict(NAMESPACE)
+                exec(source, namespace)
+                factory = self._factories[source] = namespace["make"]
+        except (SyntaxError, RecursionError, MemoryError):
+            # Expressions nested too deeply for Python's own compiler
+            return self.interpreted(statement)
+        return factory(tuple(self.constants))
+
+    def walker(self, statement):
+        # Function running a statement once without generating code, which leaves
+        # generating it to the next time the statement runs
+        expr = statement.expr
+        kind = type(statement)
+        check = if_elseif_condition
+        if kind is RepeatUntilStatement:
+            check = repeat_until_condition
+
+        def walk(state):
+            statement.function = None
+            try:
+                value = bound(expr, state).eval()
+            except RecursionError:
+                # Too deeply nested to walk here, so the interpreter raises any error
+                return self.interpreted(statement)(state)
+            if kind is OutputStatement:
+                print(value, file=state.output)
+            elif kind is AssignStatement:
+                state.variables[statement.name] = value
+            elif kind is RepeatStatement:
+                return repeat_count(value)
+            else:
+                return check(value).value
+
+        return walk
+
+    def source(self, expr, body):
+        lines = [
+            "def make(c):",
+            "    def statement(state):",
+            "        v = state.variables",
+        ]
+        lines.extend("        " + check for check in self.checks(expr))
+        lines.append(f"        {body}")
+        lines.append("    return statement")
+        return "\n".join(lines)
+
+    def checks(self, expr):
+        """
+        Undefined variables raise an error before anything is evaluated, in the order
+        they appear, as they would when the line is parsed.
+
+        Returns:
+            (list): Python statements checking each variable in the expression which
+                isn't certainly defined.
+        """
+        checks = []
+        checked = set()
+        for node in self.names(expr):
+            if id(node) not in self.defined and node.name not in checked:
+                checked.add(node.name)
+                checks.append(
+                    f"if {node.name!r} not in v: variable(state, {node.name!r})"
+                )
+        return checks
+
+    def names(self, node):
+        # Every Name node in an expression, in the order they appear on the line
+        if type(node) is Name:
+            yield node
+        elif isinstance(node, BinaryOp):
+            yield from self.names(node.left)
+            yield from self.names(node.right)
+        elif isinstance(node, UnaryOp):
+            yield from self.names(node.value)
+
+    def interpreted(self, statement):
+        parser = self.session.parser
+        lexer = self.session.lexer
+        line = statement.line
+        kind = type(statement)
+
+        if kind is RepeatStatement:
+            return lambda state: parser.parse(lexer.lex(line), state=state)
+        if kind is Branch or kind is RepeatUntilStatement:
+            return lambda state: parser.parse(lexer.lex(line), state=state).value
+        return lambda state: parser.parse(lexer.lex(line), state=state).eval()
+
+    def constant(self, value):
+        self.constants.append(value)
+        return f"c[{len(self.constants) - 1}]"
+
+    def raw(self, node):
+        """
+        Returns:
+            (string): Python for the unboxed value of an expression, or None if its
+                type isn't proven.
+        """
+        key = id(node)
+        if key in self._raw:
+            return self._raw[key]
+
+        kind = type(node)
+        source = None
+        if kind is Integer and abs(node.value) < 2**63:
+            source = repr(node.value)
+        elif kind is Condition:
+            source = repr(node.value)
+        elif kind in SAMPLES:
+            source = self.constant(node.value)
+        elif kind is Name:
+            if self.types.get(key) is not None:
+                source = self.name_raw(node)
+        elif self.fused(node) and all(
+            self.types.get(id(operand)) is Integer
+            for operand in (node.left.left, node.left.right, node.right)
+        ):
+            base = self.raw(node.left.left)
+            exponent = self.raw(node.left.right)
+            modulus = self.raw(node.right)
+            if base is not None and exponent is not None and modulus is not None:
+                source = f"power_mod({base}, {exponent}, {modulus})"
+        elif isinstance(node, BinaryOp):
+            fast = FAST_BINARY.get(
+                (kind, self.types.get(id(node.left)), self.types.get(id(node.right)))
+            )
+            if fast is not None:
+                left = self.raw(node.left)
+                right = self.raw(node.right)
+                if left is not None and right is not None:
+                    source = fast[0].format(left, right)
+        elif isinstance(node, UnaryOp):
+            fast = FAST_UNARY.get((kind, self.types.get(id(node.value))))
+            if fast is not None:
+                operand = self.raw(node.value)
+                if operand is not None:
+                    source = fast[0].format(operand)
+
+        self._raw[key] = source
+        return source
+
+    def simple(self, node):
+        # Whether working out an expression can never raise an error
+        return type(node) in SAMPLES or type(node) is Name
+
+    def fused(self, node):
+        # Whether an expression is a ^ b mod m, where m can be worked out before a ^ b
+        # without changing which error is raised
+        return type(node) is Mod and type(node.left) is Pow and self.simple(node.right)
+
+    def name_raw(self, node):
+        # Python for the unboxed value of a variable whose type is proven
+        return f"v[{node.name!r}].value"
+
+    def name_boxed(self, node):
+        return f"v[{node.name!r}]"
+
+    def boxed(self, node):
+        """
+        Returns:
+            (string): Python for the value of an expression as an ast_nodes value.
+        """
+        kind = type(node)
+        if kind in SAMPLES:
+            return self.constant(node)  # Values are never changed once built
+        if kind is Name:
+            return self.name_boxed(node)
+
+        raw = self.raw(node)
+        if raw is not None:
+            return f"{self.types[id(node)].__name__}({raw})"
+
+        if kind is Mod and type(node.left) is Pow:
+            # Pow.mod() only works out the modulus after the power's operands
+            modulus = self.boxed(node.right)
+            if not self.simple(node.right):
+                modulus = f"_Deferred(lambda: {modulus})"
+            return (
+                f"Pow({self.boxed(node.left.left)}, {self.boxed(node.left.right)})"
+                f".mod({modulus})"
+            )
+        if isinstance(node, BinaryOp):
+            return CHECKED_BINARY[kind].format(
+                self.boxed(node.left), self.boxed(node.right)
+            )
+        return CHECKED_UNARY[kind].format(self.boxed(node.value))
+
+    def printed(self, node):
+        # Python printing the same text as the boxed value would
+        raw = self.raw(node)
+        if raw is None:
+            return self.boxed(node)
+        if self.types[id(node)] is Condition:
+            return f"('true' if {raw} else 'false')"
+        return raw
+
+    def condition(self, node, check):
+        # Python for the unboxed value of a condition, checking it is one if needed
+        if self.types.get(id(node)) is Condition:
+            raw = self.raw(node)
+            if raw is not None:
+                return raw
+            return f"{self.boxed(node)}.value"
+        return f"{check.__name__}({self.boxed(node)}).value"
+
+
+class NotCompilable(Exception):
+    """
+    Raised while compiling a program or loop which has to be left to the interpreter.
+    Its message says why, e.g. "it uses procedures".
+    """
+
+
+class Compiler:
+    """
+    Compiles source lines into statements, finding the blocks of loops and
+    conditionals just as run.Session.parse() does. Nothing is run.
+
+    Args:
+        session (run.Session): Session whose lexer is used.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.lexer = session.lexer
+        self.syntax = SyntaxParser()
+
+    def line(self, line):
+        """
+        Parses a line without running it. See parse().
+        """
+        return self.parse(self.lexer.lex(line))
+
+    def parse(self, tokens):
+        """
+        Parses a lexed line without running it. Procedures and 'repeat for' loops are
+        only run by the interpreter, so lines which define, call or return from a
+        procedure or start a 'repeat for' loop raise NotCompilable.
+
+        Returns:
+            (tuple): As parser.SyntaxParser.parse(), or None if the line has a syntax
+                error.
+        """
+        try:
+            parsed = self.syntax.parse(tokens)
+        except Exception:
+            return None
+        if parsed[0] == "REPEATFOR":
+            raise NotCompilable("it uses 'repeat for'")
+        if parsed[0] in ("PROCEDURE", "RETURN", "CALL") or calls_procedure(parsed[2]):
+            raise NotCompilable("it uses procedures")
+        return parsed
+
+    def block(self, input, start_lineno):
+        """
+        Compiles a block of lines, finding the blocks of loops and conditionals just
+        as parse() does. Each line is lexed once, and where every block ends is found
+        from the indent levels of the lines, rather than by lexing each block again.
+
+        Args:
+            input (list): Lines of the block.
+            start_lineno (int): Line number of the first line.
+
+        Returns:
+            (list): The compiled statements.
+        """
+        lines = _Lines(input, start_lineno, self)
+        return self.statements(lines, 0, len(input), 0)
+
+    def statements(self, lines, start, stop, depth):
+        # Compiles the lines from start to stop, a block nested depth levels deep
+        statements = []
+        idx = start
+        while idx < stop:
+            line, parsed = lines.line(idx, depth)
+            lineno = lines.start_lineno + idx
+            first = lines.first_token_type(idx, depth)
+            expr = parsed[2] if parsed is not None else None
+
+            if first == "REPEAT" or first == "REPEATUNTIL":
+                end = lines.block_end(idx, stop)
+                body = self.statements(lines, idx + 1, end, depth + 1)
+                if first == "REPEAT":
+                    statements.append(RepeatStatement(lineno, line, expr, body))
+                else:
+                    statements.append(RepeatUntilStatement(lineno, line, expr, body))
+                idx = end
+            elif first == "IF":
+                statement, idx = self.if_chain(lines, idx, stop, depth, expr)
+                statements.append(statement)
+            elif parsed is None or first == "ELSEIF":
+                statements.append(InterpretedStatement(lineno, line))
+                idx += 1
+            else:
+                if parsed[0] == "OUTPUT":
+                    statements.append(OutputStatement(lineno, line, expr))
+                elif parsed[0] == "VARIABLE":
+                    statements.append(AssignStatement(lineno, line, parsed[1], expr))
+                elif parsed[0] == "READ":
+                    statements.append(ReadStatement(lineno, line, expr))
+                # Anything else ('else' on its own or an empty line) does nothing
+                idx += 1
+
+        return statements
+
+    def if_chain(self, lines, idx, stop, depth, expr):
+        # Compiles an 'if' statement and any 'else if' and 'else' statements after it,
+        # returning it and the index of the line after it
+        end = lines.block_end(idx, stop)
+        lineno = lines.start_lineno + idx
+        body = self.statements(lines, idx + 1, end, depth + 1)
+        branches = [Branch(lineno, lines.line(idx, depth)[0], expr, body)]
+        idx = end
+
+        while idx < stop and lines.first_token_type(idx, depth) == "ELSEIF":
+            line, parsed = lines.line(idx, depth)
+            end = lines.block_end(idx, stop)
+            branches.append(
+                Branch(
+                    lines.start_lineno + idx,
+                    line,
+                    parsed[2] if parsed is not None else None,
+                    self.statements(lines, idx + 1, end, depth + 1),
+                )
+            )
+            idx = end
+
+        else_body = None
+        follow_up_lineno = None
+        if idx < stop and lines.first_token_type(idx, depth) == "ELSE":
+            end = lines.block_end(idx, stop)
+            else_body = self.statements(lines, idx + 1, end, depth + 1)
+            idx = end
+            if idx < stop and lines.first_token_type(idx, depth) in (
+                "ELSEIF",
+                "ELSE",
+            ):
+                follow_up_lineno = lines.start_lineno + idx
+
+        return IfStatement(branches, else_body, follow_up_lineno), idx
+
+
+class _Lines:
+    """
+    The lines being compiled by Compiler.block(), each lexed and parsed once, and
+    where the block after each ends (see run.block_ends()). Only what's found from
+    each line's tokens is kept, not the tokens.
+
+    Args:
+        input (list): Lines of the block.
+        start_lineno (int): Line number of the first line.
+        compiler (Compiler): Compiler to parse the lines with.
+    """
+
+    def __init__(self, input, start_lineno, compiler):
+        self.input = input
+        self.start_lineno = start_lineno
+        self.compiler = compiler
+        self.indents = []  # Number of INDENT tokens at the start of each line
+        self.firsts = []  # Type of the token after them, None if there isn't one
+        self.parsed = []  # Each line parsed without them (see Compiler.parse())
+        levels = []
+        for line in input:
+            tokens = compiler.lexer.lex(line)
+            # Left to parse(), which raises its error, if the line can't be lexed
+            try:
+                indent = 0
+                token = next(tokens, None)
+                while token is not None and token.gettokentype() == "INDENT":
+                    indent += 1
+                    token = next(tokens, None)
+                # As find_indent_level() finds it, a line with nothing after its
+                # first other token (such as its newline) is empty
+                read = [] if token is None else [token]
+                if token is not None:
+                    read.extend(islice(tokens, 1))
+            except LexingError:
+                raise NotCompilable("a line in it can't be lexed")
+            self.indents.append(indent)
+            self.firsts.append(None if token is None else token.gettokentype())
+            levels.append(None if len(read) < 2 else indent)
+
+            # Only raised if the line is compiled at this indent level
+            try:
+                self.parsed.append(compiler.parse(chain(read, tokens)))
+            except NotCompilable as reason:
+                self.parsed.append(reason)
+        self.ends = block_ends(levels)
+
+    def line(self, idx, depth):
+        """
+        Returns:
+            (tuple): A line as parse() runs it in a block nested depth levels deep,
+                with depth tabs removed, and the line parsed (see Compiler.parse()).
+        """
+        line = self.input[idx]
+        if self.indents[idx] != depth or not line.startswith("\t" * depth):
+            # Indented too far, or with tabs after its start which are removed too,
+            # so it's parsed again as it is at this level
+            line = dedent_line(line, depth)
+            return line, self.compiler.line(line)
+        parsed = self.parsed[idx]
+        if isinstance(parsed, NotCompilable):
+            raise parsed
+        return line[depth:], parsed
+
+    def first_token_type(self, idx, depth):
+        """
+        Returns:
+            (string): Type of the first token of a line nested depth levels deep once
+                depth tabs are removed, or None if it has none.
+        """
+        if not self.input[idx].startswith("\t" * depth):
+            line = dedent_line(self.input[idx], depth)
+            try:
+                token = next(self.compiler.lexer.lex(line), None)
+            except LexingError:
+                raise NotCompilable("a line in it can't be lexed")
+            return token.gettokentype() if token is not None else None
+        if self.indents[idx] > depth:
+            return "INDENT"
+        return self.firsts[idx]
+
+    def block_end(self, idx, stop):
+        # Index after the block following a loop or conditional's line, in a block
+        # ending at stop
+        return min(self.ends[idx], stop)
+
+
+class CompiledSession(Session):
+    """
+    Runs a program by compiling it first rather than parsing each line every time it
+    runs. Each line is parsed once, types are inferred over the whole program (see
+    TypeInference) and each statement becomes a Python function which skips the type
+    checks the inferred types make unnecessary.
+
+    Output, errors and error line numbers are identical to Session's. Lines with syntax
+    errors are left to the interpreter, as is the whole program if its structure can't
+    be compiled or it uses procedures or 'repeat for' loops.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        report (file): Stream to report errors found by type inference to before the
+            program runs, if any.
+    """
+
+    def __init__(self, grammar=None, output=None, report=None):
+        super().__init__(grammar, output)
+        self.report = report
+        self.type_errors = []  # (line number, exception) found before running
+
+    def run(self, input, start_lineno=1):
+        """
+        Compiles and runs a program.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+        """
+        try:
+            statements = self.compile(input, start_lineno)
+        except NotCompilable:
+            statements = None
+        if statements is None:
+            # Fail in exactly the same way as the interpreter would, outside the
+            # except block so its error isn't shown as raised while handling this one
+            return super().run(input, start_lineno)
+
+        self.report_type_errors()
+        self.execute(statements, self.state)
+
+    def run_statements(self, input, spans, begin, start_lineno=1):
+        """
+        Compiles a program with every line outside spans left blank, and runs what's
+        left. See run.Session.run_statements().
+        """
+        lines = ["\n"] * len(input)
+        for start, end in spans:
+            lines[start:end] = input[start:end]
+        try:
+            statements = self.compile(lines, start_lineno)
+        except NotCompilable:
+            statements = None
+        if statements is None:
+            return super().run_statements(input, spans, begin, start_lineno)
+
+        self.report_type_errors()
+        positions = {
+            start_lineno + start: position
+            for position, (start, end) in enumerate(spans)
+        }
+        for statement in statements:
+            begin(positions[statement.lineno])
+            statement.execute(self, self.state)
+
+    def report_type_errors(self):
+        if self.report is not None:
+            for lineno, error in self.type_errors:
+                print(
+                    f"Found before running, on line {lineno}: "
+                    f"{type(error).__name__}: {error}",
+                    file=self.report,
+                )
+
+    def compile(self, input, start_lineno=1):
+        """
+        Compiles a program and infers its types.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+
+        Returns:
+            (list): The compiled statements.
+        """
+        statements = Compiler(self).block(input, start_lineno)
+        inference = TypeInference()
+        inference.program(statements)
+        self.type_errors = inference.errors
+        self.generator = CodeGenerator(self, inference)
+        return statements
+
+    def execute(self, statements, state):
+        for statement in statements:
+            statement.execute(self, state)
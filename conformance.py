@@ -0,0 +1,356 @@
+import argparse
+import re
+import sys
+import time
+
+import ast_nodes
+from compiler import Compiler, statement_spans
+from run import ENGINES, Grammar, engine_factory, find_indent_level, next_token_type_is
+from copy import copy
+
+# A trailing comment, skipping over text which may have // in it (as the lexer does)
+COMMENT = re.compile(r'""".*?"""|".*?"|\'.*?\'|//(.*)')
+
+# A section starts at a line printing its heading, e.g. output "TESTING DECIMALS"
+SECTION = re.compile(r'(?:output|print|say)\s*("""|"|\')(TESTING\b.*?)\1')
+
+
+def expected_output(line):
+    """
+    Finds what a line is expected to print, from the comment at the end of it.
+
+    Args:
+        line (string): Line of code, e.g. 'print 2 ^ 31 - 1  // 2147483647'.
+
+    Returns:
+        (string): The comment's text, e.g. '2147483647'. None if there's no comment.
+    """
+    for match in COMMENT.finditer(line):
+        if match.group(1) is not None:
+            return match.group(1).strip()
+    return None
+
+
+class Section:
+    """
+    Part of a program starting at a line printing its heading, with the results of
+    checking what its lines printed.
+
+    Args:
+        name (string): Heading of the section.
+        lineno (int): Line number the section starts on.
+    """
+
+    def __init__(self, name, lineno):
+        self.name = name
+        self.lineno = lineno
+        self.checks = 0  # Lines with an expected output
+        self.failures = []  # (line number, expected, printed or None)
+        self.skipped = 0  # Lines with an expected output not run, after an error
+        self.time = 0.0  # Seconds taken to run
+
+    def __repr__(self):
+        return f"Section({self.name!r}, {self.lineno})"
+
+
+class _StatementOutput:
+    """
+    Output stream keeping what each top-level statement prints separately, and when
+    each one started.
+    """
+
+    def __init__(self, count):
+        self.printed = [[] for _ in range(count)]
+        self.started = []
+        self.parts = None
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def flush(self):
+        pass
+
+    def begin(self, position):
+        self.started.append(time.perf_counter())
+        self.parts = self.printed[position]
+
+
+class ConformanceRun:
+    """
+    Runs a program on one of the engines, checking that each output line with an
+    expected output in a trailing comment prints exactly that, e.g.
+
+        print 2 ^ 31 - 1  // 2147483647
+
+    and timing each section of the program, which start at lines printing a heading
+    beginning with TESTING, e.g. output "TESTING DECIMALS".
+
+    An output line on its own must print exactly its expected output. Output lines
+    inside a loop or an 'if' must print their expected output, in order, somewhere in
+    what the loop or 'if' printed.
+
+    Args:
+        input (list): Array containing each line of code input.
+        name (string): Name of the program, e.g. its file name.
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        engine (function): Makes the session to run the program on, given the
+            grammar and output stream. Defaults to run.Session.
+    """
+
+    def __init__(self, input, name="<program>", grammar=None, engine=None):
+        self.input = input
+        self.name = name
+        self.grammar = grammar if grammar is not None else Grammar()
+        self.engine = engine if engine is not None else engine_factory("interpreter")
+        self.error = None  # Error which stopped the program, if any
+        self.error_lineno = None
+        self.time = 0.0  # Seconds taken to run the whole program
+
+        lexer = self.grammar.lexer
+        session = self.engine(self.grammar, None)
+        try:
+            statements = Compiler(session).block(input, 1)
+            self.spans = statement_spans(statements, len(input))
+        except Exception:
+            # Checked as one statement, and left to the engine to fail on
+            self.spans = [(0, len(input))]
+
+        # Expected output of each top-level statement, and whether it's a single line
+        self.expected = []
+        self.single = []
+        for start, end in self.spans:
+            expected = []
+            for idx in range(start, end):
+                line = input[idx]
+                try:
+                    tokens = lexer.lex(line)
+                    if find_indent_level(copy(tokens)) is None:
+                        continue
+                    while next_token_type_is(copy(tokens), "INDENT"):
+                        next(tokens)
+                except Exception:
+                    continue  # Left to the engine to fail on
+                text = expected_output(line)
+                if next_token_type_is(tokens, "OUTPUT") and text is not None:
+                    expected.append((idx + 1, text))
+            self.expected.append(expected)
+            # An output line on its own, rather than one in a loop or 'if'
+            self.single.append(bool(expected) and expected[0][0] == start + 1)
+
+        # Top-level statements in each section, in order
+        self.sections = []
+        self.positions = []
+        for position, (start, end) in enumerate(self.spans):
+            match = SECTION.match(input[start])
+            if match is not None:
+                self.sections.append(Section(match.group(2), start + 1))
+                self.positions.append([])
+            elif not self.sections:
+                self.sections.append(Section("(start)", start + 1))
+                self.positions.append([])
+            self.positions[-1].append(position)
+
+    @property
+    def checks(self):
+        return sum(section.checks for section in self.sections)
+
+    @property
+    def failures(self):
+        return [failure for section in self.sections for failure in section.failures]
+
+    @property
+    def passed(self):
+        return self.error is None and not self.failures
+
+    def run(self, repeat=1):
+        """
+        Runs the program, checking its output the first time.
+
+        Args:
+            repeat (int): Times to run the program. Each section's time is the
+                fastest it ran.
+
+        Returns:
+            (bool): Whether everything printed what was expected, without any errors.
+        """
+        for number in range(repeat):
+            output = _StatementOutput(len(self.spans))
+            session = self.engine(self.grammar, output)
+            error = None
+            try:
+                session.run_statements(self.input, self.spans, output.begin)
+            except Exception as err:
+                error = err
+            end_time = time.perf_counter()
+
+            # Statements after an error didn't run, so took no time
+            ends = output.started[1:] + [end_time]
+            times = [end - start for start, end in zip(output.started, ends)]
+            times += [0.0] * (len(self.spans) - len(times))
+            for section, positions in zip(self.sections, self.positions):
+                elapsed = sum(times[position] for position in positions)
+                section.time = elapsed if number == 0 else min(section.time, elapsed)
+            elapsed = sum(times)
+            self.time = elapsed if number == 0 else min(self.time, elapsed)
+
+            if number == 0:
+                self.error = error
+                self.error_lineno = session.error_lineno
+                self.check(output.printed, len(output.started))
+        return self.passed
+
+    def check(self, printed, ran):
+        # Compares what each of the first ran top-level statements printed with its
+        # expected output
+        for section, positions in zip(self.sections, self.positions):
+            section.checks = 0
+            section.failures = []
+            section.skipped = 0
+            for position in positions:
+                expected = self.expected[position]
+                lines = "".join(printed[position]).splitlines()
+                section.checks += len(expected)
+                if position >= ran:
+                    section.skipped += len(expected)
+                    continue
+                if self.single[position]:
+                    lineno, text = expected[0]
+                    if lines != [text]:
+                        section.failures.append(
+                            (lineno, text, "\n".join(lines) if lines else None)
+                        )
+                    continue
+                remaining = iter(lines)
+                for lineno, text in expected:
+                    if text not in remaining:
+                        section.failures.append((lineno, text, None))
+
+    def report(self, file=None):
+        """
+        Prints each section's results and time, and a summary.
+
+        Args:
+            file (file): Stream to print to. Defaults to sys.stdout.
+        """
+        file = file if file is not None else sys.stdout
+        width = max([len(section.name) for section in self.sections] + [0])
+        print(self.name, file=file)
+        for section in self.sections:
+            result = self.result(section.checks, section.failures, section.skipped)
+            print(
+                f"  {section.name:<{width}}  {result:>24}  "
+                f"{section.time * 1000:10.3f} ms",
+                file=file,
+            )
+            for lineno, expected, printed in section.failures:
+                if printed is None:
+                    printed = "nothing"
+                else:
+                    printed = repr(printed)
+                print(
+                    f"    line {lineno}: expected {expected!r}, printed {printed}",
+                    file=file,
+                )
+        if self.error is not None:
+            print(
+                f"  Stopped on line {self.error_lineno}: "
+                f"{type(self.error).__name__}: {self.error}",
+                file=file,
+            )
+        skipped = sum(section.skipped for section in self.sections)
+        print(
+            f"  {self.result(self.checks, self.failures, skipped)} in "
+            f"{self.time * 1000:.3f} ms",
+            file=file,
+        )
+
+    @staticmethod
+    def result(checks, failures, skipped):
+        passed = checks - len(failures) - skipped
+        if skipped:
+            return f"{passed}/{checks} passed, {skipped} not run"
+        return f"{passed}/{checks} passed"
+
+
+def parse_args(argv=None):
+    """
+    Parses command-line arguments.
+
+    Args:
+        argv (list): Arguments to parse. Defaults to sys.argv[1:].
+
+    Returns:
+        (argparse.Namespace): Parsed arguments.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Check Traversal programs print the expected output in their "
+        "comments, and time each section."
+    )
+    arg_parser.add_argument(
+        "files", nargs="*", default=["test.trv"], help="programs (default: test.trv)"
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="interpreter",
+        help="engine to run the programs on (default: interpreter)",
+    )
+    arg_parser.add_argument(
+        "--lexer",
+        choices=Grammar.LEXER_BACKENDS,
+        default="rply",
+        help="lexer backend to use (default: rply)",
+    )
+    arg_parser.add_argument(
+        "--parser",
+        choices=Grammar.PARSER_BACKENDS,
+        default="rply",
+        help="parser backend to use (default: rply)",
+    )
+    arg_parser.add_argument(
+        "--jit-threshold",
+        type=int,
+        default=100,
+        metavar="N",
+        help="iterations a loop runs before the jit engine compiles it (default: 100)",
+    )
+    arg_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        metavar="N",
+        help="run each program N times, timing each section's fastest run "
+        "(default: 1)",
+    )
+    arg_parser.add_argument(
+        "--max-digits",
+        type=int,
+        default=ast_nodes.MAX_POWER_DIGITS,
+        metavar="N",
+        help="most digits the result of a power may have before it fails, or 0 for "
+        f"no limit (default: {ast_nodes.MAX_POWER_DIGITS})",
+    )
+    args = arg_parser.parse_args(argv)
+    if args.repeat < 1:
+        arg_parser.error("--repeat must be at least 1")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    ast_nodes.MAX_POWER_DIGITS = args.max_digits or None
+
+    grammar = Grammar(lexer_backend=args.lexer, parser_backend=args.parser)
+    engine = engine_factory(args.engine, args.jit_threshold)
+
+    passed = True
+    for filename in args.files:
+        with open(filename, "r") as user_input:
+            input = user_input.readlines()
+        conformance = ConformanceRun(
+            input, f"{filename} ({args.engine})", grammar, engine
+        )
+        passed = conformance.run(args.repeat) and passed
+        conformance.report()
+
+    sys.exit(0 if passed else 1)
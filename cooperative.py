@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+from ast_nodes import Returned
+from run import Session, find_indent_level
+from copy import copy
+
+
+class ResumableSession(Session):
+    """
+    Runs a program exactly as Session does, but as a generator which hands control
+    back to whatever is running it every few statements, so one thread can take turns
+    running many programs. See Program for running them on an asyncio event loop.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        slice (int): Statements run between each time control is handed back.
+    """
+
+    def __init__(self, grammar=None, output=None, slice=100):
+        super().__init__(grammar, output)
+        self.slice = slice
+        self.statements = 0  # Statements started so far
+        self.countdown = slice  # Statements left before control is next handed back
+
+    def run(self, input, start_lineno=1):
+        for _ in self.steps(input, start_lineno):
+            pass
+
+    def run_statements(self, input, spans, begin, start_lineno=1):
+        for position, (start, end) in enumerate(spans):
+            begin(position)
+            for _ in self.parse(input[start:end], start_lineno + start, self.state):
+                pass
+
+    def steps(self, input, start_lineno=1):
+        """
+        Runs a program, a slice at a time.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+
+        Yields:
+            (int): Number of statements started so far, after each slice.
+        """
+        yield from self.parse(input, start_lineno, self.state)
+
+    def call_procedure(self, procedure, state):
+        # Calls happen while a statement is evaluated, so a procedure runs to the end
+        # without handing control back
+        try:
+            for _ in self.parse(procedure.lines, procedure.start_lineno, state):
+                pass
+        except Returned as returned:
+            return returned.value
+        return None
+
+    def run_blocks(self, blocks, lines_skipped, state):
+        # A generator handing control back between the blocks' statements. Control is
+        # never handed back inside a try block, so closing the generator doesn't
+        # report an error
+        for block, start_lineno in blocks:
+            yield from self.parse(block, start_lineno, state)
+
+        return lines_skipped
+
+    def parse(self, input, start_lineno, state):
+        lines_skipped = 0
+
+        for idx, line in enumerate(input):
+            if lines_skipped > 0:
+                lines_skipped -= 1
+                continue
+
+            tokens = self.lexer.lex(line)
+            lineno = idx + start_lineno
+            current_indent_level = find_indent_level(copy(tokens))
+
+            if current_indent_level is not None:
+                self.statements += 1
+                self.countdown -= 1
+                if self.countdown <= 0:
+                    self.countdown = self.slice
+                    yield self.statements
+
+            lines_skipped = self.statement_method(tokens)(
+                tokens, current_indent_level, input, idx, lineno, state
+            )
+            if type(lines_skipped) is not int:
+                # The generator running a loop's or 'if' statement's block
+                lines_skipped = yield from lines_skipped
+
+
+class Program:
+    """
+    A program running on the current asyncio event loop alongside any others, each
+    taking a turn of a slice of statements before letting the next one run, in the
+    order they're waiting. Nothing is run on other threads or processes.
+
+    Awaiting a Program waits for it to finish, raising the error that stopped it if
+    there was one. Programs which take longer than their time limit, counting only
+    the time they spent running, are stopped with a TimeoutError.
+
+    A procedure call runs to the end without handing control back, as it happens
+    while a statement's expression is evaluated. A long-running procedure therefore
+    holds up every other program until it returns, and its time only counts towards
+    the time limit once it has, so it can run well past the limit.
+
+    Must be made while the event loop is running, e.g. in a coroutine.
+
+    Args:
+        input (list): Array containing each line of code input.
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        slice (int): Statements run in each turn.
+        time_limit (float): Most seconds the program may spend running, or None for
+            no limit.
+    """
+
+    def __init__(self, input, grammar=None, output=None, slice=100, time_limit=None):
+        self.session = ResumableSession(grammar, output, slice)
+        self.time_limit = time_limit
+        self.elapsed = 0.0  # Seconds spent running so far
+        self.turns = 0
+        self._running = asyncio.Event()  # Cleared while paused
+        self._running.set()
+        self.task = asyncio.ensure_future(self._run(input))
+
+    def __await__(self):
+        return self.task.__await__()
+
+    @property
+    def statements(self):
+        return self.session.statements
+
+    @property
+    def error_lineno(self):
+        return self.session.error_lineno
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def done(self):
+        return self.task.done()
+
+    def pause(self):
+        """
+        Stops the program at the end of its current turn until it's resumed.
+        """
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        """
+        Stops the program at the end of its current turn, even if it's paused.
+        Awaiting it then raises asyncio.CancelledError.
+        """
+        self.task.cancel()
+
+    async def _run(self, input):
+        steps = self.session.steps(input)
+        try:
+            while True:
+                await self._running.wait()
+                start_time = time.perf_counter()
+                try:
+                    next(steps)
+                except StopIteration:
+                    return
+                finally:
+                    self.elapsed += time.perf_counter() - start_time
+                    self.turns += 1
+                if self.time_limit is not None and self.elapsed > self.time_limit:
+                    raise TimeoutError(
+                        f"Program ran for longer than {self.time_limit} seconds"
+                    )
+                # Back of the queue, behind every other program waiting for a turn
+                await asyncio.sleep(0)
+        finally:
+            steps.close()
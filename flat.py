@@ -0,0 +1,424 @@
+from array import array
+
+from ast_nodes import *
+from compiler import (
+    AssignStatement,
+    CodeGenerator,
+    CompiledSession,
+    Compiler,
+    OutputStatement,
+    RepeatStatement,
+    RepeatUntilStatement,
+)
+from parser import if_elseif_condition, repeat_count, repeat_until_condition, variable
+
+# Opcode of each kind of node. Constants and variable names have no children, and
+# keep their value or name in the constant pool
+CONSTANT = 0
+NAME = 1
+OPERATORS = (
+    Equals,
+    NotEquals,
+    LessThanEquals,
+    LessThan,
+    GreaterThanEquals,
+    GreaterThan,
+    And,
+    Or,
+    Add,
+    Sub,
+    Mul,
+    Div,
+    Pow,
+    Mod,
+    Not,
+    UnaryAdd,
+    UnarySub,
+)
+OPCODES = {kind: opcode for opcode, kind in enumerate(OPERATORS, 2)}
+(
+    EQUALS,
+    NOT_EQUALS,
+    LESS_THAN_EQUALS,
+    LESS_THAN,
+    GREATER_THAN_EQUALS,
+    GREATER_THAN,
+    AND,
+    OR,
+    ADD,
+    SUB,
+    MUL,
+    DIV,
+    POW,
+    MOD,
+    NOT,
+    UNARY_ADD,
+    UNARY_SUB,
+) = range(2, 2 + len(OPERATORS))
+
+VALUE_TYPES = (Integer, Decimal, Text, Condition)
+
+# Steps of FlatTree.evaluate() at each operator: before its operands, after the left
+# side of 'and' or 'or', after the base and exponent of a power taken mod something,
+# after the modulus of a power of two integers, and after all its operands
+VISIT, LEFT, POWER, POWER_MOD, OPERANDS = range(5)
+
+# Method of the left operand's value each binary operator calls, and of the operand's
+# value each unary operator calls, with its argument
+METHODS = {
+    EQUALS: "equals",
+    LESS_THAN_EQUALS: "less_than_equals",
+    LESS_THAN: "less_than",
+    GREATER_THAN_EQUALS: "greater_than_equals",
+    GREATER_THAN: "greater_than",
+    ADD: "add",
+    SUB: "sub",
+    MUL: "mul",
+    DIV: "div",
+    POW: "pow",
+    MOD: "mod",
+}
+
+
+class FlatTree:
+    """
+    The expressions of a program stored in parallel arrays rather than as a tree of
+    objects: the opcode of each node, the index of its left and right children (or
+    its operand, for unary operators) and the index of its value in the constant
+    pool, with -1 where a node has none. Each node takes 13 bytes, however many
+    there are, rather than a Python object and its __dict__.
+
+    Nodes are added children first, so every node comes after its children, and
+    evaluate() gives exactly what eval() on the tree of objects would give.
+    """
+
+    def __init__(self):
+        self.opcodes = array("B")
+        self.left = array("i")
+        self.right = array("i")
+        self.constants = array("i")
+        self.pool = []  # Constant values and variable names
+        self._pooled = {}  # Index in the pool of each constant and name
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def nbytes(self):
+        """
+        Returns:
+            (int): Bytes used by the arrays' contents, not counting the constant pool.
+        """
+        return sum(
+            len(each) * each.itemsize
+            for each in (self.opcodes, self.left, self.right, self.constants)
+        )
+
+    def pooled(self, key, value):
+        # Index of a constant or name in the pool, adding it if it isn't there.
+        # Constants are never changed once built, so equal ones can be shared
+        index = self._pooled.get(key)
+        if index is None:
+            index = self._pooled[key] = len(self.pool)
+            self.pool.append(value)
+        return index
+
+    def node(self, opcode, left=-1, right=-1, constant=-1):
+        self.opcodes.append(opcode)
+        self.left.append(left)
+        self.right.append(right)
+        self.constants.append(constant)
+        return len(self.opcodes) - 1
+
+    def add(self, expr):
+        """
+        Adds an expression parsed by parser.SyntaxParser.
+
+        Args:
+            expr: Root node of the expression.
+
+        Returns:
+            (int): Index of the expression's root node.
+        """
+        # Without recursion, as generated expressions can be nested very deeply
+        done = []  # Indices of the nodes added whose parents haven't been yet
+        stack = [(expr, False)]
+        while stack:
+            node, children_added = stack.pop()
+            kind = type(node)
+            if kind in VALUE_TYPES:
+                key = (kind, type(node.value), node.value)
+                done.append(self.node(CONSTANT, constant=self.pooled(key, node)))
+            elif kind is Name:
+                key = (Name, node.name)
+                done.append(self.node(NAME, constant=self.pooled(key, node.name)))
+            elif not children_added:
+                stack.append((node, True))
+                if isinstance(node, BinaryOp):
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                else:
+                    stack.append((node.value, False))
+            elif isinstance(node, BinaryOp):
+                right = done.pop()
+                done.append(self.node(OPCODES[kind], done.pop(), right))
+            else:
+                done.append(self.node(OPCODES[kind], done.pop()))
+        return done.pop()
+
+    def names(self, index):
+        """
+        Returns:
+            (list): Name of every variable in an expression, in the order they appear
+                on the line.
+        """
+        names = []
+        stack = [index]
+        while stack:
+            index = stack.pop()
+            opcode = self.opcodes[index]
+            if opcode == NAME:
+                names.append(self.pool[self.constants[index]])
+            elif opcode != CONSTANT:
+                if self.right[index] != -1:
+                    stack.append(self.right[index])
+                stack.append(self.left[index])
+        return names
+
+    def evaluate(self, index, variables):
+        """
+        Evaluates an expression, as eval() would on its tree of objects.
+
+        Args:
+            index (int): Index of the expression's root node.
+            variables (dict): Values of the variables, which must all be defined.
+
+        Returns:
+            The expression's value.
+        """
+        # Without recursion, as add() accepts expressions nested any depth. Each
+        # operator is visited before its operands, then again at each later step,
+        # with the values worked out so far on a stack of their own. Constants and
+        # variables are looked up as soon as they're reached rather than visited
+        opcodes, constants, pool = self.opcodes, self.constants, self.pool
+        opcode = opcodes[index]
+        if opcode == CONSTANT:
+            return pool[constants[index]]
+        if opcode == NAME:
+            return variables[pool[constants[index]]]
+
+        lefts, rights = self.left, self.right
+        values = []
+        # Base and exponent of each a ^ b mod m whose modulus is being worked out,
+        # as an error working out the power has to come before any in the modulus
+        powers = []
+        stack = [(index, VISIT)]
+        try:
+            while stack:
+                index, step = stack.pop()
+                opcode = opcodes[index]
+                if step == VISIT:
+                    if opcode == CONSTANT:
+                        values.append(pool[constants[index]])
+                        continue
+                    if opcode == NAME:
+                        values.append(variables[pool[constants[index]]])
+                        continue
+                    left = lefts[index]
+                    if opcode == MOD and opcodes[left] == POW:
+                        stack.append((index, POWER))
+                        stack.append((rights[left], VISIT))
+                        stack.append((lefts[left], VISIT))
+                        continue
+                    if opcode == AND or opcode == OR:
+                        stack.append((index, LEFT))
+                        stack.append((left, VISIT))
+                        continue
+                    right = rights[index]
+                    left_opcode = opcodes[left]
+                    if left_opcode > NAME:
+                        stack.append((index, OPERANDS))
+                        if right != -1:
+                            stack.append((right, VISIT))
+                        stack.append((left, VISIT))
+                        continue
+                    if left_opcode == CONSTANT:
+                        values.append(pool[constants[left]])
+                    else:
+                        values.append(variables[pool[constants[left]]])
+                    if right != -1:
+                        right_opcode = opcodes[right]
+                        if right_opcode > NAME:
+                            stack.append((index, OPERANDS))
+                            stack.append((right, VISIT))
+                            continue
+                        if right_opcode == CONSTANT:
+                            values.append(pool[constants[right]])
+                        else:
+                            values.append(variables[pool[constants[right]]])
+                elif step == OPERANDS:
+                    pass  # Every operand has been worked out, so it's applied below
+                elif step == LEFT:
+                    # 'and' is decided by a false left side and 'or' by a true one,
+                    # without evaluating the right side
+                    value = values[-1]
+                    decided = opcode == OR
+                    if type(value) is Condition and value.value == decided:
+                        values[-1] = Condition(decided)
+                    else:
+                        stack.append((index, OPERANDS))
+                        stack.append((rights[index], VISIT))
+                    continue
+                elif step == POWER:
+                    # a ^ b mod m, as ast_nodes.Pow.mod() works it out
+                    exponent = values.pop()
+                    base = values[-1]
+                    if type(base) is Integer and type(exponent) is Integer:
+                        powers.append((base, exponent))
+                        stack.append((index, POWER_MOD))
+                    else:
+                        values[-1] = base.pow(exponent)
+                        stack.append((index, OPERANDS))
+                    stack.append((rights[index], VISIT))
+                    continue
+                elif step == POWER_MOD:
+                    base, exponent = powers.pop()
+                    right = values.pop()
+                    if type(right) is Integer:
+                        values[-1] = Integer(
+                            power_mod(base.value, exponent.value, right.value)
+                        )
+                    else:
+                        values[-1] = base.pow(exponent).mod(right)
+                    continue
+
+                # Every operand is on the stack of values
+                if opcode in METHODS:
+                    right = values.pop()
+                    values[-1] = getattr(values[-1], METHODS[opcode])(right)
+                elif opcode == NOT_EQUALS:
+                    right = values.pop()
+                    result = values[-1].equals(right)
+                    result.value = not result.value
+                    values[-1] = result
+                elif opcode == AND:
+                    right = values.pop()
+                    values[-1] = values[-1].logical_and(right)
+                elif opcode == OR:
+                    right = values.pop()
+                    values[-1] = values[-1].logical_or(right)
+                elif opcode == NOT:
+                    values[-1] = values[-1].logical_not()
+                elif opcode == UNARY_ADD:
+                    values[-1] = values[-1].mul(Integer(1))
+                else:
+                    values[-1] = values[-1].mul(Integer(-1))
+        except Exception as err:
+            # Any error working out a power comes before one in its modulus
+            while powers:
+                base, exponent = powers.pop()
+                try:
+                    base.pow(exponent)
+                except Exception as power_err:
+                    err = power_err
+            raise err
+        return values.pop()
+
+
+class FlatCompiler(Compiler):
+    """
+    Compiles source lines as Compiler does, but adds each line's expression to a
+    FlatTree as soon as it's parsed, so statements hold the index of their
+    expression's root node rather than the expression.
+    """
+
+    def __init__(self, session, tree):
+        super().__init__(session)
+        self.tree = tree
+
+    def parse(self, tokens):
+        parsed = super().parse(tokens)
+        if parsed is None or parsed[2] is None or parsed[0] == "READ":
+            return parsed
+        return parsed[:2] + (self.tree.add(parsed[2]),)
+
+
+class FlatGenerator(CodeGenerator):
+    """
+    Gives each statement compiled by a FlatCompiler a function evaluating its
+    expression in the FlatTree, in place of generated code.
+    """
+
+    def __init__(self, session, tree):
+        self.session = session
+        self.tree = tree
+
+    def function(self, statement):
+        if statement.expr is None:
+            return self.interpreted(statement)
+
+        root = statement.expr
+        evaluate = self.tree.evaluate
+        # Undefined variables raise an error before anything is evaluated, in the
+        # order they appear, as they would when the line is parsed
+        names = tuple(dict.fromkeys(self.tree.names(root)))
+
+        def value(state):
+            v = state.variables
+            for name in names:
+                if name not in v:
+                    variable(state, name)
+            return evaluate(root, v)
+
+        kind = type(statement)
+        if kind is OutputStatement:
+            return lambda state: print(value(state), file=state.output)
+        if kind is AssignStatement:
+            name = statement.name
+
+            def assign(state):
+                state.variables[name] = value(state)
+
+            return assign
+        if kind is RepeatStatement:
+            return lambda state: repeat_count(value(state))
+        check = if_elseif_condition
+        if kind is RepeatUntilStatement:
+            check = repeat_until_condition
+        return lambda state: check(value(state)).value
+
+
+class FlatSession(CompiledSession):
+    """
+    Runs a program compiled as CompiledSession does, but with every expression kept
+    in one FlatTree and evaluated by walking its arrays, rather than as a tree of
+    objects per line, which is compact enough for programs with hundreds of
+    thousands of statements. No types are inferred, so every operation is checked
+    as the interpreter checks it.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        report (file): Unused, as no types are inferred, for the same interface as
+            CompiledSession.
+    """
+
+    def __init__(self, grammar=None, output=None, report=None):
+        super().__init__(grammar, output, report)
+        self.tree = FlatTree()
+
+    def compile(self, input, start_lineno=1):
+        """
+        Compiles a program into a FlatTree.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+
+        Returns:
+            (list): The compiled statements.
+        """
+        self.tree = FlatTree()
+        statements = FlatCompiler(self, self.tree).block(input, start_lineno)
+        self.type_errors = []
+        self.generator = FlatGenerator(self, self.tree)
+        return statements
@@ -0,0 +1,135 @@
+from run import Session
+
+# Events a callback can be registered for, and the arguments it's called with:
+#   statement: (lineno, line) just before a line runs, including loop, 'if' and 'else
+#       if' lines, and a 'repeat until' line each time its condition is checked again
+#   iteration: (lineno, number) just before each iteration of the loop on line lineno
+#   branch: (lineno, taken) once the 'if' on line lineno has picked the line of the
+#       'if', 'else if' or 'else' whose block runs (taken is None if no block runs)
+#   assign: (lineno, name, value) just after a variable is assigned
+#   error: (lineno, error) as an error stops the program
+EVENTS = ("statement", "iteration", "branch", "assign", "error")
+
+
+class Hooks:
+    """
+    Callbacks to be run as a program runs, e.g. for debuggers, coverage or
+    visualisers.
+
+    Running a program with no callbacks registered costs nothing extra, as session()
+    only gives a TracedSession, which calls them, when there are some.
+    """
+
+    def __init__(self):
+        self.callbacks = {event: [] for event in EVENTS}
+
+    def on(self, event, callback=None):
+        """
+        Registers a callback for an event. Callbacks are called in the order they were
+        registered, and an error raised by one stops the program.
+
+        Args:
+            event (string): One of EVENTS.
+            callback (function): Called with the event's arguments. If not given, a
+                decorator registering the function it decorates is returned.
+
+        Returns:
+            (function): The callback.
+        """
+        if event not in self.callbacks:
+            raise ValueError(f"Unknown event '{event}'")
+        if callback is None:
+            return lambda callback: self.on(event, callback)
+        self.callbacks[event].append(callback)
+        return callback
+
+    def remove(self, event, callback):
+        self.callbacks[event].remove(callback)
+
+    def __bool__(self):
+        return any(self.callbacks.values())
+
+    def session(self, grammar=None, output=None):
+        """
+        Returns:
+            (run.Session): A session running programs with these callbacks, or a plain
+                Session if none are registered.
+        """
+        if self:
+            return TracedSession(grammar, output, self)
+        return Session(grammar, output)
+
+
+class _WatchedVariables(dict):
+    # Variables of a traced session, calling the assign callbacks on each assignment
+    __slots__ = ("session",)
+
+    def __setitem__(self, name, value):
+        dict.__setitem__(self, name, value)
+        for callback in self.session.callbacks["assign"]:
+            callback(self.session.lineno, name, value)
+
+
+class TracedSession(Session):
+    """
+    Runs a program exactly as Session does, calling the callbacks registered in a
+    Hooks as it goes. Use Hooks.session() rather than making one directly.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        hooks (Hooks): Callbacks to call. Ones registered after the session is made
+            are called too.
+    """
+
+    def __init__(self, grammar=None, output=None, hooks=None):
+        self.hooks = hooks if hooks is not None else Hooks()
+        self.callbacks = self.hooks.callbacks
+        super().__init__(grammar, output)
+        self.lineno = None  # Line number of the statement running
+
+    def run(self, input, start_lineno=1):
+        try:
+            super().run(input, start_lineno)
+        except Exception as err:
+            for callback in self.callbacks["error"]:
+                callback(self.error_lineno, err)
+            raise
+
+    def new_variables(self, values):
+        # Procedures' variables are watched too
+        variables = _WatchedVariables(values)
+        variables.session = self
+        return variables
+
+    def call_procedure(self, procedure, state):
+        # The line calling the procedure carries on once it returns
+        lineno = self.lineno
+        try:
+            return super().call_procedure(procedure, state)
+        finally:
+            self.lineno = lineno
+
+    def before_iteration(self, lineno, number, state):
+        self.lineno = lineno
+        for callback in self.callbacks["iteration"]:
+            callback(lineno, number)
+
+    def reads_counter(self, name, counts, block, state):
+        # The counter is set every iteration, even if the block doesn't read it, so
+        # assign callbacks see each value
+        return True
+
+    def evaluate_condition(self, tokens, lineno, line, state):
+        # 'else if' lines and conditions evaluated again are statements to callbacks
+        self.begin(lineno, line, state)
+        return super().evaluate_condition(tokens, lineno, line, state)
+
+    def branch(self, lineno, taken, state):
+        for callback in self.callbacks["branch"]:
+            callback(lineno, taken)
+
+    def begin(self, lineno, line, state):
+        self.lineno = lineno
+        for callback in self.callbacks["statement"]:
+            callback(lineno, line)
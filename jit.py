@@ -0,0 +1,419 @@
+from ast_nodes import *
+from compiler import (
+    NAMESPACE,
+    SAMPLES,
+    AssignStatement,
+    CodeGenerator,
+    Compiler,
+    IfStatement,
+    InterpretedStatement,
+    NotCompilable,
+    OutputStatement,
+    ReadStatement,
+    RepeatStatement,
+    RepeatUntilStatement,
+    TypeInference,
+    _Env,
+    variable_names,
+    walk_statements,
+)
+from parser import if_elseif_condition, repeat_until_condition
+from run import Session
+from copy import copy
+
+# Iterations a loop runs on the interpreter before it's compiled
+DEFAULT_THRESHOLD = 100
+
+# Most versions of a loop compiled for different variable types before it's left on
+# the interpreter for good
+MAX_VERSIONS = 4
+
+
+class LoopGenerator(CodeGenerator):
+    """
+    Generates a single Python function running the rest of a loop. Variables which
+    keep the same proven type throughout the loop are held unboxed in Python locals,
+    and only stored back into the program's variables when the function returns.
+
+    Args:
+        session (JitSession): Session running the program.
+        inference (compiler.TypeInference): Types inferred for the loop.
+        promoted (dict): (local name, type) of each variable held in a local.
+    """
+
+    def __init__(self, session, inference, promoted):
+        super().__init__(session, inference)
+        self.promoted = promoted
+        self.constants = []
+        self._raw = {}
+        self.lines = []
+
+    def name_raw(self, node):
+        if node.name in self.promoted:
+            return self.promoted[node.name][0]
+        return super().name_raw(node)
+
+    def name_boxed(self, node):
+        if node.name in self.promoted:
+            local, type_ = self.promoted[node.name]
+            return f"{type_.__name__}({local})"
+        return super().name_boxed(node)
+
+    def emit(self, indent, source):
+        self.lines.append("    " * indent + source)
+
+    def loop(self, statement):
+        """
+        Returns:
+            (string): Python source of a function make(c) giving a function
+                loop(state, session, record, count), which runs the rest of the loop:
+                count more iterations of a 'repeat' loop, or for a 'repeat until' loop,
+                iterations until its condition is met (it must not be met already).
+        """
+        self.emit(0, "def make(c):")
+        self.emit(1, "def loop(state, session, record, count):")
+        self.emit(2, "v = state.variables")
+        for name, (local, type_) in self.promoted.items():
+            self.emit(2, f"{local} = v[{name!r}].value")
+        self.emit(2, "n = 0")
+        self.emit(2, "line = 0")
+        self.emit(2, "try:")
+        if type(statement) is RepeatStatement:
+            self.emit(3, "for _ in range(count):")
+            self.emit(4, "n += 1")
+            self.block(statement.body, 4)
+        else:
+            self.emit(3, "while True:")
+            self.emit(4, "n += 1")
+            self.block(statement.body, 4)
+            self.until(statement, 4)
+        # Errors are reported just as the interpreter would report them
+        self.emit(2, "except BaseException:")
+        self.emit(3, "session.error_at(line, state)")
+        self.emit(3, "raise")
+        self.emit(2, "finally:")
+        for name, (local, type_) in self.promoted.items():
+            self.emit(3, f"v[{name!r}] = {type_.__name__}({local})")
+        self.emit(3, "record.compiled_iterations += n")
+        self.emit(1, "return loop")
+        return "\n".join(self.lines)
+
+    def block(self, statements, indent):
+        if not statements:
+            self.emit(indent, "pass")
+        for statement in statements:
+            self.statement(statement, indent)
+
+    def header(self, statement, indent):
+        # Sets the line for errors, then checks for undefined variables
+        if statement.expr is None:
+            raise NotCompilable("a line in it has a syntax error")
+        self.emit(indent, f"line = {statement.lineno}")
+        for check in self.checks(statement.expr):
+            self.emit(indent, check)
+
+    def until(self, statement, indent):
+        self.header(statement, indent)
+        condition = self.condition(statement.expr, repeat_until_condition)
+        self.emit(indent, f"if {condition}:")
+        self.emit(indent + 1, "break")
+
+    def statement(self, statement, indent):
+        kind = type(statement)
+
+        if kind is IfStatement:
+            if statement.follow_up_lineno is not None:
+                raise NotCompilable("it has an 'else' followed by another 'else'")
+            branches = statement.branches
+            for number, branch in enumerate(branches):
+                self.header(branch, indent)
+                condition = self.condition(branch.expr, if_elseif_condition)
+                self.emit(indent, f"if {condition}:")
+                self.block(branch.body, indent + 1)
+                # Each 'else if' is nested in the previous 'else', so its line can be
+                # set before its condition is evaluated
+                if number < len(branches) - 1 or statement.else_body is not None:
+                    self.emit(indent, "else:")
+                    indent += 1
+            if statement.else_body is not None:
+                self.block(statement.else_body, indent)
+        elif kind is RepeatUntilStatement:
+            self.emit(indent, "while True:")
+            self.until(statement, indent + 1)
+            self.block(statement.body, indent + 1)
+        elif kind is InterpretedStatement:
+            raise NotCompilable("a line in it is left to the interpreter")
+        elif kind is ReadStatement:
+            self.emit(indent, f"line = {statement.lineno}")
+            self.emit(indent, f"Read({statement.names!r}, state).eval()")
+        else:
+            self.header(statement, indent)
+            expr = statement.expr
+            if kind is OutputStatement:
+                self.emit(indent, f"print({self.printed(expr)}, file=state.output)")
+            elif kind is AssignStatement:
+                if statement.name in self.promoted:
+                    local = self.promoted[statement.name][0]
+                    raw = self.raw(expr)
+                    if raw is None:
+                        raw = f"{self.boxed(expr)}.value"
+                    self.emit(indent, f"{local} = {raw}")
+                else:
+                    self.emit(indent, f"v[{statement.name!r}] = {self.boxed(expr)}")
+            elif kind is RepeatStatement:
+                self.emit(indent, f"for _ in range(repeat_count({self.boxed(expr)})):")
+                self.block(statement.body, indent + 1)
+
+
+class LoopRecord:
+    """
+    Profile of a single loop, and any versions of it which have been compiled.
+
+    Args:
+        lineno (int): Line number of the loop's 'repeat' or 'repeat until' statement.
+        kind (string): "repeat" or "repeat until".
+    """
+
+    def __init__(self, lineno, kind):
+        self.lineno = lineno
+        self.kind = kind
+        self.interpreted_iterations = 0
+        self.compiled_iterations = 0
+        self.warm_iterations = 0  # Interpreted since the last version was compiled
+        self.guard_failures = 0
+        self.statement = None  # The loop, once compiled into statements
+        self.names = ()  # Every variable the loop uses
+        self.versions = {}  # Compiled function by the types of the loop's variables
+        self.failure = None  # Why the loop can't be compiled, if it can't
+
+    def signature(self, variables):
+        """
+        Returns:
+            (tuple): The type of each variable the loop uses (NoneType if undefined).
+                A compiled version only runs if this matches exactly, so these are
+                the version's guards.
+        """
+        get = variables.get
+        return tuple(type(get(name)) for name in self.names)
+
+    def enter(self, session, state, guarded):
+        """
+        Called before each iteration run on the interpreter. Counts the iteration,
+        compiles the loop once it's hot, and returns the version compiled for the
+        current variable types if there is one.
+
+        Args:
+            session (JitSession): Session running the program.
+            state (ast_nodes.ParserState): Parser state.
+            guarded (bool): Whether a guard has already failed on this run of the
+                loop, so it isn't counted again.
+
+        Returns:
+            (function): The compiled version, or None to run the iteration on the
+                interpreter.
+        """
+        if self.versions:
+            function = self.versions.get(self.signature(state.variables))
+            if function is not None:
+                return function
+            if not guarded:
+                self.guard_failures += 1
+
+        if (
+            self.warm_iterations >= session.threshold
+            and self.failure is None
+            and len(self.versions) < MAX_VERSIONS
+        ):
+            self.warm_iterations = 0
+            function = self.compile(session, state)
+            if function is not None:
+                return function
+
+        self.interpreted_iterations += 1
+        self.warm_iterations += 1
+        return None
+
+    def compile(self, session, state):
+        """
+        Compiles a version of the loop specialised for the current variable types.
+
+        Returns:
+            (function): The compiled version, or None if the loop can't be compiled.
+        """
+        signature = self.signature(state.variables)
+        env = _Env()
+        for name, type_ in zip(self.names, signature):
+            if type_ in SAMPLES:
+                env.types[name] = type_
+                env.defined.add(name)
+
+        # Types inside the loop are proven from the types on entry, so the guards are
+        # only needed there
+        inference = TypeInference()
+        inference.statement(self.statement, env)
+        head = inference.heads[id(self.statement)]
+
+        # Variables which keep the same type all the way through are held unboxed
+        promoted = {}
+        for name in self.names:
+            type_ = head.types.get(name)
+            if type_ is None or name not in head.defined:
+                continue
+            if all(
+                inference.types.get(id(statement.expr)) is type_
+                for statement in walk_statements(self.statement.body)
+                if type(statement) is AssignStatement and statement.name == name
+            ):
+                promoted[name] = (f"l{len(promoted)}", type_)
+
+        generator = LoopGenerator(session, inference, promoted)
+        try:
+            source = generator.loop(self.statement)
+            namespace = dict(NAMESPACE)
+            exec(source, namespace)
+        except NotCompilable as reason:
+            self.failure = str(reason)
+            return None
+        except (SyntaxError, RecursionError, MemoryError):
+            self.failure = "it's nested too deeply"
+            return None
+
+        function = namespace["make"](tuple(generator.constants))
+        self.versions[signature] = function
+        return function
+
+
+class JitSession(Session):
+    """
+    Runs a program on the interpreter with a tracing tier for hot loops. Each loop
+    counts its iterations, recording the types of its variables as it goes; once it
+    passes the threshold, its block is compiled into a single Python function
+    specialised for those types (see LoopGenerator). The compiled version runs the
+    rest of the loop whenever the loop's variables have the types it was compiled for,
+    and the interpreter runs it otherwise, compiling further versions if the new types
+    stay hot.
+
+    Output, errors and error line numbers are identical to Session's.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        threshold (int): Iterations a loop runs on the interpreter before it's
+            compiled.
+    """
+
+    def __init__(self, grammar=None, output=None, threshold=DEFAULT_THRESHOLD):
+        super().__init__(grammar, output)
+        self.threshold = threshold
+        self.compiler = Compiler(self)
+        self.loops = {}  # LoopRecord by line number
+
+    def loop(self, lineno, kind, header, block, start_lineno):
+        # The loop's record, compiling its block into statements the first time
+        record = self.loops.get(lineno)
+        if record is None:
+            record = self.loops[lineno] = LoopRecord(lineno, kind)
+        if record.statement is None and record.failure is None:
+            expr = None
+            try:
+                if header is not None:
+                    parsed = self.compiler.line(header)
+                    if parsed is None:
+                        record.failure = "its condition has a syntax error"
+                        return record
+                    expr = parsed[2]
+                body = self.compiler.block(block, start_lineno)
+            except NotCompilable as reason:
+                record.failure = str(reason)
+                return record
+            if kind == "repeat":
+                record.statement = RepeatStatement(lineno, header, expr, body)
+            else:
+                record.statement = RepeatUntilStatement(lineno, header, expr, body)
+
+            names = set()
+            if expr is not None:
+                names.update(variable_names(expr))
+            for statement in walk_statements(body):
+                if getattr(statement, "expr", None) is not None:
+                    names.update(variable_names(statement.expr))
+                if type(statement) is AssignStatement:
+                    names.add(statement.name)
+            record.names = tuple(sorted(names))
+        return record
+
+    def repeat(self, repeat_count, repeat_indent_level, input, start_lineno, state):
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input, state)
+        record = self.loop(
+            start_lineno - 1, "repeat", None, repeat_code_block, start_lineno
+        )
+
+        remaining = repeat_count
+        guarded = False
+        while remaining > 0:
+            compiled = record.enter(self, state, guarded)
+            if compiled is not None:
+                compiled(state, self, record, remaining)
+                break
+            guarded = bool(record.versions)
+            self.parse(repeat_code_block, start_lineno, state)
+            remaining -= 1
+
+        return len(repeat_code_block)
+
+    def repeatuntil(
+        self, repeatuntil_condition, repeat_indent_level, input, start_lineno, state
+    ):
+        repeatuntil_tokens = self.lexer.lex(input[0])
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input[1:], state)
+        record = self.loop(
+            start_lineno - 1, "repeat until", input[0], repeat_code_block, start_lineno
+        )
+
+        guarded = False
+        while not repeatuntil_condition.value:
+            compiled = record.enter(self, state, guarded)
+            if compiled is not None:
+                compiled(state, self, record, None)
+                break
+            guarded = bool(record.versions)
+            self.parse(repeat_code_block, start_lineno, state)
+            try:
+                repeatuntil_condition = self.parser.parse(
+                    copy(repeatuntil_tokens), state=state
+                ).eval()
+            except:
+                self.error_at(start_lineno - 1, state)
+                raise
+
+        return len(repeat_code_block)
+
+    def stats(self, file):
+        """
+        Reports each loop which became hot: whether it was compiled, and how many of
+        its iterations ran in the compiled tier.
+
+        Args:
+            file (file): Stream to write the report to.
+        """
+        hot = [
+            record
+            for record in sorted(self.loops.values(), key=lambda record: record.lineno)
+            if record.versions or record.interpreted_iterations >= self.threshold
+        ]
+        if not hot:
+            print(f"JIT: no loop ran more than {self.threshold} times", file=file)
+        for record in hot:
+            total = record.interpreted_iterations + record.compiled_iterations
+            if record.versions:
+                versions = len(record.versions)
+                status = f"compiled ({versions} version{'s' if versions > 1 else ''})"
+            else:
+                status = f"not compiled, as {record.failure}"
+            print(
+                f"JIT: {record.kind} loop on line {record.lineno}: {status}, "
+                f"{record.compiled_iterations} of {total} iterations compiled, "
+                f"{record.guard_failures} guard failure"
+                f"{'' if record.guard_failures == 1 else 's'}",
+                file=file,
+            )
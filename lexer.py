@@ -1,4 +1,12 @@
-from rply import LexerGenerator
+import re
+
+from rply import LexerGenerator, Token
+from rply.errors import LexingError
+from rply.token import SourcePosition
+
+# Token types of features which can give different results each time the same program
+# runs (e.g. reading input), so programs using them are never cached (see cache.py)
+NONDETERMINISTIC = {"READ"}
 
 
 class Lexer:
@@ -44,17 +52,25 @@ class Lexer:
         self.lexer.add("NOT", r"not")
         # Loops
         self.lexer.add("REPEATUNTIL", r"repeat until(?!\w)")
+        self.lexer.add("REPEATFOR", r"repeat for(?!\w)")
         self.lexer.add("REPEAT", r"repeat(?!\w)")
         # Conditional statements
         self.lexer.add("IF", r"if(?!\w)")
         self.lexer.add("ELSEIF", r"(else if)(?!\w)|(but if)(?!\w)|(otherwise if)(?!\w)")
         self.lexer.add("ELSE", r"else(?!\w)|otherwise(?!\w)")
+        # Reading values from input
+        self.lexer.add("READ", r"input(?!\w)|read(?!\w)")
+        # Procedures
+        self.lexer.add("PROCEDURE", r"procedure(?!\w)")
+        self.lexer.add("RETURN", r"return(?!\w)")
         # Variables
         # (Precedence - put all keywords before variable names which would otherwise match)
         self.lexer.add("VARIABLE", "[a-zA-Z_][a-zA-Z0-9_]*")
         # Parentheses
         self.lexer.add("LPAREN", r"\(")
         self.lexer.add("RPAREN", r"\)")
+        # Separates a procedure's parameters, and the values it's called with
+        self.lexer.add("COMMA", r",")
         # Indents
         self.lexer.add("INDENT", r"\t")
         # Newlines
@@ -65,3 +81,186 @@ class Lexer:
     def get_lexer(self):
         self._add_tokens()
         return self.lexer.build()
+
+
+class TokenStream:
+    """
+    Stream of tokens produced by FastLexer, interchangeable with rply's LexerStream.
+    Copying the stream (with copy.copy) gives an independent position in the same
+    tokens.
+
+    Args:
+        tokens (list[rply.Token]): Tokens on the line.
+        error (rply.errors.LexingError): Error to raise once all the tokens have been
+            read, if the line contains a character that can't be lexed. Raised lazily
+            to match rply, which only finds it once it reaches that character.
+    """
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+        self.idx = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.idx < len(self.tokens):
+            token = self.tokens[self.idx]
+            self.idx += 1
+            return token
+        if self.error is not None:
+            raise self.error
+        raise StopIteration
+
+    def __next__(self):
+        return self.next()
+
+
+class FastLexer:
+    """
+    Lexer producing the same tokens (types, values and positions) as the rply lexer
+    built by Lexer, but in a single pass. Instead of trying every rule's regex in turn
+    at each position, one master regex finds the next token, and words are looked up in
+    a keyword table.
+    """
+
+    # Names of the master regex groups that become tokens directly
+    # Rules are in the same order as Lexer._add_tokens, with the ignored patterns
+    # first as rply tries them before any other rule
+    MASTER = re.compile(
+        r"(?P<IGNORE>//.*|[ \r\f\v]+)"
+        r"|(?P<TEXT>(\"\"\".*?\"\"\")|(\".*?\")|('.*?'))"
+        r"|(?P<DECIMAL>\d+\.\d+)"
+        r"|(?P<INTEGER>\d+)"
+        r"|(?P<ADD>\+)"
+        r"|(?P<SUB>-)"
+        r"|(?P<MUL>\*)"
+        r"|(?P<DIV>/)"
+        r"|(?P<POW>\^)"
+        r"|(?P<EQ>=)"
+        r"|(?P<NOTEQ>not=)"
+        r"|(?P<LE><=)"
+        r"|(?P<LT><)"
+        r"|(?P<GE>>=)"
+        r"|(?P<GT>>)"
+        r"|(?P<REPEATUNTIL>repeat until(?!\w))"
+        r"|(?P<REPEATFOR>repeat for(?!\w))"
+        r"|(?P<ELSEIF>(else if|but if|otherwise if)(?!\w))"
+        r"|(?P<WORD>[a-zA-Z_][a-zA-Z0-9_]*)"
+        r"|(?P<LPAREN>\()"
+        r"|(?P<RPAREN>\))"
+        r"|(?P<COMMA>,)"
+        r"|(?P<INDENT>\t)"
+        r"|(?P<NEWLINE>\n)"
+    )
+
+    # Group names which differ from their token types
+    GROUP_TOKENS = {
+        "EQ": "=",
+        "NOTEQ": "NOT=",
+        "LE": "<=",
+        "LT": "<",
+        "GE": ">=",
+        "GT": ">",
+    }
+
+    # Whole-word keywords (case sensitive, except conditions which are handled apart)
+    KEYWORDS = {
+        "output": "OUTPUT",
+        "print": "OUTPUT",
+        "say": "OUTPUT",
+        "mod": "MOD",
+        "and": "AND",
+        "or": "OR",
+        "not": "NOT",
+        "repeat": "REPEAT",
+        "if": "IF",
+        "else": "ELSE",
+        "otherwise": "ELSE",
+        "input": "READ",
+        "read": "READ",
+        "procedure": "PROCEDURE",
+        "return": "RETURN",
+    }
+
+    # rply matches these keywords without (?!\w), so they are split off the front of
+    # longer words (e.g. 'order' is lexed as OR and then VARIABLE 'der')
+    PREFIX_KEYWORDS = (("and", "AND"), ("or", "OR"), ("not", "NOT"))
+
+    # Any word character, including non-ASCII ones which VARIABLE doesn't match
+    WORD_CHAR = re.compile(r"\w")
+
+    def lex(self, s):
+        """
+        Lexes a string.
+
+        Args:
+            s (string): String to lex, usually a single line of code.
+
+        Returns:
+            (TokenStream): The tokens found.
+        """
+        tokens = []
+        error = None
+        match_master = self.MASTER.match
+        group_tokens = self.GROUP_TOKENS
+        length = len(s)
+        idx = 0
+        lineno = 1
+        colno = 1
+        last_nl = -1
+
+        while idx < length:
+            match = match_master(s, idx)
+            if match is None:
+                error = LexingError(None, SourcePosition(idx, lineno, colno))
+                break
+
+            group = match.lastgroup
+            end = match.end()
+            if group == "IGNORE":
+                idx = end
+                continue
+
+            value = match.group()
+            if group == "WORD":
+                name, value = self._word(s, value, end)
+                end = idx + len(value)
+            else:
+                name = group_tokens.get(group, group)
+
+            colno = idx - last_nl
+            tokens.append(Token(name, value, SourcePosition(idx, lineno, colno)))
+            if name == "NEWLINE":
+                lineno += 1
+                last_nl = idx
+            idx = end
+
+        return TokenStream(tokens, error)
+
+    def _word(self, s, word, end):
+        """
+        Finds the token at the start of a word.
+
+        Args:
+            s (string): String being lexed.
+            word (string): Word matched by the master regex.
+            end (int): Index in s just after the word.
+
+        Returns:
+            (tuple): Token type and the part of the word it covers.
+        """
+        # Keywords must not be followed by any other word character
+        if end >= len(s) or not self.WORD_CHAR.match(s, end):
+            name = self.KEYWORDS.get(word)
+            if name is not None:
+                return name, word
+            if word.lower() in ("true", "false"):
+                return "CONDITION", word
+
+        for prefix, name in self.PREFIX_KEYWORDS:
+            if word.startswith(prefix):
+                return name, prefix
+
+        return "VARIABLE", word
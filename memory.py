@@ -0,0 +1,212 @@
+import gc
+import sys
+import tracemalloc
+
+from ast_nodes import (
+    BinaryOp,
+    Call,
+    CallName,
+    CallStatement,
+    Condition,
+    Decimal,
+    Definition,
+    DoNothing,
+    Integer,
+    Name,
+    Output,
+    Read,
+    Return,
+    Text,
+    UnaryOp,
+    Variable,
+)
+from hooks import Hooks
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Values counted on their own, and syntax tree nodes, which are counted together
+VALUE_TYPES = (Integer, Decimal, Text, Condition)
+AST_NODES = (
+    BinaryOp,
+    UnaryOp,
+    Output,
+    Variable,
+    Name,
+    Read,
+    Call,
+    CallStatement,
+    CallName,
+    Return,
+    Definition,
+    DoNothing,
+)
+
+# Live objects are counted again each time traced memory grows by this much since
+# they were last counted, so the last count is close to the peak
+COUNT_GROWTH = 1.25
+
+
+def format_size(size):
+    """
+    Args:
+        size (int): Number of bytes.
+
+    Returns:
+        (string): The size in the largest unit it's at least one of, e.g. "1.5 MB".
+    """
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            break
+        size /= 1024
+    if unit == "bytes":
+        return f"{size} bytes"
+    return f"{size:.1f} {unit}"
+
+
+def peak_resident():
+    """
+    Returns:
+        (int): Most memory the process has had resident in RAM, in bytes. None if it
+            can't be found on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def count_objects():
+    """
+    Counts the live values of each type, and syntax tree nodes.
+
+    Returns:
+        (dict): (number, bytes used by their Python values) for the name of each of
+            VALUE_TYPES, and for "AST nodes".
+    """
+    counts = {kind.__name__: [0, 0] for kind in VALUE_TYPES}
+    counts["AST nodes"] = [0, 0]
+    for obj in gc.get_objects():
+        kind = type(obj)
+        if kind in VALUE_TYPES:
+            count = counts[kind.__name__]
+            count[0] += 1
+            count[1] += sys.getsizeof(obj) + sys.getsizeof(obj.value)
+        elif isinstance(obj, AST_NODES):
+            count = counts["AST nodes"]
+            count[0] += 1
+            count[1] += sys.getsizeof(obj)
+    return {name: tuple(count) for name, count in counts.items()}
+
+
+class MemoryProfile:
+    """
+    Measures the memory a program uses as it runs: the most resident and traced by
+    tracemalloc, the number of values and syntax tree nodes alive near the peak, and
+    which lines of the program grew traced memory the most.
+
+    Tracing slows programs down a lot, so it's only on for sessions made by session(),
+    between start() and stop().
+
+    Args:
+        top (int): Number of lines to report.
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.lineno = None  # Line number of the statement running
+        self.lines = {}  # Source line of each line number run
+        self.grown = {}  # Bytes traced memory grew by while each line ran
+        self.runs = {}  # Times each line ran
+        self.current = 0  # Traced memory when the statement running started
+        self.peak = 0
+        self.peak_lineno = None  # Line running when traced memory peaked
+        self.counted_at = 0  # Traced memory when objects were last counted
+        self.counts = None  # As count_objects() returns, near the peak
+        self.end_counts = None
+        self.end_current = 0
+
+    def session(self, grammar=None, output=None):
+        """
+        Returns:
+            (hooks.TracedSession): A session running programs on the interpreter
+                which keeps track of the line running.
+        """
+        hooks = Hooks()
+        hooks.on("statement", self.statement)
+        return hooks.session(grammar, output)
+
+    def start(self):
+        tracemalloc.start()
+        self.current = tracemalloc.get_traced_memory()[0]
+
+    def stop(self):
+        self.measure()
+        self.end_current = self.current
+        self.end_counts = count_objects()
+        tracemalloc.stop()
+
+    def statement(self, lineno, line):
+        self.measure()
+        self.lineno = lineno
+        self.lines[lineno] = line.strip()
+        self.runs[lineno] = self.runs.get(lineno, 0) + 1
+
+    def measure(self):
+        # Puts the memory used since the last statement started down to its line
+        current, peak = tracemalloc.get_traced_memory()
+        if self.lineno is not None and current > self.current:
+            self.grown[self.lineno] = (
+                self.grown.get(self.lineno, 0) + current - self.current
+            )
+        if peak > self.peak:
+            self.peak = peak
+            self.peak_lineno = self.lineno
+        if current > self.counted_at * COUNT_GROWTH:
+            self.counts = count_objects()
+            self.counted_at = current
+            # Leave out what counting used
+            current = tracemalloc.get_traced_memory()[0]
+        self.current = current
+
+    def report(self, file=None):
+        """
+        Prints what was measured.
+
+        Args:
+            file (file): Stream to print to. Defaults to sys.stderr.
+        """
+        file = file if file is not None else sys.stderr
+        resident = peak_resident()
+        print("Memory:", file=file)
+        if resident is not None:
+            print(f"  Peak resident: {format_size(resident)}", file=file)
+        peak = f"  Peak traced: {format_size(self.peak)}"
+        if self.peak_lineno is not None:
+            peak += f", while line {self.peak_lineno} ran"
+        print(peak, file=file)
+        print(f"  Traced at the end: {format_size(self.end_current)}", file=file)
+
+        for title, counts in (
+            (f"near the peak ({format_size(self.counted_at)} traced)", self.counts),
+            ("at the end", self.end_counts),
+        ):
+            if counts is None:
+                continue
+            print(f"  Live objects {title}:", file=file)
+            for name, (number, size) in counts.items():
+                print(f"    {name}: {number} ({format_size(size)})", file=file)
+
+        grown = sorted(self.grown.items(), key=lambda item: -item[1])[: self.top]
+        if grown:
+            print("  Lines growing traced memory the most:", file=file)
+            for lineno, size in grown:
+                runs = self.runs[lineno]
+                print(
+                    f"    line {lineno}: {format_size(size)} over {runs} "
+                    f"run{'s' if runs != 1 else ''}: {self.lines[lineno]}",
+                    file=file,
+                )
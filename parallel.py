@@ -0,0 +1,367 @@
+import multiprocessing
+import os
+import pickle
+import sys
+from multiprocessing.connection import wait
+
+from compiler import (
+    Compiler,
+    IfStatement,
+    ReadStatement,
+    RepeatStatement,
+    RepeatUntilStatement,
+    statement_spans,
+    variable_names,
+    walk_statements,
+)
+from run import Session, find_indent_level
+from copy import copy
+
+
+def accesses(statement, lexer):
+    """
+    Finds the variables a top-level statement reads and assigns, including in any
+    blocks nested inside it.
+
+    Args:
+        statement: Compiled statement (see compiler.Compiler).
+        lexer: Lexer, for lines which couldn't be parsed.
+
+    Returns:
+        (tuple): Set of names of the variables read, and set of names assigned.
+    """
+    reads = set()
+    writes = set()
+    for each in walk_statements([statement]):
+        if type(each) is IfStatement:
+            continue
+        if each.expr is not None:
+            reads.update(variable_names(each.expr))
+            if hasattr(each, "name"):
+                writes.add(each.name)
+        else:
+            # A line with a syntax error may still look up the variables on it before
+            # the error is found, so it's taken to read and assign all of them
+            for token in lexer.lex(each.line):
+                if token.gettokentype() == "VARIABLE":
+                    reads.add(token.getstr())
+                    writes.add(token.getstr())
+    return reads, writes
+
+
+def dependency_graph(accesses):
+    """
+    Works out which statements have to run after which others: a statement depends on
+    the last earlier statement to assign each variable it reads or assigns, and on
+    every statement reading a variable since then which it assigns.
+
+    Args:
+        accesses (list): (reads, writes) of each top-level statement, in order.
+
+    Returns:
+        (list[set]): Indices of the earlier statements each statement depends on.
+    """
+    graph = []
+    last_write = {}  # Index of the last statement to assign each variable
+    readers = {}  # Indices of the statements to read each variable since then
+    for index, (reads, writes) in enumerate(accesses):
+        depends = set()
+        for name in reads | writes:
+            if name in last_write:
+                depends.add(last_write[name])
+        for name in writes:
+            depends.update(readers.pop(name, ()))
+            last_write[name] = index
+        for name in reads - writes:
+            readers.setdefault(name, []).append(index)
+        graph.append(depends)
+    return graph
+
+
+def independent_regions(graph):
+    """
+    Splits a program into regions which share no variables, so that running each on
+    its own gives the same results as running them all in order.
+
+    Args:
+        graph (list[set]): As dependency_graph() returns.
+
+    Returns:
+        (list[list]): Indices of the statements in each region, in order, with the
+            regions in order of their first statement.
+    """
+    parents = list(range(len(graph)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for index, depends in enumerate(graph):
+        for earlier in depends:
+            parents[find(index)] = find(earlier)
+
+    regions = {}
+    for index in range(len(graph)):
+        regions.setdefault(find(index), []).append(index)
+    return sorted(regions.values())
+
+
+def _weight(statement):
+    # Rough cost of running a top-level statement: loops are what take the time
+    loops = 0
+    for each in walk_statements([statement]):
+        if type(each) is RepeatStatement or type(each) is RepeatUntilStatement:
+            loops += 1
+    return loops
+
+
+class _RegionOutput:
+    """
+    Output stream of a worker process, which sends what each statement prints back to
+    the parent process separately, so it can be put back in source order.
+    """
+
+    def __init__(self, conn, indices):
+        self.conn = conn
+        self.indices = indices  # Index in the program of each statement run
+        self.index = indices[0]
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def flush(self):
+        pass
+
+    def begin(self, position):
+        if self.indices[position] != self.index:
+            self.send()
+            self.index = self.indices[position]
+
+    def send(self, *error):
+        self.conn.send(("output", self.index, "".join(self.parts)) + error)
+        self.parts = []
+
+
+def _error_payload(err):
+    # Enough to raise an identical exception in the parent, even for exceptions which
+    # can't be rebuilt from their args
+    payload = (type(err), err.args, dict(err.__dict__))
+    try:
+        pickle.dumps(payload)
+    except Exception:
+        payload = (RuntimeError, (f"{type(err).__name__}: {err}",), {})
+    return payload
+
+
+def _rebuild_error(payload):
+    kind, args, attributes = payload
+    try:
+        err = kind(*args)
+    except Exception:
+        err = kind.__new__(kind)
+        err.args = args
+    err.__dict__.update(attributes)
+    return err
+
+
+def _worker_main(conn, engine, grammar, input, spans, indices, start_lineno):
+    """
+    Runs one worker's share of a program, sending back what each statement prints and
+    the error that stopped it, if any.
+    """
+    output = _RegionOutput(conn, indices)
+    session = engine(grammar, output)
+    try:
+        session.run_statements(input, spans, output.begin, start_lineno)
+    except Exception as err:
+        output.send(session.error_lineno, _error_payload(err))
+    else:
+        output.send()
+        conn.send(("done",))
+    conn.close()
+
+
+class ParallelSession(Session):
+    """
+    Runs a program's independent regions at the same time in worker processes.
+
+    The program is compiled (without running it) to find its top-level statements and
+    the variables each reads and assigns. Statements sharing variables, directly or
+    through other statements, form a region, and regions with loops in them are shared
+    out between the workers (regions without loops go with them, as they're quick).
+    Each worker runs its statements in order and sends back what each one printed,
+    which is printed here in source order as soon as everything before it has been.
+
+    Output, errors and error line numbers are identical to running the program on a
+    single session. Programs with fewer than two regions with loops, or whose
+    structure can't be compiled, are run on a single session.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+        workers (int): Most worker processes to use. Defaults to the number of CPUs.
+        engine (function): Makes the session the program (or each worker's share of
+            it) runs on, given the grammar and output stream. Defaults to Session.
+    """
+
+    def __init__(self, grammar=None, output=None, workers=None, engine=Session):
+        super().__init__(grammar, output)
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.regions = []  # Indices of the top-level statements in each region
+
+    def run(self, input, start_lineno=1):
+        """
+        Runs a program, splitting it between worker processes if it's worth it.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+        """
+        shares = self.split(input, start_lineno)
+        if shares is None:
+            session = self.engine(self.grammar, self.state.output)
+            session.state.input = self.state.input
+            self.state = session.state
+            try:
+                session.run(input, start_lineno)
+            finally:
+                self.error_lineno = session.error_lineno
+            return
+        self.run_shares(input, shares, start_lineno)
+
+    def split(self, input, start_lineno=1):
+        """
+        Finds the program's regions and shares them out between the workers.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+
+        Returns:
+            (list): For each worker, (index of first line, index after last line)
+                of each statement it runs, and the index of each statement in the
+                program. None if the program isn't worth running in parallel.
+        """
+        try:
+            statements = Compiler(self).block(input, start_lineno)
+        except Exception:
+            return None
+        if not statements:
+            return None
+        # Values have to be read in order, by one process
+        if any(type(each) is ReadStatement for each in walk_statements(statements)):
+            return None
+
+        spans = statement_spans(statements, len(input), start_lineno)
+        for start, end in spans:
+            if find_indent_level(copy(self.lexer.lex(input[start]))):
+                return None  # Indented top-level statements are left to the session
+
+        graph = dependency_graph(
+            [accesses(statement, self.lexer) for statement in statements]
+        )
+        self.regions = independent_regions(graph)
+        weights = [
+            sum(_weight(statements[index]) for index in region)
+            for region in self.regions
+        ]
+        heavy = sum(1 for weight in weights if weight > 0)
+        if heavy < 2 or self.workers < 2:
+            return None
+
+        # Heaviest regions first, each onto the worker with the least to do
+        count = min(heavy, self.workers)
+        loads = [0] * count
+        owned = [[] for _ in range(count)]
+        for weight, region in sorted(
+            zip(weights, self.regions), key=lambda item: -item[0]
+        ):
+            worker = loads.index(min(loads))
+            loads[worker] += weight
+            owned[worker].extend(region)
+
+        shares = []
+        for indices in owned:
+            indices.sort()
+            shares.append(([spans[index] for index in indices], indices))
+        return shares
+
+    def run_shares(self, input, shares, start_lineno=1):
+        """
+        Runs each worker's share of a program and prints what each statement printed,
+        in source order, raising the error that would have stopped the program.
+
+        Args:
+            input (list): Array containing each line of code input.
+            shares (list): As split() returns.
+            start_lineno (int): Line number of the first line.
+        """
+        # Workers are forked, so they start with the grammar and program already built.
+        # Anything still buffered would be printed again by each of them
+        sys.stdout.flush()
+        sys.stderr.flush()
+        context = multiprocessing.get_context("fork")
+        processes = []
+        conns = []
+        for spans, indices in shares:
+            conn, child_conn = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_worker_main,
+                args=(
+                    child_conn,
+                    self.engine,
+                    self.grammar,
+                    input,
+                    spans,
+                    indices,
+                    start_lineno,
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            processes.append(process)
+            conns.append(conn)
+
+        printed = {}  # What each statement printed, until everything before it has been
+        next_index = 0
+        error = None  # (index, line number, payload) of the first error so far
+        try:
+            waiting = list(conns)
+            while waiting:
+                for conn in wait(waiting):
+                    try:
+                        message = conn.recv()
+                    except EOFError:
+                        waiting.remove(conn)
+                        continue
+                    if message[0] == "done":
+                        waiting.remove(conn)
+                        continue
+                    index, text = message[1], message[2]
+                    printed[index] = text
+                    if len(message) > 3:
+                        waiting.remove(conn)
+                        if error is None or index < error[0]:
+                            error = (index, message[3], message[4])
+
+                while next_index in printed:
+                    print(printed.pop(next_index), end="", file=self.state.output)
+                    if error is not None and next_index == error[0]:
+                        # Nothing after the error would have run
+                        self.error_lineno = error[1]
+                        raise _rebuild_error(error[2])
+                    next_index += 1
+
+            if error is not None or next_index < sum(len(share[1]) for share in shares):
+                raise RuntimeError("A worker process stopped unexpectedly")
+        finally:
+            for conn in conns:
+                conn.close()
+            for process in processes:
+                process.kill()
+                process.join()
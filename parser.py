@@ -1,5 +1,148 @@
-from rply import ParserGenerator
-from ast import *
+from rply import ParserGenerator, Token
+from ast_nodes import *
+
+# A list of precedence rules with ascending precedence, to disambiguate ambiguous
+# production rules
+PRECEDENCE = [
+    ("left", ["AND", "OR"]),
+    ("left", ["NOT"]),
+    ("left", ["=", "NOT=", "<=", "<", ">=", ">"]),
+    ("left", ["ADD", "SUB"]),
+    ("left", ["MUL", "DIV", "MOD"]),
+    ("left", ["POW"]),
+]
+
+# Node built by each binary operator
+BINARY_OPERATORS = {
+    "ADD": Add,
+    "SUB": Sub,
+    "MUL": Mul,
+    "DIV": Div,
+    "POW": Pow,
+    "MOD": Mod,
+    "=": Equals,
+    "NOT=": NotEquals,
+    "<=": LessThanEquals,
+    "<": LessThan,
+    ">=": GreaterThanEquals,
+    ">": GreaterThan,
+    "AND": And,
+    "OR": Or,
+}
+
+# Node built by each prefix operator
+UNARY_OPERATORS = {"NOT": Not, "ADD": UnaryAdd, "SUB": UnarySub}
+
+
+# Words which separate the parts of a 'repeat for' statement, e.g.
+# 'repeat for i from 1 to 9 step 2'
+RANGE_WORDS = ("from", "to", "step")
+
+
+# Semantic actions shared by both parsers, so they behave and fail identically
+def assign(state, name, expr):
+    state.variables[name] = expr.eval()
+    return expr
+
+
+def if_elseif_condition(expr):
+    expr = expr.eval()
+    if type(expr) is not Condition:
+        raise SyntaxError(
+            "You must follow 'if', 'else if', and/or 'else' with a condition"
+        )
+    return expr
+
+
+def repeat_until_condition(expr):
+    expr = expr.eval()
+    if type(expr) is not Condition:
+        raise SyntaxError("You must follow 'repeat until' with a condition")
+    return expr
+
+
+def repeat_count(expr):
+    expr = expr.eval()
+    if type(expr) is not Integer:
+        raise SyntaxError("You must follow 'repeat' with an integer")
+
+    repeat_count = expr.value
+    if repeat_count <= 0:
+        raise SyntaxError("You must repeat 1 or more times")
+    return repeat_count
+
+
+def repeat_range(name, start, stop, step=None):
+    # Values counted through by 'repeat for', as plain integers
+    start = start.eval()
+    stop = stop.eval()
+    step = step.eval() if step is not None else Integer(1)
+    if type(start) is not Integer or type(stop) is not Integer or type(step) is not Integer:
+        raise SyntaxError("You must count from, to and step by integers in 'repeat for'")
+    if step.value == 0:
+        raise SyntaxError("You must step by 1 or more, or -1 or less")
+
+    # Counts up to and including 'to', or down to it if step is negative
+    stop = stop.value + (1 if step.value > 0 else -1)
+    return name, range(start.value, stop, step.value)
+
+
+def range_words(words):
+    # Words of a 'repeat for' statement, which are only keywords in that statement
+    for token, word in zip(words, RANGE_WORDS):
+        if token.getstr() != word:
+            unexpected(token)
+
+
+def integer_literal(string):
+    return Integer(int(string))
+
+
+def decimal_literal(string):
+    return Decimal(float(string))
+
+
+def text_literal(string):
+    return Text(string.strip("\"'"))  # Strip " or '
+
+
+def condition_literal(string):
+    return Condition(True if string.lower() == "true" else False)
+
+
+def variable(state, name):
+    # Cannot return value of a variable if it isn't defined
+    if state.variables.get(name, None) is None:
+        raise ValueError(f"Variable {name} is not yet defined.")
+
+    # Otherwise return value
+    return Variable(state.variables[name])
+
+
+def call(state, name, arguments):
+    # Cannot call a procedure if it isn't defined
+    procedure = state.procedures.get(name, None)
+    if procedure is None:
+        raise ValueError(f"Procedure {name} is not yet defined.")
+
+    return Call(procedure, arguments, state.output)
+
+
+def read_values(state, names):
+    return Read(names, state)
+
+
+def return_value(state, expr):
+    if state.procedure is None:
+        raise SyntaxError("You can only 'return' from inside a procedure")
+    return Return(expr)
+
+
+def unexpected(token):
+    # Generic error message
+    raise ValueError(
+        f"Ran into a {token.gettokentype()} token where it wasn't expected."
+    )
 
 
 class Parser:
@@ -14,10 +157,14 @@ class Parser:
                 "OUTPUT",
                 "CONDITION",
                 "REPEATUNTIL",
+                "REPEATFOR",
                 "REPEAT",
                 "IF",
                 "ELSEIF",
                 "ELSE",
+                "READ",
+                "PROCEDURE",
+                "RETURN",
                 "VARIABLE",
                 "ADD",
                 "SUB",
@@ -36,19 +183,11 @@ class Parser:
                 "NOT",
                 "LPAREN",
                 "RPAREN",
+                "COMMA",
                 "NEWLINE",
                 "$end",
             ],
-            # A list of precedence rules with ascending precedence, to disambiguate
-            # ambiguous production rules
-            precedence=[
-                ("left", ["AND", "OR"]),
-                ("left", ["NOT"]),
-                ("left", ["=", "NOT=", "<=", "<", ">=", ">"]),
-                ("left", ["ADD", "SUB"]),
-                ("left", ["MUL", "DIV", "MOD"]),
-                ("left", ["POW"]),
-            ],
+            precedence=PRECEDENCE,
         )
 
     def parse(self):
@@ -58,22 +197,16 @@ class Parser:
 
         @self.pg.production("statement : OUTPUT expression")
         def statement_output(state, p):
-            return Output(p[1])
+            return Output(p[1], state.output)
 
         @self.pg.production("statement : VARIABLE = expression")
         def statement_assignment(state, p):
-            state.variables[p[0].getstr()] = p[2].eval()
-            return p[2]
+            return assign(state, p[0].getstr(), p[2])
 
         @self.pg.production("statement : IF expression")
         @self.pg.production("statement : ELSEIF expression")
         def statement_if_elseif(state, p):
-            expr = p[1].eval()
-            if type(expr) is not Condition:
-                raise SyntaxError(
-                    "You must follow 'if', 'else if', and/or 'else' with a condition"
-                )
-            return expr
+            return if_elseif_condition(p[1])
 
         @self.pg.production("statement : ELSE")
         def statement_else(state, p):
@@ -81,21 +214,49 @@ class Parser:
 
         @self.pg.production("statement : REPEATUNTIL expression")
         def statement_repeat_until(state, p):
-            expr = p[1].eval()
-            if type(expr) is not Condition:
-                raise SyntaxError("You must follow 'repeat until' with a condition")
-            return expr
+            return repeat_until_condition(p[1])
 
         @self.pg.production("statement : REPEAT expression")
         def statement_repeat(state, p):
-            expr = p[1].eval()
-            if type(expr) is not Integer:
-                raise SyntaxError("You must follow 'repeat' with an integer")
+            return repeat_count(p[1])
+
+        @self.pg.production(
+            "statement : REPEATFOR VARIABLE VARIABLE expression VARIABLE expression"
+        )
+        @self.pg.production(
+            "statement : REPEATFOR VARIABLE VARIABLE expression VARIABLE expression "
+            "VARIABLE expression"
+        )
+        def statement_repeat_for(state, p):
+            range_words(p[2::2])
+            step = p[7] if len(p) == 8 else None
+            return repeat_range(p[1].getstr(), p[3], p[5], step)
+
+        @self.pg.production("statement : READ names")
+        def statement_read(state, p):
+            return read_values(state, p[1])
+
+        @self.pg.production("statement : PROCEDURE VARIABLE LPAREN RPAREN")
+        @self.pg.production("statement : PROCEDURE VARIABLE LPAREN names RPAREN")
+        def statement_procedure(state, p):
+            parameters = p[3] if len(p) == 5 else []
+            return Definition(p[1].getstr(), parameters)
 
-            repeat_count = expr.value
-            if repeat_count <= 0:
-                raise SyntaxError("You must repeat 1 or more times")
-            return repeat_count
+        # Names of the variables read into, or of a procedure's parameters
+        @self.pg.production("names : VARIABLE")
+        @self.pg.production("names : names COMMA VARIABLE")
+        def names(state, p):
+            if len(p) == 1:
+                return [p[0].getstr()]
+            return p[0] + [p[2].getstr()]
+
+        @self.pg.production("statement : RETURN expression")
+        def statement_return(state, p):
+            return return_value(state, p[1])
+
+        @self.pg.production("statement : call")
+        def statement_call(state, p):
+            return CallStatement(p[0])
 
         @self.pg.production("terminator : $end")
         @self.pg.production("statement : terminator")
@@ -188,35 +349,370 @@ class Parser:
 
         @self.pg.production("expression : INTEGER")
         def expression_integer(state, p):
-            return Integer(int(p[0].getstr()))
+            return integer_literal(p[0].getstr())
 
         @self.pg.production("expression : DECIMAL")
         def expression_decimal(state, p):
-            return Decimal(float(p[0].getstr()))
+            return decimal_literal(p[0].getstr())
 
         @self.pg.production("expression : TEXT")
         def expression_text(state, p):
-            return Text(p[0].getstr().strip("\"'"))  # Strip " or '
+            return text_literal(p[0].getstr())
 
         @self.pg.production("expression : CONDITION")
         def expression_condition(state, p):
-            return Condition(True if p[0].getstr().lower() == "true" else False)
+            return condition_literal(p[0].getstr())
 
         @self.pg.production("expression : VARIABLE")
         def expression_variable(state, p):
-            # Cannot return value of a variable if it isn't defined
-            if state.variables.get(p[0].getstr(), None) is None:
-                raise ValueError(f"Variable {p[0].getstr()} is not yet defined.")
+            return variable(state, p[0].getstr())
+
+        @self.pg.production("expression : call")
+        def expression_call(state, p):
+            return p[0]
+
+        @self.pg.production("call : VARIABLE LPAREN RPAREN")
+        @self.pg.production("call : VARIABLE LPAREN arguments RPAREN")
+        def call_procedure(state, p):
+            arguments = p[2] if len(p) == 4 else []
+            return call(state, p[0].getstr(), arguments)
 
-            # Otherwise return value
-            return Variable(state.variables[p[0].getstr()])
+        @self.pg.production("arguments : expression")
+        @self.pg.production("arguments : arguments COMMA expression")
+        def arguments(state, p):
+            if len(p) == 1:
+                return [p[0]]
+            return p[0] + [p[2]]
 
         @self.pg.error
         def error_handle(state, token):
-            # Generic error message
-            raise ValueError(
-                f"Ran into a {token.gettokentype()} token where it wasn't expected."
-            )
+            unexpected(token)
 
     def get_parser(self):
         return self.pg.build()
+
+
+class PrattParser:
+    """
+    Hand-written precedence climbing parser, interchangeable with the LALR parser built
+    from Parser: it has the same parse(tokenizer, state) interface, builds the same
+    ast_nodes and raises the same errors, but looks operators up directly in the
+    precedence table instead of running RPly's generic driver and production callbacks.
+    """
+
+    # Token returned once the tokenizer runs out, as RPly does
+    END = Token("$end", "$end")
+
+    # Statements which are followed by a single expression, and how to handle it
+    EXPRESSION_STATEMENTS = {
+        "IF": if_elseif_condition,
+        "ELSEIF": if_elseif_condition,
+        "REPEATUNTIL": repeat_until_condition,
+        "REPEAT": repeat_count,
+    }
+
+    LITERALS = {
+        "INTEGER": integer_literal,
+        "DECIMAL": decimal_literal,
+        "TEXT": text_literal,
+        "CONDITION": condition_literal,
+    }
+
+    # Tokens other than binary operators which can follow an expression (a VARIABLE
+    # can, as the words of 'repeat for' are variables to the lexer). RPly only looks a
+    # variable up once it has seen the token after it (which may start a procedure
+    # call), so a variable followed by anything else is a syntax error before the
+    # variable is looked up
+    EXPRESSION_FOLLOW = {"COMMA", "RPAREN", "VARIABLE", "NEWLINE", "$end"}
+
+    def __init__(self):
+        # Binding power of each operator is its level in the precedence table
+        levels = {}
+        for level, (_, token_types) in enumerate(PRECEDENCE, start=1):
+            for token_type in token_types:
+                levels[token_type] = level
+
+        self.binary_powers = {
+            token_type: levels[token_type] for token_type in BINARY_OPERATORS
+        }
+        # A prefix operator's operand takes in any operator binding more tightly than
+        # the prefix operator itself
+        self.unary_powers = {
+            token_type: levels[token_type] + 1 for token_type in UNARY_OPERATORS
+        }
+
+    # Build the nodes for a variable reference and a procedure call
+    variable = staticmethod(variable)
+    call = staticmethod(call)
+
+    def parse(self, tokenizer, state=None):
+        """
+        Parses a single line.
+
+        Args:
+            tokenizer (rply.lexer.LexerStream): Tokens on the line.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            The same result the LALR parser's productions would have returned.
+        """
+        tokens = _TokenCursor(tokenizer)
+        token_type, name, expr = self.statement(tokens, state)
+
+        if token_type == "OUTPUT":
+            result = Output(expr, state.output)
+        elif token_type == "VARIABLE":
+            result = assign(state, name, expr)
+        elif token_type == "CALL":
+            result = CallStatement(expr)
+        elif token_type == "RETURN":
+            result = return_value(state, expr)
+        elif token_type == "PROCEDURE":
+            result = Definition(name, expr)
+        elif token_type == "READ":
+            result = read_values(state, expr)
+        elif token_type == "REPEATFOR":
+            result = repeat_range(name, *expr)
+        elif token_type in self.EXPRESSION_STATEMENTS:
+            result = self.EXPRESSION_STATEMENTS[token_type](expr)
+        else:
+            result = DoNothing()
+
+        self._end_of_line(tokens)
+        return result
+
+    def statement(self, tokens, state):
+        """
+        Parses a statement up to the end of the statement, without running it.
+
+        Args:
+            tokens (_TokenCursor): Tokens being parsed.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            (tuple): Type of the statement's first token ("CALL" for a procedure
+                called on its own), the name of the variable assigned to (for
+                assignments) or the procedure defined, and the statement's expression
+                (for statements which have one), the procedure's parameters, the
+                names of the variables read into, or the counter's name and the
+                expressions it counts from, to and steps by (None if there's no step)
+                for a 'repeat for'.
+        """
+        token = tokens.peek()
+        token_type = token.gettokentype()
+        name = expr = None
+
+        if (
+            token_type == "OUTPUT"
+            or token_type == "RETURN"
+            or token_type in self.EXPRESSION_STATEMENTS
+        ):
+            tokens.advance()
+            expr = self.expression(tokens, state, 1)
+        elif token_type == "VARIABLE":
+            tokens.advance()
+            if tokens.peek().gettokentype() == "LPAREN":
+                token_type = "CALL"
+                expr = self.procedure_call(tokens, state, token.getstr())
+            else:
+                if tokens.peek().gettokentype() != "=":
+                    unexpected(tokens.peek())
+                tokens.advance()
+                name = token.getstr()
+                expr = self.expression(tokens, state, 1)
+        elif token_type == "PROCEDURE":
+            tokens.advance()
+            name = self.expect(tokens, "VARIABLE").getstr()
+            self.expect(tokens, "LPAREN")
+            expr = []
+            if tokens.peek().gettokentype() != "RPAREN":
+                expr = self.names(tokens)
+            self.expect(tokens, "RPAREN")
+        elif token_type == "READ":
+            tokens.advance()
+            expr = self.names(tokens)
+        elif token_type == "REPEATFOR":
+            tokens.advance()
+            name = self.expect(tokens, "VARIABLE").getstr()
+            words = [self.expect(tokens, "VARIABLE")]
+            start = self.expression(tokens, state, 1)
+            words.append(self.expect(tokens, "VARIABLE"))
+            stop = self.expression(tokens, state, 1)
+            step = None
+            if tokens.peek().gettokentype() == "VARIABLE":
+                words.append(tokens.peek())
+                tokens.advance()
+                step = self.expression(tokens, state, 1)
+            # Checked once the whole statement is parsed, as RPly does
+            range_words(words)
+            expr = (start, stop, step)
+        elif token_type == "ELSE" or token_type == "NEWLINE":
+            tokens.advance()
+        elif token_type != "$end":
+            unexpected(token)
+
+        self._end_of_statement(tokens)
+        return token_type, name, expr
+
+    def expect(self, tokens, token_type):
+        # The next token, which must be of the given type
+        token = tokens.peek()
+        if token.gettokentype() != token_type:
+            unexpected(token)
+        tokens.advance()
+        return token
+
+    def names(self, tokens):
+        # Names separated by commas
+        names = [self.expect(tokens, "VARIABLE").getstr()]
+        while tokens.peek().gettokentype() == "COMMA":
+            tokens.advance()
+            names.append(self.expect(tokens, "VARIABLE").getstr())
+        return names
+
+    def procedure_call(self, tokens, state, name):
+        """
+        Parses the values a procedure is called with, from the opening parenthesis
+        after its name to the closing one.
+
+        Args:
+            tokens (_TokenCursor): Tokens being parsed.
+            state (ast_nodes.ParserState): Parser state.
+            name (string): Name of the procedure.
+
+        Returns:
+            The call's node.
+        """
+        self.expect(tokens, "LPAREN")
+        arguments = []
+        if tokens.peek().gettokentype() != "RPAREN":
+            arguments.append(self.expression(tokens, state, 1))
+            while tokens.peek().gettokentype() == "COMMA":
+                tokens.advance()
+                arguments.append(self.expression(tokens, state, 1))
+        self.expect(tokens, "RPAREN")
+        return self.call(state, name, arguments)
+
+    def _end_of_statement(self, tokens):
+        # Statements can only be followed by a newline or the end of the line
+        token_type = tokens.peek().gettokentype()
+        if token_type != "NEWLINE" and token_type != "$end":
+            unexpected(tokens.peek())
+
+    def _end_of_line(self, tokens):
+        # Any number of trailing newlines, then the end of the line
+        while tokens.peek().gettokentype() == "NEWLINE":
+            tokens.advance()
+        if tokens.peek().gettokentype() != "$end":
+            unexpected(tokens.peek())
+
+    def expression(self, tokens, state, min_power):
+        """
+        Parses an expression, stopping at the first binary operator which binds less
+        tightly than min_power.
+
+        Args:
+            tokens (_TokenCursor): Tokens being parsed.
+            state (ast_nodes.ParserState): Parser state.
+            min_power (int): Minimum binding power of operators to take in.
+
+        Returns:
+            The expression's node.
+        """
+        token = tokens.peek()
+        token_type = token.gettokentype()
+        tokens.advance()
+
+        # Prefix: literal, variable, parenthesised expression or prefix operator
+        if token_type in self.LITERALS:
+            left = self.LITERALS[token_type](token.getstr())
+        elif token_type == "VARIABLE":
+            next_type = tokens.peek().gettokentype()
+            if next_type == "LPAREN":
+                left = self.procedure_call(tokens, state, token.getstr())
+            else:
+                if (
+                    next_type not in self.binary_powers
+                    and next_type not in self.EXPRESSION_FOLLOW
+                ):
+                    unexpected(tokens.peek())
+                left = self.variable(state, token.getstr())
+        elif token_type == "LPAREN":
+            left = self.expression(tokens, state, 1)
+            if tokens.peek().gettokentype() != "RPAREN":
+                unexpected(tokens.peek())
+            tokens.advance()
+        elif token_type in UNARY_OPERATORS:
+            operand = self.expression(tokens, state, self.unary_powers[token_type])
+            left = UNARY_OPERATORS[token_type](operand)
+        else:
+            unexpected(token)
+
+        # Infix: all binary operators are left associative
+        binary_powers = self.binary_powers
+        while True:
+            token_type = tokens.peek().gettokentype()
+            power = binary_powers.get(token_type)
+            if power is None or power < min_power:
+                return left
+            tokens.advance()
+            right = self.expression(tokens, state, power + 1)
+            left = BINARY_OPERATORS[token_type](left, right)
+
+
+class SyntaxParser(PrattParser):
+    """
+    Parses a line without running any of it, for compiling programs before they run.
+    Variables and procedure calls become Name and CallName nodes rather than being
+    looked up, so nothing depends on the program's state. Fails on exactly the lines
+    the other parsers fail on, apart from variables and procedures which aren't defined
+    yet and 'return' outside a procedure.
+    """
+
+    @staticmethod
+    def variable(state, name):
+        return Name(name)
+
+    @staticmethod
+    def call(state, name, arguments):
+        return CallName(name, arguments)
+
+    def parse(self, tokenizer, state=None):
+        """
+        Parses a single line.
+
+        Args:
+            tokenizer (rply.lexer.LexerStream): Tokens on the line.
+            state: Unused, for the same interface as the other parsers.
+
+        Returns:
+            (tuple): As PrattParser.statement().
+        """
+        tokens = _TokenCursor(tokenizer)
+        statement = self.statement(tokens, state)
+        self._end_of_line(tokens)
+        return statement
+
+
+class _TokenCursor:
+    """
+    One token of lookahead over a token stream. Tokens are only read from the stream
+    when needed, so lexing errors surface at the same point as with RPly.
+    """
+
+    __slots__ = ("tokenizer", "token")
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.token = None
+
+    def peek(self):
+        if self.token is None:
+            try:
+                self.token = next(self.tokenizer)
+            except StopIteration:
+                self.token = PrattParser.END
+        return self.token
+
+    def advance(self):
+        self.token = None
@@ -0,0 +1,210 @@
+import sys
+from collections import OrderedDict
+
+from ast_nodes import Decimal, ParserState
+from lexer import NONDETERMINISTIC
+
+# Most results each pure procedure keeps, dropping the least recently used
+MEMO_SIZE = 10000
+
+# Most procedure calls which can be running at once, e.g. a procedure calling itself
+MAX_CALL_DEPTH = 1000
+
+# Python's recursion limit. Each procedure call takes around ten Python frames, and
+# more inside nested blocks, so the default of 1000 would be reached long before
+# MAX_CALL_DEPTH. It's raised once, when the interpreter is imported, rather than
+# while a program runs, so every session in a process sees the same limit
+RECURSION_LIMIT = 20000
+if sys.getrecursionlimit() < RECURSION_LIMIT:
+    sys.setrecursionlimit(RECURSION_LIMIT)
+
+# Marks a result which isn't kept, as None is a result (no value returned)
+_MISSING = object()
+
+
+def value_key(value):
+    """
+    Returns:
+        (tuple): Key identifying a value, which is equal for two values only if a
+            procedure given either would give the same result.
+    """
+    if type(value) is Decimal:
+        # Tells 0.0 from -0.0, which are equal
+        return Decimal, repr(value.value)
+    return type(value), value.value
+
+
+class Procedure:
+    """
+    A procedure defined by a program. Calls run its block on the session which defined
+    it, with a scope of its own holding its parameters and any variables it assigns;
+    the program's variables can't be read or assigned from inside it.
+
+    A procedure is pure if it doesn't print anything, use anything in
+    lexer.NONDETERMINISTIC or call a procedure which isn't pure, so its result only
+    depends on the values it's called with. The results of pure procedures are kept
+    (up to MEMO_SIZE for each procedure), so calling one again with the same values
+    gives the result straight back.
+
+    Args:
+        name (string): Name of the procedure.
+        parameters (list): Names of its parameters.
+        lines (list): Lines of its block.
+        start_lineno (int): Line number of the block's first line.
+        session (run.Session): Session running the program.
+        procedures (dict): Every procedure the program has defined, by name.
+    """
+
+    def __init__(self, name, parameters, lines, start_lineno, session, procedures):
+        self.name = name
+        self.parameters = parameters
+        self.lines = lines
+        self.start_lineno = start_lineno
+        self.session = session
+        self.procedures = procedures
+        self.calls = 0
+        self.hits = 0  # Calls given a kept result
+        self.misses = 0  # Calls of a pure procedure which had to run it
+        self.memo = OrderedDict()
+        self.impure = None  # Why the procedure isn't pure, once it's been worked out
+        self.checked = False
+
+        # What the block does itself, found from its tokens
+        self.effect = None  # Why the block itself isn't pure, if it isn't
+        self.callees = []  # Names of the procedures it calls
+        try:
+            for line in lines:
+                previous = None
+                for token in session.lexer.lex(line):
+                    token_type = token.gettokentype()
+                    if self.effect is None:
+                        if token_type == "OUTPUT":
+                            self.effect = "prints"
+                        elif token_type in NONDETERMINISTIC:
+                            self.effect = f"uses '{token.getstr()}'"
+                    if token_type == "LPAREN" and previous is not None:
+                        if previous.gettokentype() == "VARIABLE":
+                            self.callees.append(previous.getstr())
+                    previous = token
+        except Exception:
+            self.effect = "has a line which can't be lexed"
+
+    @property
+    def pure(self):
+        if not self.checked:
+            self.impure = self.impurity()
+            self.checked = True
+        return self.impure is None
+
+    def impurity(self):
+        """
+        Returns:
+            (string): Why the procedure isn't pure, or None if it is.
+        """
+        # Every procedure it could end up calling
+        seen = {self.name}
+        waiting = [self]
+        while waiting:
+            procedure = waiting.pop()
+            if procedure.effect is not None:
+                if procedure is self:
+                    return f"it {procedure.effect}"
+                return f"it calls {procedure.name}, which {procedure.effect}"
+            for name in procedure.callees:
+                if name in seen:
+                    continue
+                seen.add(name)
+                callee = self.procedures.get(name)
+                if callee is None:
+                    return f"it calls {name}, which isn't defined yet"
+                waiting.append(callee)
+        return None
+
+    def forget(self):
+        # Called whenever a procedure is defined, which can change what this one does
+        self.memo.clear()
+        self.impure = None
+        self.checked = False
+
+    def call(self, arguments, output=None):
+        """
+        Calls the procedure.
+
+        Args:
+            arguments (list): Values to call it with.
+            output (file): Stream it prints to.
+
+        Returns:
+            The value it returned, or None if it didn't return one.
+        """
+        if len(arguments) != len(self.parameters):
+            raise TypeError(
+                f"Procedure {self.name} takes {len(self.parameters)} "
+                f"value{'' if len(self.parameters) == 1 else 's'}, but was given "
+                f"{len(arguments)}."
+            )
+        self.calls += 1
+
+        pure = self.pure
+        if pure:
+            key = tuple(value_key(argument) for argument in arguments)
+            result = self.memo.get(key, _MISSING)
+            if result is not _MISSING:
+                self.hits += 1
+                self.memo.move_to_end(key)
+                return result
+            self.misses += 1
+
+        if self.session.call_depth >= MAX_CALL_DEPTH:
+            raise RecursionError(
+                f"Too much recursion: procedure {self.name} was called with "
+                f"{MAX_CALL_DEPTH} procedure calls already running."
+            )
+        state = ParserState(output)
+        state.variables = self.session.new_variables(
+            zip(self.parameters, arguments)
+        )
+        state.procedures = self.procedures
+        state.procedure = self
+        state.input = self.session.state.input
+        self.session.call_depth += 1
+        try:
+            result = self.session.call_procedure(self, state)
+        finally:
+            self.session.call_depth -= 1
+
+        if pure:
+            self.memo[key] = result
+            if len(self.memo) > MEMO_SIZE:
+                self.memo.popitem(last=False)
+        return result
+
+
+def stats(procedures, file):
+    """
+    Reports how many times each procedure was called, and for pure procedures, how
+    many calls were given a kept result.
+
+    Args:
+        procedures (dict): Procedures by name, as in ast_nodes.ParserState.
+        file (file): Stream to write the report to.
+    """
+    if not procedures:
+        print("Procedures: none defined", file=file)
+    for procedure in procedures.values():
+        if not procedure.calls:
+            status = "never called"
+        elif procedure.pure:
+            kept = len(procedure.memo)
+            status = (
+                f"pure, {procedure.calls} call{'' if procedure.calls == 1 else 's'}, "
+                f"{procedure.hits} hit{'' if procedure.hits == 1 else 's'}, "
+                f"{procedure.misses} miss{'' if procedure.misses == 1 else 'es'}, "
+                f"{kept} result{'' if kept == 1 else 's'} kept"
+            )
+        else:
+            status = (
+                f"not memoized, as {procedure.impure}, {procedure.calls} "
+                f"call{'' if procedure.calls == 1 else 's'}"
+            )
+        print(f"Procedure {procedure.name}: {status}", file=file)
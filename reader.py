@@ -0,0 +1,98 @@
+import re
+
+from ast_nodes import Text
+from parser import condition_literal, decimal_literal, integer_literal, text_literal
+
+# Characters of input read at a time, unless the input is typed in as the program runs
+BLOCK_SIZE = 1 << 16
+
+# Each literal a line of input can be, as lexer.Lexer matches it (numbers may also be
+# negative), and the rule in parser.py which gives its value
+LITERALS = (
+    (re.compile(r"-?\d+\.\d+"), decimal_literal),
+    (re.compile(r"-?\d+"), integer_literal),
+    (re.compile(r"(?i)true|false"), condition_literal),
+    (re.compile(r'"""(?:(?!""").)*"""|"[^"]*"|\'[^\']*\''), text_literal),
+)
+
+
+def convert(line):
+    """
+    Converts a line of input to a value, as the literal it looks like would be in a
+    program. Anything else becomes text, as it is.
+
+    Args:
+        line (string): The line, with or without its newline.
+
+    Returns:
+        (ast_nodes.Integer, ast_nodes.Decimal, ast_nodes.Text or ast_nodes.Condition):
+            The value.
+    """
+    line = line.strip()
+    for pattern, literal in LITERALS:
+        if pattern.fullmatch(line):
+            return literal(line)
+    return Text(line)
+
+
+class InputReader:
+    """
+    Reads the values a program reads, one from each line of a file. Lines are read a
+    block at a time, so reading a long column of values doesn't cost a read from the
+    file for every value, and are only converted once they are read by the program.
+    Input typed in as the program runs is read a line at a time instead.
+
+    Args:
+        file (file): Text stream to read from, e.g. sys.stdin.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.lines = []  # Lines read from the file, but not yet by the program
+        self.next = 0  # Index in lines of the next line to read
+        self.position = 0  # Values read by the program so far
+
+    def read(self, count):
+        """
+        Reads values.
+
+        Args:
+            count (int): Number of values to read.
+
+        Returns:
+            (list): The values.
+        """
+        values = []
+        while len(values) < count:
+            if self.next == len(self.lines) and not self._fill():
+                raise EOFError("There is no more input to read.")
+            end = min(len(self.lines), self.next + count - len(values))
+            values.extend(convert(line) for line in self.lines[self.next : end])
+            self.next = end
+        self.position += count
+        return values
+
+    def skip(self, count):
+        """
+        Skips over values, e.g. those read before a checkpoint was saved.
+
+        Args:
+            count (int): Number of values to skip.
+        """
+        while count > 0:
+            if self.next == len(self.lines) and not self._fill():
+                raise EOFError("There is no more input to read.")
+            skipped = min(len(self.lines) - self.next, count)
+            self.next += skipped
+            self.position += skipped
+            count -= skipped
+
+    def _fill(self):
+        # Reads the next lines from the file, returning whether there were any
+        if self.file.isatty():
+            line = self.file.readline()
+            self.lines = [line] if line else []
+        else:
+            self.lines = self.file.readlines(BLOCK_SIZE)
+        self.next = 0
+        return bool(self.lines)
@@ -1,38 +1,58 @@
-from lexer import Lexer
-from ast import ParserState
-from parser import Parser
+from lexer import FastLexer, Lexer
+from ast_nodes import Integer, ParserState, Returned
+import ast_nodes
+from parser import Parser, PrattParser
+import procedures
+from reader import InputReader
+from source import MappedSource, SourceLines
+from array import array
+import argparse
+import atexit
 import logging
+import math
+import os
+import re
 import sys
 from copy import copy
 import time
 
+# Ways of running a program: Session, compiler.CompiledSession, jit.JitSession,
+# flat.FlatSession or stack.StackSession
+ENGINES = ("interpreter", "typed", "jit", "flat", "stack")
+
+ELSE_FOLLOW_UP_ERROR = (
+    "You cannot follow 'else' with another 'else' or 'else if' statement"
+)
+
+
 # Parse functions
 def next_token_type_is(tokens, type):
     """
     Returns whether the next token type is as specified.
 
     Args:
-        tokens (rply.lexer.LexerStream): LexerStream object containing a line of lexed 
-            tokens. This should be a *copy* of the original object, as tokens are 
+        tokens (rply.lexer.LexerStream): LexerStream object containing a line of lexed
+            tokens. This should be a *copy* of the original object, as tokens are
             discarded once read.
         type (string): String to match token type.
-    
+
     Returns:
-        (bool): If the token type matches 'type'.
+        (bool): If the token type matches 'type'. False if there are no more tokens.
     """
-    return next(tokens).gettokentype() == type
+    token = next(tokens, None)
+    return token is not None and token.gettokentype() == type
 
 
 def find_indent_level(tokens):
     """
-    Finds the indent level of a line based on the number of INDENT tokens preceding 
+    Finds the indent level of a line based on the number of INDENT tokens preceding
     other tokens.
 
     Args:
-        tokens (rply.lexer.LexerStream): LexerStream object containing a line of lexed 
-            tokens. This should be a *copy* of the original object, as tokens are 
+        tokens (rply.lexer.LexerStream): LexerStream object containing a line of lexed
+            tokens. This should be a *copy* of the original object, as tokens are
             discarded once read.
-    
+
     Returns:
         (int): Indent level of the current line. Returns None if line is empty.
     """
@@ -48,404 +68,1455 @@ def find_indent_level(tokens):
         return None
 
 
-def get_indent_block(initial_indent_level, input, state):
+def dedent_block(input, block_length):
     """
-    Returns a list of the code that is within an indentation block, for use in parsing 
-    loops and control flow.
+    Removes the first preceding \t INDENT token from each line at the start of the
+    input, to give the lines of an indentation block.
 
     Args:
-        initial_indent_level (int): The initial indent level which the code has to 
-            return to for the block to be complete.
-        input (list): Sliced array containing the lines of code starting with the block.
-        state (ast.ParserState): Parser state.
-    
+        input (list): Lines of code starting with the block. May also be a
+            source.SourceLines view, in which case a view is returned rather than
+            copying the lines.
+        block_length (int): Number of lines in the block.
+
     Returns:
         (list): The lines of code within the indentation block.
     """
-    indent_block = []
-    previous_indent_level = initial_indent_level
-    current_indent_level = 0
-
-    for line in input:
-        tokens = lexer.lex(line)
-        current_indent_level = find_indent_level(copy(tokens))
-
-        # If the current line is empty, let current indent level be equal to the
-        # previous indent level
-        if current_indent_level is None:
-            current_indent_level = previous_indent_level
-
-        if current_indent_level > initial_indent_level:
-            # Remove first preceding \t INDENT token and append to repeat block
-            # By removing only the first token, code indented once can be run by parse()
-            # as if the indent level was 0
-            # Code indented more than once is expected to be in a REPEAT loop, so the
-            # function is then recursively called again to parse nested loops
-            indent_block.append(line.replace("\t", "", 1))
-        else:
-            # Return the list once current indent level returns to the initial indent level
-            return indent_block
+    if isinstance(input, SourceLines):
+        return input.indent_block(block_length)
+    return [line.replace("\t", "", 1) for line in input[:block_length]]
 
-        previous_indent_level = current_indent_level
 
-    # Return list if it ends up being the same as the input
-    # This occurs for certain scenarios with deeply nested indent-using statements
-    return indent_block
+def dedent_line(line, dedent):
+    """
+    Removes the first \t from a line dedent times, as dedent_block() does to a line
+    in a block nested dedent levels deep.
+    """
+    if line.startswith("\t" * dedent):
+        return line[dedent:]
+    for _ in range(dedent):
+        line = line.replace("\t", "", 1)
+    return line
 
 
-def repeat(repeat_count, repeat_indent_level, input, start_lineno, state):
+def block_ends(levels):
     """
-    Performs a REPEAT loop for the parse() function.
+    Finds where the indent block after each line ends, as Session.get_indent_block()
+    would, for every line at once.
 
     Args:
-        repeat_count (int): Number of times to repeat the code block.
-        repeat_indent_level (int): The indent level of the preceding REPEAT statement.
-        input (list): Sliced array passed from parse(), containing the lines of code 
-            after the REPEAT line.
-        start_lineno (int): Line number of the first line passed to the function, for 
-            error messages.
-        state (ast.ParserState): Parser state.
-    
+        levels (list): Indent level of each line, None for empty lines.
+
     Returns:
-        (int): Number of lines within the repeat block, which parse() will have to skip.
+        (array): Index of the first line after the block that follows each line (the
+            number of lines if it runs to the end).
     """
-    repeat_code_block = get_indent_block(repeat_indent_level, input, state)
-
-    for i in range(repeat_count):
-        parse(repeat_code_block, start_lineno, state)
+    ends = array("l", [len(levels)]) * len(levels)
+    pending = []  # Lines whose blocks haven't ended, by increasing indent level
+    level = 0
+    for idx, current in enumerate(levels):
+        # An empty line is at the level of the line before it
+        if current is not None:
+            level = current
+        while pending and levels[pending[-1]] >= level:
+            ends[pending.pop()] = idx
+        if current is not None:
+            pending.append(idx)
+    return ends
+
+
+def check_definition(name, parameters, in_procedure):
+    """
+    Raises a SyntaxError if a procedure can't be defined.
 
-    return len(repeat_code_block)
+    Args:
+        name (string): The procedure's name.
+        parameters (list): Names of the procedure's parameters.
+        in_procedure (bool): Whether the definition is in another procedure's block.
+    """
+    if in_procedure:
+        raise SyntaxError("You cannot define a procedure inside another procedure")
+    for idx, parameter in enumerate(parameters):
+        if parameter in parameters[:idx]:
+            raise SyntaxError(f"Procedure {name} has two parameters called {parameter}")
 
 
-def repeatuntil(repeat_indent_level, input, start_lineno, state):
+def box_counter(name, counts, block, state):
     """
-    Performs a REPEATUNTIL loop for the parse() function.
+    Finds whether each iteration of a 'repeat for' loop has to set its counter. A
+    block which never mentions the counter can't read it (procedures can't see the
+    program's variables), so the counter is only set once, to its last value, rather
+    than being boxed in a new Integer every iteration.
 
     Args:
-        repeat_indent_level (int): The indent level of the preceding REPEAT statement.
-        input (list): Sliced array passed from parse(), containing the lines of code 
-            including and after the REPEAT line.
-        start_lineno (int): Line number of the first line passed to the function, for 
-            error messages.
-        state (ast.ParserState): Parser state.
-    
+        name (string): Name of the counter.
+        counts (range): Values the counter counts through.
+        block (list): Lines of the loop's block.
+        state (ast_nodes.ParserState): Parser state.
+
     Returns:
-        (int): Number of lines within the repeat block, which parse() will have to skip.
+        (bool): Whether the counter must be set before each iteration.
     """
-    # Keep tokens within repeat statement for further parsing to check if conditions are met
-    repeatuntil_tokens = lexer.lex(input[0])
-    # Skip over repeat line
-    repeat_code_block = get_indent_block(repeat_indent_level, input[1:], state)
+    word = re.compile(rf"\b{name}\b")
+    if any(word.search(line) for line in block):
+        return True
+    if counts:
+        state.variables[name] = Integer(counts[-1])
+    return False
 
-    # Parse REPEATUNTIL condition to gauge if it is satisfied or not
-    repeatuntil_condition = parser.parse(copy(repeatuntil_tokens), state=state).eval()
-    # Perform loop while condition is not met
-    while not repeatuntil_condition.value:  # Check Python bool, not Traversal bool
-        parse(repeat_code_block, start_lineno, state)
-        repeatuntil_condition = parser.parse(
-            copy(repeatuntil_tokens), state=state
-        ).eval()
 
-    return len(repeat_code_block)
+class Grammar:
+    """
+    The built lexer and parser. Neither holds any per-program state (that all lives in
+    the ParserState passed through each parse), so a single Grammar can be shared
+    read-only by any number of sessions, including sessions running on other threads.
 
+    Args:
+        lexer_backend (string): "rply" for the lexer built by RPly, or "fast" for the
+            single-pass FastLexer. Both produce identical tokens.
+        parser_backend (string): "rply" for the LALR parser built by RPly, or "pratt"
+            for the hand-written PrattParser. Both give identical results and errors.
+    """
+
+    __slots__ = ("lexer", "parser")
+
+    LEXER_BACKENDS = ("rply", "fast")
+    PARSER_BACKENDS = ("rply", "pratt")
+
+    def __init__(self, lexer_backend="rply", parser_backend="rply"):
+        if lexer_backend == "rply":
+            lexer = Lexer().get_lexer()
+        elif lexer_backend == "fast":
+            lexer = FastLexer()
+        else:
+            raise ValueError(f"Unknown lexer backend '{lexer_backend}'")
+
+        if parser_backend == "rply":
+            pg = Parser()
+            pg.parse()
+            parser = pg.get_parser()
+        elif parser_backend == "pratt":
+            parser = PrattParser()
+        else:
+            raise ValueError(f"Unknown parser backend '{parser_backend}'")
 
-def if_elseif_else(if_indent_level, input, start_lineno, state):
+        object.__setattr__(self, "lexer", lexer)
+        object.__setattr__(self, "parser", parser)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Grammar objects are read-only")
+
+
+class Session:
     """
-    Store IF...ELSE IF... ELSE conditional statements before passing to the 
-    parse_if_elseif_else() function.
+    Runs a single Traversal program. All per-program state (variables, output and
+    input) is kept on the session, so sessions sharing one Grammar can run
+    concurrently. Programs read from stdin, unless state.input is replaced with
+    another reader.InputReader.
 
     Args:
-        if_indent_level (int): The indent level of the preceding IF statement 
-            (and thus ELSE IF and ELSE statements)
-        input (list): Sliced array passed from parse(), containing the lines of code 
-            including and after the IF line.
-        start_lineno (int): Line number of the first line passed to the function, for 
-            error messages.
-        state (ast.ParserState): Parser state.
-    
-    Returns:
-        (int): Number of lines within the if... else if... else block, which parse() 
-            will have to skip. Returned from calling parse_if_eliseif_else().
+        grammar (Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
     """
-    # Keep track of number of condition statements to calculate how many lines to skip later on
-    conditional_statements_length = 1  # Already found one 'if' statement
 
-    # Setting up storage of 'if' and 'else' information
-    if_code_block = []
-    else_code_block = []
+    def __init__(self, grammar=None, output=None):
+        self.grammar = grammar if grammar is not None else Grammar()
+        self.lexer = self.grammar.lexer
+        self.parser = self.grammar.parser
+        self.state = ParserState(output)
+        self.state.variables = self.new_variables({})
+        self.state.input = InputReader(sys.stdin)
+        self.error_lineno = None  # Line number of the statement that raised an error
+        self.reported = None  # Error whose line number has been reported
+        self.call_depth = 0  # Procedure calls running
+
+    def run(self, input, start_lineno=1):
+        """
+        Runs a program.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno (int): Line number of the first line.
+        """
+        self.parse(input, start_lineno, self.state)
+
+    def run_statements(self, input, spans, begin, start_lineno=1):
+        """
+        Runs some of a program's top-level statements in order, skipping the rest, e.g.
+        one worker's share of a program run by parallel.ParallelSession.
+
+        Args:
+            input (list): Array containing each line of code input.
+            spans (list): (index of first line, index after last line) of each
+                top-level statement to run, in order.
+            begin (function): Called with the position in spans of each statement
+                just before it runs.
+            start_lineno (int): Line number of the first line.
+        """
+        for position, (start, end) in enumerate(spans):
+            begin(position)
+            self.parse(input[start:end], start_lineno + start, self.state)
+
+    def new_variables(self, values):
+        """
+        Makes the variables of a new scope: the program's, or a procedure call's.
+
+        Args:
+            values (dict): Variables the scope starts with, by name, or their
+                (name, value) pairs.
+
+        Returns:
+            (dict): The scope's variables.
+        """
+        return dict(values)
+
+    def error_at(self, lineno, state):
+        """
+        Reports the line number of an error which is about to be raised.
+
+        Args:
+            lineno (int): Line number of the statement that caused the error.
+            state (ast_nodes.ParserState): Parser state.
+        """
+        # A 'return' leaving the blocks it's in isn't an error, and an error raised in
+        # a procedure has already been reported at its line there, not the call's
+        error = sys.exc_info()[1]
+        if error is not None:
+            if type(error) is Returned or error is self.reported:
+                return
+            self.reported = error
+
+        self.error_lineno = lineno
+        print(f"On line {lineno}:", end=" ", file=state.output)
+
+    def get_indent_block(self, initial_indent_level, input, state):
+        """
+        Returns a list of the code that is within an indentation block, for use in parsing
+        loops and control flow.
+
+        Args:
+            initial_indent_level (int): The initial indent level which the code has to
+                return to for the block to be complete.
+            input (list): Sliced array containing the lines of code starting with the block.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            (list): The lines of code within the indentation block.
+        """
+        block_length = 0
+        previous_indent_level = initial_indent_level
+        current_indent_level = 0
+
+        for line in input:
+            tokens = self.lexer.lex(line)
+            current_indent_level = find_indent_level(copy(tokens))
+
+            # If the current line is empty, let current indent level be equal to the
+            # previous indent level
+            if current_indent_level is None:
+                current_indent_level = previous_indent_level
+
+            if current_indent_level > initial_indent_level:
+                # Remove first preceding \t INDENT token and append to repeat block
+                # By removing only the first token, code indented once can be run by parse()
+                # as if the indent level was 0
+                # Code indented more than once is expected to be in a REPEAT loop, so the
+                # function is then recursively called again to parse nested loops
+                block_length += 1
+            else:
+                # Return the list once current indent level returns to the initial indent level
+                return dedent_block(input, block_length)
+
+            previous_indent_level = current_indent_level
+
+        # Return list if it ends up being the same as the input
+        # This occurs for certain scenarios with deeply nested indent-using statements
+        return dedent_block(input, block_length)
+
+    def repeat(
+        self,
+        repeat_count,
+        repeat_indent_level,
+        input,
+        start_lineno,
+        state,
+        resumed=None,
+    ):
+        """
+        Performs a REPEAT loop for the parse() method.
+
+        Args:
+            repeat_count (int): Number of times to repeat the code block.
+            repeat_indent_level (int): The indent level of the preceding REPEAT statement.
+            input (list): Sliced array passed from parse(), containing the lines of code
+                after the REPEAT line.
+            start_lineno (int): Line number of the first line passed to the function, for
+                error messages.
+            state (ast_nodes.ParserState): Parser state.
+            resumed (int): Number of an iteration which is already running, to carry on
+                from (see repeat_blocks()). None by default.
+
+        Returns:
+            (int): Number of lines within the repeat block, which parse() will have to skip.
+                Returned from calling run_blocks().
+        """
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input, state)
+
+        return self.run_blocks(
+            self.repeat_blocks(
+                repeat_count, repeat_code_block, start_lineno, state, resumed
+            ),
+            len(repeat_code_block),
+            state,
+        )
+
+    def repeatuntil(
+        self,
+        repeatuntil_condition,
+        repeat_indent_level,
+        input,
+        start_lineno,
+        state,
+        resumed=None,
+    ):
+        """
+        Performs a REPEATUNTIL loop for the parse() method.
+
+        Args:
+            repeatuntil_condition (ast_nodes.Condition): The condition, as parse()
+                found it before the first iteration.
+            repeat_indent_level (int): The indent level of the preceding REPEAT statement.
+            input (list): Sliced array passed from parse(), containing the lines of code
+                including and after the REPEAT line.
+            start_lineno (int): Line number of the first line passed to the function, for
+                error messages.
+            state (ast_nodes.ParserState): Parser state.
+            resumed (int): Number of an iteration which is already running, to carry on
+                from (see repeatuntil_blocks()). None by default.
+
+        Returns:
+            (int): Number of lines within the repeat block, which parse() will have to skip.
+                Returned from calling run_blocks().
+        """
+        # Keep tokens within repeat statement for further parsing to check if conditions are met
+        repeatuntil_tokens = self.lexer.lex(input[0])
+        # Skip over repeat line
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input[1:], state)
+
+        return self.run_blocks(
+            self.repeatuntil_blocks(
+                repeatuntil_condition,
+                repeatuntil_tokens,
+                input[0],
+                repeat_code_block,
+                start_lineno,
+                state,
+                resumed,
+            ),
+            len(repeat_code_block),
+            state,
+        )
+
+    def repeatfor(
+        self,
+        name,
+        counts,
+        repeat_indent_level,
+        input,
+        start_lineno,
+        state,
+        resumed=None,
+    ):
+        """
+        Performs a REPEATFOR loop for the parse() method.
+
+        Args:
+            name (string): Name of the counter.
+            counts (range): Values the counter counts through, as parse() found them
+                before the first iteration.
+            repeat_indent_level (int): The indent level of the preceding REPEAT
+                statement.
+            input (list): Sliced array passed from parse(), containing the lines of code
+                after the REPEAT line.
+            start_lineno (int): Line number of the first line passed to the function, for
+                error messages.
+            state (ast_nodes.ParserState): Parser state.
+            resumed (int): Number of an iteration which is already running, to carry on
+                from (see repeatfor_blocks()). None by default.
+
+        Returns:
+            (int): Number of lines within the repeat block, which parse() will have to skip.
+                Returned from calling run_blocks().
+        """
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input, state)
+
+        return self.run_blocks(
+            self.repeatfor_blocks(
+                name, counts, repeat_code_block, start_lineno, state, resumed
+            ),
+            len(repeat_code_block),
+            state,
+        )
 
-    # Setting up storage of 'else if' information (there may be multiple 'else if' blocks)
-    elseif_pos = []  # Array of all pointers for 'else if' statements
-    elseif_tokens = []  # 2D array of all 'else if' statement tokens
-    elseif_code_blocks = []  # 2D array of all 'else if' code blocks
+    def run_blocks(self, blocks, lines_skipped, state):
+        """
+        Runs the blocks of a loop or 'if' statement, for repeat(), repeatuntil(),
+        repeatfor() and parse_if_elseif_else(). Other sessions override this to run
+        blocks in their own ways, e.g. as generators.
+
+        Args:
+            blocks (iterable): Gives (block, line number of its first line) each time a
+                block is to run, in order: one of repeat_blocks(), repeatuntil_blocks(),
+                repeatfor_blocks() or if_blocks().
+            lines_skipped (int): Number of lines within the statement's blocks.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            (int): lines_skipped, which parse() will have to skip.
+        """
+        for block, start_lineno in blocks:
+            self.parse(block, start_lineno, state)
 
-    # Storing 'if' information
-    if_pos = 0
-    if_tokens = lexer.lex(input[if_pos])
-    if_code_block = get_indent_block(if_indent_level, input[if_pos + 1 :], state)
+        return lines_skipped
 
-    # Next pointer for a conditional statement (either 'else if' or 'else' statement)
-    next_pos = if_pos + len(if_code_block) + 1
-    try:
-        next_tokens = lexer.lex(input[next_pos])
-    # End of input list, only parse 'if' statement
-    except IndexError:
-        return parse_if_elseif_else(
-            start_lineno, state, conditional_statements_length, if_tokens, if_code_block
+    def repeat_blocks(self, repeat_count, block, start_lineno, state, resumed=None):
+        """
+        Gives the block of a REPEAT loop for each iteration, for run_blocks().
+
+        Args:
+            repeat_count (int): Number of times to repeat the code block.
+            block (list): The loop's code block.
+            start_lineno (int): Line number of the block's first line.
+            state (ast_nodes.ParserState): Parser state.
+            resumed (int): Number of an iteration which is already running (e.g. one a
+                checkpoint was saved in), to carry on from rather than starting at the
+                first. None by default.
+
+        Yields:
+            (tuple): The block and start_lineno.
+        """
+        for number in range(resumed or 1, repeat_count + 1):
+            self.before_iteration(start_lineno - 1, number, state)
+            yield block, start_lineno
+
+    def repeatuntil_blocks(
+        self, condition, tokens, line, block, start_lineno, state, resumed=None
+    ):
+        """
+        Gives the block of a REPEATUNTIL loop for each iteration, for run_blocks(),
+        evaluating the condition again after each one.
+
+        Args:
+            condition (ast_nodes.Condition): The condition, as parse() found it before
+                the first iteration (or the resumed one).
+            tokens (rply.lexer.LexerStream): The REPEATUNTIL line's tokens.
+            line (string): The REPEATUNTIL line.
+            block (list): The loop's code block.
+            start_lineno (int): Line number of the block's first line.
+            state (ast_nodes.ParserState): Parser state.
+            resumed (int): Number of an iteration which is already running, to carry on
+                from rather than starting at the first. None by default.
+
+        Yields:
+            (tuple): The block and start_lineno.
+        """
+        number = resumed or 1
+        # Perform loop while condition is not met
+        while not condition.value:  # Check Python bool, not Traversal bool
+            self.before_iteration(start_lineno - 1, number, state)
+            yield block, start_lineno
+            number += 1
+            condition = self.evaluate_condition(
+                copy(tokens), start_lineno - 1, line, state
+            )
+
+    def repeatfor_blocks(self, name, counts, block, start_lineno, state, resumed=None):
+        """
+        Gives the block of a REPEATFOR loop for each iteration, for run_blocks(). The
+        counter is counted with Python integers, and only set when the block reads it
+        (see reads_counter()).
+
+        Args:
+            name (string): Name of the counter.
+            counts (range): Values the counter counts through.
+            block (list): The loop's code block.
+            start_lineno (int): Line number of the block's first line.
+            state (ast_nodes.ParserState): Parser state.
+            resumed (int): Number of an iteration which is already running, to carry on
+                from rather than starting at the first. The counter isn't set for it
+                again, as the block may have assigned to it since. None by default.
+
+        Yields:
+            (tuple): The block and start_lineno.
+        """
+        reads = self.reads_counter(name, counts, block, state)
+        for number in range(resumed or 1, len(counts) + 1):
+            self.before_iteration(start_lineno - 1, number, state)
+            if reads and number != resumed:
+                state.variables[name] = Integer(counts[number - 1])
+            yield block, start_lineno
+
+    def reads_counter(self, name, counts, block, state):
+        """
+        Finds whether each iteration of a REPEATFOR loop has to set its counter, for
+        repeatfor_blocks(). See box_counter().
+
+        Args:
+            name (string): Name of the counter.
+            counts (range): Values the counter counts through.
+            block (list): The loop's code block.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            (bool): Whether the counter must be set before each iteration.
+        """
+        return box_counter(name, counts, block, state)
+
+    def before_iteration(self, lineno, number, state):
+        """
+        Called just before each iteration of a loop, for sessions which do something
+        between iterations. Does nothing here.
+
+        Args:
+            lineno (int): Line number of the loop's REPEAT statement.
+            number (int): Number of the iteration, counting from 1.
+            state (ast_nodes.ParserState): Parser state.
+        """
+
+    def if_elseif_else(self, if_condition, if_indent_level, input, start_lineno, state):
+        """
+        Store IF...ELSE IF... ELSE conditional statements before passing to the
+        parse_if_elseif_else() method.
+
+        Args:
+            if_condition (ast_nodes.Condition): The IF statement's condition, as parse()
+                found it.
+            if_indent_level (int): The indent level of the preceding IF statement
+                (and thus ELSE IF and ELSE statements)
+            input (list): Sliced array passed from parse(), containing the lines of code
+                including and after the IF line.
+            start_lineno (int): Line number of the first line passed to the function, for
+                error messages.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            (int): Number of lines within the if... else if... else block, which parse()
+                will have to skip. Returned from calling parse_if_eliseif_else().
+        """
+        # Keep track of number of condition statements to calculate how many lines to skip later on
+        conditional_statements_length = 1  # Already found one 'if' statement
+
+        # Setting up storage of 'if' and 'else' information
+        if_code_block = []
+        else_code_block = []
+
+        # Setting up storage of 'else if' information (there may be multiple 'else if' blocks)
+        elseif_pos = []  # Array of all pointers for 'else if' statements
+        elseif_tokens = []  # 2D array of all 'else if' statement tokens
+        elseif_lines = []  # Array of all 'else if' statement lines
+        elseif_code_blocks = []  # 2D array of all 'else if' code blocks
+
+        # Storing 'if' information
+        if_pos = 0
+        if_code_block = self.get_indent_block(
+            if_indent_level, input[if_pos + 1 :], state
         )
 
-    # Have to check for potentially multiple 'else if' statements
-    is_elseif = next_token_type_is(copy(next_tokens), "ELSEIF")
-    if is_elseif:
-        while is_elseif:
+        # Next pointer for a conditional statement (either 'else if' or 'else' statement)
+        next_pos = if_pos + len(if_code_block) + 1
+        # End of input list, only parse 'if' statement
+        if next_pos >= len(input):
+            return self.parse_if_elseif_else(
+                start_lineno,
+                state,
+                conditional_statements_length,
+                if_condition,
+                if_code_block,
+            )
+        next_tokens = self.lexer.lex(input[next_pos])
+
+        # Have to check for potentially multiple 'else if' statements
+        is_elseif = next_token_type_is(copy(next_tokens), "ELSEIF")
+        if is_elseif:
+            while is_elseif:
+                conditional_statements_length += 1
+
+                # Storing first 'else if' information
+                elseif_pos.append(next_pos)
+                elseif_tokens.append(next_tokens)
+                elseif_lines.append(input[next_pos])
+                indent_code_block = self.get_indent_block(
+                    if_indent_level, input[next_pos + 1 :], state
+                )
+                elseif_code_blocks.append(indent_code_block)
+
+                next_pos = next_pos + len(indent_code_block) + 1
+                # End of input list, only parse up to 'else if' statements added so far
+                if next_pos >= len(input):
+                    return self.parse_if_elseif_else(
+                        start_lineno,
+                        state,
+                        conditional_statements_length,
+                        if_condition,
+                        if_code_block,
+                        elseif_tokens,
+                        elseif_code_blocks,
+                        elseif_pos=elseif_pos,
+                        elseif_lines=elseif_lines,
+                    )
+                next_tokens = self.lexer.lex(input[next_pos])
+
+                is_elseif = next_token_type_is(copy(next_tokens), "ELSEIF")
+
+        # Check for 'else' statement
+        else_pos = None
+        if next_token_type_is(copy(next_tokens), "ELSE"):
             conditional_statements_length += 1
 
-            # Storing first 'else if' information
-            elseif_pos.append(next_pos)
-            elseif_tokens.append(next_tokens)
-            indent_code_block = get_indent_block(
-                if_indent_level, input[next_pos + 1 :], state
+            # Storing 'else' information
+            else_pos, else_tokens = next_pos, next_tokens
+            else_code_block = self.get_indent_block(
+                if_indent_level, input[else_pos + 1 :], state
             )
-            elseif_code_blocks.append(indent_code_block)
 
-            next_pos = next_pos + len(indent_code_block) + 1
-            try:
-                next_tokens = lexer.lex(input[next_pos])
-            # End of input list, only parse up to 'else if' statements added so far
-            except IndexError:
-                return parse_if_elseif_else(
+            next_pos = else_pos + len(else_code_block) + 1
+            # End of input list, parse statements without checking for illegal follow-up statements
+            if next_pos >= len(input):
+                return self.parse_if_elseif_else(
                     start_lineno,
                     state,
                     conditional_statements_length,
-                    if_tokens,
+                    if_condition,
                     if_code_block,
                     elseif_tokens,
                     elseif_code_blocks,
+                    else_code_block,
+                    elseif_pos,
+                    else_pos,
+                    elseif_lines,
                 )
+            next_tokens = self.lexer.lex(input[next_pos])
+
+        # Check for illegal follow-up of 'else if' or 'else' after an 'else' statement
+        if next_token_type_is(copy(next_tokens), "ELSEIF") or next_token_type_is(
+            copy(next_tokens), "ELSE"
+        ):
+            self.error_at(start_lineno - 1 + next_pos, state)
+            raise SyntaxError(ELSE_FOLLOW_UP_ERROR)
+
+        return self.parse_if_elseif_else(
+            start_lineno,
+            state,
+            conditional_statements_length,
+            if_condition,
+            if_code_block,
+            elseif_tokens,
+            elseif_code_blocks,
+            else_code_block,
+            elseif_pos,
+            else_pos,
+            elseif_lines,
+        )
 
-            is_elseif = next_token_type_is(copy(next_tokens), "ELSEIF")
-
-    # Check for 'else' statement
-    if next_token_type_is(copy(next_tokens), "ELSE"):
-        conditional_statements_length += 1
-
-        # Storing 'else' information
-        else_pos, else_tokens = next_pos, next_tokens
-        else_code_block = get_indent_block(
-            if_indent_level, input[else_pos + 1 :], state
+    def parse_if_elseif_else(
+        self,
+        start_lineno,
+        state,
+        conditional_statements_length,
+        if_condition,
+        if_code_block,
+        elseif_tokens=[],
+        elseif_code_blocks=[],
+        else_code_block=[],
+        elseif_pos=[],
+        else_pos=None,
+        elseif_lines=[],
+    ):
+        """
+        Parse IF...ELSE IF... ELSE conditional statements. Called from the if_elseif_else()
+        method.
+
+        Args:
+            start_lineno (int): Line number of the first line passed to the function, for
+                error messages.
+            state (ast_nodes.ParserState): Parser state.
+            conditional_statements_length (int): Number of conditional statements to add to
+                the number of lines skipped.
+            if_condition (ast_nodes.Condition): The IF statement's condition.
+            if_code_block (list): Code block following the IF statement.
+            elseif_tokens (list[rply.lexer.LexerStream]): List of tokenised ELSE IF
+                statement lines. Empty by default.
+            elseif_code_blocks (list[list]): List of code blocks following each ELSE IF
+                statement. Empty by default.
+            else_code_block (list): Code block following the ELSE statement.
+                Empty by default.
+            elseif_pos (list[int]): Position of each ELSE IF statement after the IF
+                statement, for error messages. Empty by default.
+            else_pos (int): Position of the ELSE statement after the IF statement, for
+                error messages. None by default.
+            elseif_lines (list[string]): List of ELSE IF statement lines. Empty by
+                default.
+
+        Returns:
+            (int): Number of lines within the if... else if... else block, which parse()
+                will have to skip. Returned from calling run_blocks().
+        """
+        # Calculate lines needed to be skipped
+        code_block_length = (
+            len(if_code_block)
+            + sum(len(block) for block in elseif_code_blocks)
+            + len(else_code_block)
         )
+        lines_skipped = code_block_length + conditional_statements_length - 1
 
-        next_pos = else_pos + len(else_code_block) + 1
-        try:
-            next_tokens = lexer.lex(input[next_pos])
-        # End of input list, parse statements without checking for illegal follow-up statements
-        except IndexError:
-            return parse_if_elseif_else(
+        return self.run_blocks(
+            self.if_blocks(
                 start_lineno,
                 state,
-                conditional_statements_length,
-                if_tokens,
+                if_condition,
                 if_code_block,
                 elseif_tokens,
                 elseif_code_blocks,
                 else_code_block,
-            )
-
-    # Check for illegal follow-up of 'else if' or 'else' after an 'else' statement
-    if next_token_type_is(copy(next_tokens), "ELSEIF") or next_token_type_is(
-        copy(next_tokens), "ELSE"
-    ):
-        print(f"On line {start_lineno + next_pos}:", end=" ")
-        raise SyntaxError(
-            "You cannot follow 'else' with another 'else' or 'else if' statement"
+                elseif_pos,
+                else_pos,
+                elseif_lines,
+            ),
+            lines_skipped,
+            state,
         )
 
-    return parse_if_elseif_else(
+    def if_blocks(
+        self,
         start_lineno,
         state,
-        conditional_statements_length,
-        if_tokens,
+        if_condition,
         if_code_block,
-        elseif_tokens,
-        elseif_code_blocks,
-        else_code_block,
-    )
+        elseif_tokens=[],
+        elseif_code_blocks=[],
+        else_code_block=[],
+        elseif_pos=[],
+        else_pos=None,
+        elseif_lines=[],
+    ):
+        """
+        Gives the block of the branch an IF...ELSE IF... ELSE statement takes, if any,
+        for run_blocks(). Takes the same arguments as parse_if_elseif_else(), other than
+        conditional_statements_length.
+
+        Yields:
+            (tuple): The block and the line number of its first line.
+        """
+        # The IF statement is on the line before start_lineno
+        if_lineno = start_lineno - 1
+
+        # Parse if IF condition is satisfied
+        if if_condition.value:
+            self.branch(if_lineno, if_lineno, state)
+            yield if_code_block, start_lineno
+            return
+
+        # Check each ELSE IF condition
+        for pos, elseif_statement, elseif_line, elseif_code_block in zip(
+            elseif_pos, elseif_tokens, elseif_lines, elseif_code_blocks
+        ):
+            elseif_condition = self.evaluate_condition(
+                elseif_statement, if_lineno + pos, elseif_line, state
+            )
+            # Parse if ELSE IF condition is satisfied
+            if elseif_condition.value:
+                self.branch(if_lineno, if_lineno + pos, state)
+                yield elseif_code_block, start_lineno + pos
+                return
+
+        # Parse if ELSE condition is satisfied
+        if else_code_block:  # Else statement exists if else_code_block is not empty
+            self.branch(if_lineno, if_lineno + else_pos, state)
+            yield else_code_block, start_lineno + else_pos
+            return
+
+        self.branch(if_lineno, None, state)
+
+    def evaluate_condition(self, tokens, lineno, line, state):
+        """
+        Evaluates the condition on a line which parse() doesn't run as a statement: an
+        ELSE IF line, or a REPEATUNTIL line after each iteration of its loop.
+
+        Args:
+            tokens (rply.lexer.LexerStream): The line's tokens.
+            lineno (int): Line number of the line.
+            line (string): The line.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            (ast_nodes.Condition): The condition.
+        """
+        try:
+            return self.parser.parse(tokens, state=state).eval()
+        except:
+            self.error_at(lineno, state)
+            raise
+
+    def branch(self, lineno, taken, state):
+        """
+        Called once an 'if' statement has picked the branch whose block runs, just
+        before it runs, for sessions which keep track of branches. Does nothing here.
+
+        Args:
+            lineno (int): Line number of the IF statement.
+            taken (int): Line number of the IF, ELSE IF or ELSE statement whose block
+                runs, or None if no block runs.
+            state (ast_nodes.ParserState): Parser state.
+        """
+
+    def define(self, definition, procedure_indent_level, input, start_lineno, state):
+        """
+        Defines a procedure for the parse() method.
+
+        Args:
+            definition (ast_nodes.Definition): The procedure's name and parameters.
+            procedure_indent_level (int): The indent level of the PROCEDURE statement.
+            input (list): Sliced array passed from parse(), containing the lines of code
+                after the PROCEDURE line.
+            start_lineno (int): Line number of the first line passed to the function, for
+                error messages.
+            state (ast_nodes.ParserState): Parser state.
+
+        Returns:
+            (int): Number of lines within the procedure's block, which parse() will have
+                to skip.
+        """
+        try:
+            check_definition(
+                definition.name, definition.parameters, state.procedure is not None
+            )
+        except:
+            self.error_at(start_lineno - 1, state)
+            raise
+
+        procedure_code_block = self.get_indent_block(
+            procedure_indent_level, input, state
+        )
+
+        # Procedures which call this one may now do something different
+        for procedure in state.procedures.values():
+            procedure.forget()
+        state.procedures[definition.name] = procedures.Procedure(
+            definition.name,
+            definition.parameters,
+            procedure_code_block,
+            start_lineno,
+            self,
+            state.procedures,
+        )
 
+        return len(procedure_code_block)
 
-def parse_if_elseif_else(
-    start_lineno,
-    state,
-    conditional_statements_length,
-    if_tokens,
-    if_code_block,
-    elseif_tokens=[],
-    elseif_code_blocks=[],
-    else_code_block=[],
-):
+    def call_procedure(self, procedure, state):
+        """
+        Runs a procedure's block for a call (see procedures.Procedure.call()).
+
+        Args:
+            procedure (procedures.Procedure): Procedure called.
+            state (ast_nodes.ParserState): The call's own parser state, holding the
+                procedure's variables.
+
+        Returns:
+            The value the procedure returned, or None if it didn't return one.
+        """
+        try:
+            self.parse(procedure.lines, procedure.start_lineno, state)
+        except Returned as returned:
+            return returned.value
+        return None
+
+    def parse(self, input, start_lineno, state):
+        """
+        Parse input from an array of strings.
+
+        Args:
+            input (list): Array containing each line of code input.
+            start_lineno(int): Line number of the first line passed to the function, for
+                error messages.
+            state (ast_nodes.ParserState): Parser state.
+        """
+        lines_skipped = 0
+
+        for idx, line in enumerate(input):
+            # Lines in the blocks of the statement before, which has run them
+            if lines_skipped > 0:
+                lines_skipped -= 1
+                continue
+
+            tokens = self.lexer.lex(line)
+            lineno = idx + start_lineno
+            current_indent_level = find_indent_level(copy(tokens))
+
+            # Empty lines are still parsed (which fails if they're indented), but
+            # aren't statements
+            if current_indent_level is not None:
+                self.begin(lineno, line, state)
+            lines_skipped = self.statement_method(tokens)(
+                tokens, current_indent_level, input, idx, lineno, state
+            )
+
+    def begin(self, lineno, line, state):
+        """
+        Called by parse() just before each statement runs, for sessions which do
+        something between statements. Does nothing here.
+
+        Args:
+            lineno (int): Line number of the statement.
+            line (string): The statement's line.
+            state (ast_nodes.ParserState): Parser state.
+        """
+
+    def statement_method(self, tokens):
+        """
+        Finds the method which runs the statement on a line, for parse(). Each one
+        parses the statement's line, then runs any block it has with repeat(),
+        repeatuntil(), repeatfor(), if_elseif_else() or define(), which other sessions
+        override (or override the methods they call, such as run_blocks()) to run
+        blocks in their own ways.
+
+        Args:
+            tokens (rply.lexer.LexerStream): The line's tokens.
+
+        Returns:
+            (function): Runs the statement, given the line's tokens, its indent level
+                (None if it's empty), the input passed to parse(), the line's index in
+                it, its line number and the parser state. Returns what the method
+                running the statement's block returned: in Session, the number of lines
+                within its blocks, which parse() will have to skip.
+        """
+        token = next(copy(tokens), None)
+        kind = token.gettokentype() if token is not None else None
+        if kind == "REPEAT":
+            return self.repeat_statement
+        if kind == "REPEATUNTIL":
+            return self.repeatuntil_statement
+        if kind == "REPEATFOR":
+            return self.repeatfor_statement
+        if kind == "IF":
+            return self.if_statement
+        if kind == "PROCEDURE":
+            return self.procedure_statement
+        return self.simple_statement
+
+    def repeat_statement(self, tokens, indent_level, input, idx, lineno, state):
+        try:
+            # Don't .eval() as this returns an int?
+            repeat_count = self.parser.parse(tokens, state=state)
+        except:
+            self.error_at(lineno, state)
+            raise
+        return self.repeat(
+            repeat_count, indent_level, input[idx + 1 :], lineno + 1, state
+        )
+
+    def repeatuntil_statement(self, tokens, indent_level, input, idx, lineno, state):
+        try:
+            condition = self.parser.parse(tokens, state=state).eval()
+        except:
+            self.error_at(lineno, state)
+            raise
+        return self.repeatuntil(condition, indent_level, input[idx:], lineno + 1, state)
+
+    def repeatfor_statement(self, tokens, indent_level, input, idx, lineno, state):
+        try:
+            name, counts = self.parser.parse(tokens, state=state)
+        except:
+            self.error_at(lineno, state)
+            raise
+        return self.repeatfor(
+            name, counts, indent_level, input[idx + 1 :], lineno + 1, state
+        )
+
+    def if_statement(self, tokens, indent_level, input, idx, lineno, state):
+        try:
+            condition = self.parser.parse(tokens, state=state).eval()
+        except:
+            self.error_at(lineno, state)
+            raise
+        return self.if_elseif_else(
+            condition, indent_level, input[idx:], lineno + 1, state
+        )
+
+    def procedure_statement(self, tokens, indent_level, input, idx, lineno, state):
+        try:
+            definition = self.parser.parse(tokens, state=state)
+        except:
+            self.error_at(lineno, state)
+            raise
+        return self.define(
+            definition, indent_level, input[idx + 1 :], lineno + 1, state
+        )
+
+    def simple_statement(self, tokens, indent_level, input, idx, lineno, state):
+        # Any other statement, parsed using RPLY's native parser. Has no block
+        try:
+            self.parser.parse(tokens, state=state).eval()
+        except:
+            self.error_at(lineno, state)
+            raise
+        return 0
+
+
+def engine_factory(name, jit_threshold=100, report=None):
     """
-    Parse IF...ELSE IF... ELSE conditional statements. Called from the if_elseif_else() 
-    function.
+    Gives a function making sessions which run programs on one of the ENGINES.
 
     Args:
-        start_lineno (int): Line number of the first line passed to the function, for 
-            error messages.
-        state (ast.ParserState): Parser state.
-        conditional_statements_length (int): Number of conditional statements to add to 
-            the number of lines skipped.
-        if_tokens (rply.lexer.LexerStream): Tokenised IF statement line.
-        if_code_block (list): Code block following the IF statement.
-        elseif_tokens (list[rply.lexer.LexerStream]): List of tokenised ELSE IF 
-            statement lines. Empty by default.
-        elseif_code_blocks (list[list]): List of code blocks following each ELSE IF 
-            statement. Empty by default.
-        else_code_block (list): Code block following the ELSE statement. 
-            Empty by default.
-   
+        name (string): One of ENGINES.
+        jit_threshold (int): Iterations a loop runs before the jit engine compiles it.
+        report (file): Stream the typed engine reports errors found before running
+            to. Not reported if not given.
+
     Returns:
-        (int): Number of lines within the if... else if... else block, which parse() 
-            will have to skip.
+        (function): Makes a session, given the grammar and the output stream.
     """
-    # Calculate lines needed to be skipped
-    code_block_length = (
-        len(if_code_block)
-        + sum(len(block) for block in elseif_code_blocks)
-        + len(else_code_block)
-    )
-    lines_skipped = code_block_length + conditional_statements_length - 1
+    if name == "typed":
+        from compiler import CompiledSession
 
-    # Parse if IF condition is satisfied
-    if_condition = parser.parse(if_tokens, state=state).eval()
-    if if_condition.value:
-        parse(if_code_block, start_lineno, state)
-        return lines_skipped
+        def engine(grammar, output=None):
+            return CompiledSession(grammar, output, report=report)
 
-    # Check each ELSE IF condition
-    for elseif_statement, elseif_code_block in zip(elseif_tokens, elseif_code_blocks):
-        elseif_condition = parser.parse(elseif_statement, state=state).eval()
-        # Parse if ELSE IF condition is satisfied
-        if elseif_condition.value:
-            parse(elseif_code_block, start_lineno, state)
-            return lines_skipped
-
-    # Parse if ELSE condition is satisfied
-    if else_code_block:  # Else statement exists if else_code_block is not empty
-        parse(else_code_block, start_lineno, state)
-        return lines_skipped
+    elif name == "jit":
+        from jit import JitSession
+
+        def engine(grammar, output=None):
+            return JitSession(grammar, output, threshold=jit_threshold)
 
-    return lines_skipped
+    elif name == "flat":
+        from flat import FlatSession
 
+        engine = FlatSession
+    elif name == "stack":
+        from stack import StackSession
 
-def parse(input, start_lineno, state):
+        engine = StackSession
+    elif name == "interpreter":
+        engine = Session
+    else:
+        raise ValueError(f"Unknown engine '{name}'")
+    return engine
+
+
+def parse_args(argv=None):
     """
-    Parse input from an array of strings.
+    Parses command-line arguments.
 
     Args:
-        input (list): Array containing each line of code input.
-        start_lineno(int): Line number of the first line passed to the function, for 
-            error messages.
-        state (ast.ParserState): Parser state.
+        argv (list): Arguments to parse. Defaults to sys.argv[1:].
+
+    Returns:
+        (argparse.Namespace): Parsed arguments.
     """
-    repeat_count = 0  # For REPEAT statements
-    previous_indent_level = 0
-    current_indent_level = 0
-    lines_skipped = 0
-
-    for idx, line in enumerate(input):
-        tokens = lexer.lex(line)
-        lineno = idx + start_lineno
-        current_indent_level = find_indent_level(copy(tokens))
-
-        # If the current line is empty, let current indent level be equal to the
-        # previous indent level
-        if current_indent_level is None:
-            current_indent_level = previous_indent_level
-
-        if lines_skipped > 0:
-            lines_skipped -= 1
-            continue
-
-        # REPEAT statement found
-        if next_token_type_is(copy(tokens), "REPEAT"):
-            try:
-                # Don't .eval() as this returns an int?
-                repeat_count = parser.parse(tokens, state=state)
-            except:
-                print(f"On line {lineno}:", end=" ")
-                raise
-            lines_skipped = repeat(
-                repeat_count, current_indent_level, input[idx + 1 :], lineno + 1, state
-            )
-        # REPEATUNTIL statement found
-        elif next_token_type_is(copy(tokens), "REPEATUNTIL"):
-            try:
-                parser.parse(tokens, state=state).eval()
-            except:
-                print(f"On line {lineno}:", end=" ")
-                raise
-            lines_skipped = repeatuntil(
-                current_indent_level, input[idx:], lineno + 1, state
-            )
-        # IF statement found
-        elif next_token_type_is(copy(tokens), "IF"):
-            try:
-                parser.parse(tokens, state=state).eval()
-            except:
-                print(f"On line {lineno}:", end=" ")
-                raise
-            lines_skipped = if_elseif_else(
-                current_indent_level, input[idx:], lineno + 1, state
-            )
-        # Normal statement parsed using RPLY's native parser
-        else:
-            try:
-                parser.parse(tokens, state=state).eval()
-            except:
-                print(f"On line {lineno}:", end=" ")
-                raise
+    arg_parser = argparse.ArgumentParser(description="Run a Traversal program.")
+    arg_parser.add_argument(
+        "file",
+        nargs="?",
+        help="program to run (default: test.trv, or the program a checkpoint was "
+        "saved from when resuming)",
+    )
+    arg_parser.add_argument(
+        "-t", "--timed", action="store_true", help="print the time taken to run"
+    )
+    arg_parser.add_argument(
+        "--lexer",
+        choices=Grammar.LEXER_BACKENDS,
+        default="rply",
+        help="lexer backend to use (default: rply)",
+    )
+    arg_parser.add_argument(
+        "--parser",
+        choices=Grammar.PARSER_BACKENDS,
+        default="rply",
+        help="parser backend to use (default: rply)",
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="interpreter",
+        help="run the program line by line on the interpreter, compile it first "
+        "with type inference (typed), run it on the interpreter and compile hot loops "
+        "(jit), compile it into compact arrays without type inference (flat), or run "
+        "it on the interpreter without recursion, for deeply nested blocks (stack) "
+        "(default: interpreter)",
+    )
+    arg_parser.add_argument(
+        "--jit-threshold",
+        type=int,
+        default=100,
+        metavar="N",
+        help="iterations a loop runs before the jit engine compiles it (default: 100)",
+    )
+    arg_parser.add_argument(
+        "--jit-stats",
+        action="store_true",
+        help="report which loops the jit engine compiled, and how many iterations "
+        "ran compiled",
+    )
+    arg_parser.add_argument(
+        "--memo-stats",
+        action="store_true",
+        help="report how often each procedure was called, and how many calls of "
+        "pure procedures were given a kept result",
+    )
+    arg_parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="run independent parts of the program at the same time, in up to "
+        "--workers processes",
+    )
+    arg_parser.add_argument(
+        "--max-digits",
+        type=int,
+        default=ast_nodes.MAX_POWER_DIGITS,
+        metavar="N",
+        help="most digits the result of a power may have before it fails, or 0 for "
+        f"no limit (default: {ast_nodes.MAX_POWER_DIGITS})",
+    )
+    arg_parser.add_argument(
+        "--checkpoint",
+        metavar="FILE",
+        help="save a checkpoint to FILE when sent SIGUSR1, or save one and stop when "
+        "sent SIGTERM",
+    )
+    arg_parser.add_argument(
+        "--checkpoint-every",
+        type=float,
+        metavar="SECONDS",
+        help="also save a checkpoint every SECONDS seconds",
+    )
+    arg_parser.add_argument(
+        "--resume",
+        metavar="CHECKPOINT",
+        help="carry on running a program from a checkpoint",
+    )
+    arg_parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="report the most memory used, the values and syntax tree nodes alive, "
+        "and the lines using the most memory (slows the program down)",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="keep the results of programs in DIR, and print them straight back when "
+        "the same program runs again",
+    )
+    arg_parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=64,
+        metavar="MB",
+        help="most megabytes of results to keep, removing the least recently used "
+        "(default: 64)",
+    )
+    arg_parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="memory-map the file and decode lines as they run, for very large files",
+    )
+    arg_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="check the program's syntax and structure without running it, "
+        "reporting every error found",
+    )
+    arg_parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="run the program on every engine and backend, check each prints the "
+        "same and stops with the same error as the interpreter, and time each; the "
+        "file may be a directory of programs",
+    )
+    arg_parser.add_argument(
+        "--input",
+        metavar="FILE",
+        help="file the program reads values from, one on each line (default: stdin)",
+    )
+
+    serve_group = arg_parser.add_argument_group("server mode")
+    serve_group.add_argument(
+        "--serve",
+        action="store_true",
+        help="run a local execution server instead of a single program",
+    )
+    serve_group.add_argument("--host", default="127.0.0.1", help="TCP host to bind")
+    serve_group.add_argument("--port", type=int, default=8750, help="TCP port to bind")
+    serve_group.add_argument(
+        "--unix",
+        metavar="PATH",
+        help="listen on a Unix socket instead of TCP (for --zygote, default: "
+        "$TMPDIR/traversal-zygote-UID.sock)",
+    )
+    serve_group.add_argument(
+        "--zygote",
+        action="store_true",
+        help="wait with the lexer and parser built, and run each program zygote.py "
+        "sends in a process forked from this one",
+    )
+    serve_group.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes, for --serve or --parallel (default: number "
+        "of CPUs)",
+    )
+    serve_group.add_argument(
+        "--queue-size",
+        type=int,
+        default=64,
+        help="programs allowed to wait for a worker before clients are held back",
+    )
+    serve_group.add_argument(
+        "--time-limit",
+        type=float,
+        default=10.0,
+        help="maximum seconds a single program may run for",
+    )
 
-        previous_indent_level = current_indent_level
+    args = arg_parser.parse_args(argv)
+    # Checked here, as NaN and negative limits would reach asyncio.wait_for()
+    if not math.isfinite(args.time_limit) or args.time_limit <= 0:
+        arg_parser.error("--time-limit must be a positive number of seconds")
+    if args.jit_stats and args.engine != "jit":
+        arg_parser.error("--jit-stats needs --engine jit")
+    if args.jit_stats and args.parallel:
+        arg_parser.error("--jit-stats can't be used with --parallel")
+    if args.memo_stats and (args.parallel or args.cache):
+        arg_parser.error("--memo-stats can't be used with --parallel or --cache")
+    if args.checkpoint_every is not None and args.checkpoint is None:
+        arg_parser.error("--checkpoint-every needs --checkpoint")
+    if (args.checkpoint or args.resume) and (
+        args.engine != "interpreter" or args.parallel
+    ):
+        arg_parser.error(
+            "--checkpoint and --resume need --engine interpreter, without --parallel"
+        )
+    if args.memory and (
+        args.engine != "interpreter" or args.parallel or args.checkpoint or args.resume
+    ):
+        arg_parser.error(
+            "--memory needs --engine interpreter, without --parallel, --checkpoint or "
+            "--resume"
+        )
+    if args.cache and (args.checkpoint or args.resume or args.memory):
+        arg_parser.error(
+            "--cache can't be used with --checkpoint, --resume or --memory"
+        )
+    if args.zygote and args.serve:
+        arg_parser.error("--zygote can't be used with --serve")
+    if args.check and (args.serve or args.resume):
+        arg_parser.error("--check can't be used with --serve or --resume")
+    if args.compare and (
+        args.serve
+        or args.resume
+        or args.checkpoint
+        or args.memory
+        or args.cache
+        or args.parallel
+        or args.check
+        or args.mmap
+    ):
+        arg_parser.error(
+            "--compare can't be used with --serve, --resume, --checkpoint, --memory, "
+            "--cache, --parallel, --check or --mmap"
+        )
+    if args.file is None and args.resume is None:
+        args.file = "test.trv"
+    return args
 
 
-if __name__ == "__main__":
+def main(argv=None, grammars=None):
+    """
+    Runs a program, or a server, check or comparison, as the command-line arguments
+    say.
+
+    Args:
+        argv (list): Arguments to parse. Defaults to sys.argv[1:].
+        grammars (dict): Grammars already built (e.g. by a zygote), by lexer and
+            parser backend. Any other is built when it's needed.
+    """
+    args = parse_args(argv)
+
+    # Limit on the size of powers, for every session
+    ast_nodes.MAX_POWER_DIGITS = args.max_digits or None
+
+    cache_options = None
+    if args.cache:
+        cache_options = {
+            "directory": args.cache,
+            "max_bytes": int(args.cache_size * 1024 * 1024),
+        }
+
+    if args.serve:
+        import server
+
+        server.serve(
+            host=args.host,
+            port=args.port,
+            unix_path=args.unix,
+            workers=args.workers,
+            queue_size=args.queue_size,
+            time_limit=args.time_limit,
+            grammar_options={
+                "lexer_backend": args.lexer,
+                "parser_backend": args.parser,
+            },
+            cache_options=cache_options,
+        )
+        sys.exit()
+
+    if args.zygote:
+        import zygote
+
+        zygote.serve(args.unix or zygote.DEFAULT_PATH)
+        sys.exit()
+
     # Remove Python traceback to hide 'scary' error messages
     sys.tracebacklimit = 0
 
-    # Parser state
-    state = ParserState()
+    # Lexer and parser
+    grammar = (grammars or {}).get((args.lexer, args.parser))
+    if grammar is None:
+        grammar = Grammar(lexer_backend=args.lexer, parser_backend=args.parser)
 
-    # Lexer
-    lexer = Lexer().get_lexer()
+    if args.check:
+        from check import Checker
 
-    # Parser
-    pg = Parser()
-    pg.parse()
-    parser = pg.get_parser()
+        checker = Checker(grammar)
+        if args.mmap:
+            with MappedSource(args.file) as user_input:
+                errors = checker.check(user_input)
+        else:
+            with open(args.file, "r") as user_input:
+                errors = checker.check(user_input.readlines())
+        for lineno, error in errors:
+            print(f"On line {lineno}: {type(error).__name__}: {error}")
+        sys.exit(1 if errors else 0)
+
+    if args.compare:
+        import compare
+
+        # Every run reads the same input. Stdin is only read if a program reads
+        # values, as it may be a pipe which is never closed
+        if os.path.isdir(args.file):
+            paths = list(compare.programs(args.file))
+        else:
+            paths = [args.file]
+        data = ""
+        if args.input is not None:
+            with open(args.input, "r") as input_file:
+                data = input_file.read()
+        elif not sys.stdin.isatty() and compare.reads_input(paths, grammar.lexer):
+            data = sys.stdin.read()
+        configurations = compare.configurations(
+            args.jit_threshold, args.workers, args.lexer, args.parser
+        )
+        if os.path.isdir(args.file):
+            same = compare.compare_directory(args.file, configurations, data)
+        else:
+            with open(args.file, "r") as user_input:
+                comparison = compare.Comparison(
+                    user_input.readlines(), args.file, configurations, data
+                )
+            same = comparison.run()
+            comparison.report()
+        sys.exit(0 if same else 1)
+
+    # Errors found by type inference are reported before the program runs
+    engine = engine_factory(args.engine, args.jit_threshold, report=sys.stderr)
+
+    checkpoint = None
+    if args.checkpoint or args.resume:
+        import signal
+        from checkpoint import Checkpoint, CheckpointSession, Stopped
+
+        if args.resume:
+            checkpoint = Checkpoint.load(args.resume)
+            if args.file is None:
+                args.file = checkpoint.program
+        session = CheckpointSession(
+            grammar,
+            path=args.checkpoint,
+            every=args.checkpoint_every,
+            program=os.path.abspath(args.file),
+        )
+        # Checkpoints are saved at the start of the next statement
+        signal.signal(signal.SIGUSR1, lambda signum, frame: session.checkpoint())
+        signal.signal(signal.SIGTERM, lambda signum, frame: session.stop())
+    elif args.memory:
+        from memory import MemoryProfile
+
+        profile = MemoryProfile()
+        session = profile.session(grammar)
+    elif args.parallel:
+        from parallel import ParallelSession
+
+        session = ParallelSession(grammar, workers=args.workers, engine=engine)
+    else:
+        session = engine(grammar)
+
+    input_file = None
+    if args.input is not None:
+        input_file = open(args.input, "r")
+        session.state.input = InputReader(input_file)
+
+    cache = None
+    if cache_options is not None:
+        from cache import OutputCache
+
+        cache = OutputCache(**cache_options)
+
+    def run_program(input):
+        if checkpoint is not None:
+            session.resume(input, checkpoint)
+        elif cache is not None:
+            cache.run(session, input)
+        elif args.memory:
+            # Reported on exit, so after any error message
+            atexit.register(lambda: sys.stdout.flush() or profile.report(sys.stderr))
+            profile.start()
+            try:
+                session.run(input)
+            finally:
+                profile.stop()
+        else:
+            session.run(input)
 
     # Check start time
     start_time = time.time()
 
-    # Check if there is a -t flag
-    timed = True
+    # Open and parse user-defined file (test.trv by default)
     try:
-        timed = sys.argv[1] == "-t"
-    except:
-        timed = False
-
-    # Open and parse test.trv file by default
-    if len(sys.argv) == (1 if not timed else 2):
-        with open("test.trv", "r") as test_input:
-            state = ParserState()
-            parse(test_input.readlines(), 1, state)
-    # Open and parse user-defined file
-    elif len(sys.argv) == (2 if not timed else 3):
-        trv_file = sys.argv[1 if not timed else 2]
-        with open(trv_file, "r") as user_input:
-            state = ParserState()
-            parse(user_input.readlines(), 1, state)
-    else:
-        raise OSError("Too many command-line arguments!")
-
-    if timed:
+        if args.mmap:
+            with MappedSource(args.file) as user_input:
+                run_program(user_input)
+        else:
+            with open(args.file, "r") as user_input:
+                run_program(user_input.readlines())
+    except Exception as err:
+        if not (args.checkpoint and isinstance(err, Stopped)):
+            raise
+        print(f"Checkpoint saved to {args.checkpoint}: {err}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if input_file is not None:
+            input_file.close()
+
+    if args.jit_stats:
+        session.stats(sys.stderr)
+    if args.memo_stats:
+        procedures.stats(session.state.procedures, sys.stderr)
+
+    if args.timed:
         # Check end time and calculate time elapsed
         end_time = time.time()
         print(f"TIME ELAPSED: {end_time - start_time}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import asyncio
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import signal
+import time
+
+import ast_nodes
+import run
+from reader import InputReader
+
+# Largest single JSON request line accepted from a client
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+
+def execute(source, grammar, cache=None, input=""):
+    """
+    Runs a Traversal program in its own session, capturing everything it prints.
+
+    Args:
+        source (string): Source code of the program.
+        grammar (run.Grammar): Built lexer and parser.
+        cache (cache.OutputCache): Results of programs already run, if any.
+        input (string): Input the program reads values from.
+
+    Returns:
+        (dict): The program's captured output, any error raised (type, message and
+            line number where known) and the time taken to run it in seconds.
+    """
+    output = io.StringIO()
+    session = run.Session(grammar, output)
+    session.state.input = InputReader(io.StringIO(input))
+    error = None
+
+    start_time = time.perf_counter()
+    try:
+        if cache is not None:
+            cache.run(session, source.splitlines(keepends=True))
+        else:
+            session.run(source.splitlines(keepends=True))
+    except Exception as err:
+        error = {
+            "type": type(err).__name__,
+            "message": str(err),
+            "line": session.error_lineno,
+        }
+    elapsed = time.perf_counter() - start_time
+
+    text = output.getvalue()
+    if error is not None and error["line"] is not None:
+        # The "On line N: " prefix belongs in the error, not the output
+        prefix = f"On line {error['line']}: "
+        if text.endswith(prefix):
+            text = text[: -len(prefix)]
+
+    return {"output": text, "error": error, "time": elapsed}
+
+
+def _worker_main(
+    conn,
+    grammar_options,
+    cache_options=None,
+    max_power_digits=ast_nodes.MAX_POWER_DIGITS,
+):
+    """
+    Main loop of a worker process. Builds the grammar once, then runs each program
+    sent down the pipe and sends back the result.
+
+    Args:
+        conn (multiprocessing.connection.Connection): Worker end of the pipe.
+        grammar_options (dict): Keyword arguments for run.Grammar.
+        cache_options (dict): Keyword arguments for cache.OutputCache, or None not to
+            cache results.
+        max_power_digits (int): The server's ast_nodes.MAX_POWER_DIGITS, which the
+            worker doesn't inherit, as it isn't forked from the server.
+    """
+    # Ctrl-C is handled by the server, which shuts the workers down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ast_nodes.MAX_POWER_DIGITS = max_power_digits
+
+    grammar = run.Grammar(**grammar_options)
+    cache = None
+    if cache_options is not None:
+        from cache import OutputCache
+
+        cache = OutputCache(**cache_options)
+
+    while True:
+        try:
+            source, input = conn.recv()
+            conn.send(execute(source, grammar, cache, input))
+        except (EOFError, BrokenPipeError):
+            return  # The server has stopped
+
+
+def _set_ready(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Worker:
+    """
+    A worker process holding a built lexer and parser. Runs one program at a time.
+    """
+
+    def __init__(self, context, grammar_options, cache_options=None):
+        self.context = context
+        self.grammar_options = grammar_options
+        self.cache_options = cache_options
+        self._start()
+
+    def _start(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(
+                child_conn,
+                self.grammar_options,
+                self.cache_options,
+                ast_nodes.MAX_POWER_DIGITS,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def restart(self):
+        """
+        Kills the worker process, e.g. after it ran out of time, and starts a new one.
+        """
+        self.conn.close()
+        self.process.kill()
+        self.process.join()
+        self._start()
+
+    def close(self):
+        self.conn.close()
+        self.process.kill()
+        self.process.join()
+
+    async def run(self, source, time_limit, input=""):
+        """
+        Runs a program on the worker, killing it if it runs for too long.
+
+        Args:
+            source (string): Source code of the program.
+            time_limit (float): Maximum number of seconds the program may run for.
+            input (string): Input the program reads values from.
+
+        Returns:
+            (dict): Result of server.execute(), or an error if the worker had to be
+                killed or died.
+        """
+        loop = asyncio.get_event_loop()
+        readable = loop.create_future()
+        fd = self.conn.fileno()
+        loop.add_reader(fd, _set_ready, readable)
+
+        try:
+            self.conn.send((source, input))
+            await asyncio.wait_for(readable, time_limit)
+            return self.conn.recv()
+        except asyncio.TimeoutError:
+            error = {
+                "type": "TimeoutError",
+                "message": f"Program ran for longer than {time_limit} seconds",
+                "line": None,
+            }
+        except (EOFError, OSError):
+            error = {
+                "type": "WorkerError",
+                "message": "The worker running the program died",
+                "line": None,
+            }
+        finally:
+            loop.remove_reader(fd)
+
+        self.restart()
+        return {"output": "", "error": error, "time": time_limit}
+
+
+class ExecutionServer:
+    """
+    Local execution server. Programs arrive as JSON lines, wait in a bounded queue and
+    are dispatched to a pool of warm worker processes.
+
+    Each request is a single line of JSON, e.g. {"id": 1, "source": "output 1"}, with
+    an optional "time_limit" in seconds (capped at the server's own limit) and an
+    optional "input" string the program reads values from. Each response is a single
+    line of JSON carrying the same "id", the program's "output", an "error" (or null),
+    the "time" spent running and the time spent "queued".
+
+    Args:
+        workers (int): Number of worker processes.
+        queue_size (int): Number of programs that can wait for a worker. Once the
+            queue is full, clients are not read from until space frees up.
+        time_limit (float): Maximum number of seconds a program may run for.
+        grammar_options (dict): Keyword arguments for run.Grammar in each worker.
+        cache_options (dict): Keyword arguments for cache.OutputCache in each worker,
+            which share its directory, or None not to cache results.
+    """
+
+    def __init__(
+        self, workers, queue_size, time_limit, grammar_options=None, cache_options=None
+    ):
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.time_limit = time_limit
+        self.grammar_options = grammar_options or {}
+        self.cache_options = cache_options
+        self.workers = []
+
+    async def _dispatch(self, worker):
+        # Feed queued programs to a single worker, one at a time
+        while True:
+            request, time_limit, future, queued_at = await self.queue.get()
+            if future.cancelled():
+                continue
+
+            queued = asyncio.get_event_loop().time() - queued_at
+            result = await worker.run(
+                request["source"], time_limit, request.get("input", "")
+            )
+            result["queued"] = queued
+            if not future.done():
+                future.set_result(result)
+
+    async def _reply(self, future, request_id, writer, write_lock):
+        result = await future
+        result["id"] = request_id
+        async with write_lock:
+            writer.write(json.dumps(result).encode() + b"\n")
+            with contextlib.suppress(ConnectionError):
+                await writer.drain()
+
+    async def _handle_client(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        write_lock = asyncio.Lock()
+        replies = set()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):  # Request too large or reset
+                    break
+                if not line:
+                    break
+
+                request = {}
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request.get("source"), str):
+                        raise ValueError
+                    if not isinstance(request.get("input", ""), str):
+                        raise ValueError
+                    time_limit = self.time_limit
+                    if request.get("time_limit") is not None:
+                        requested = float(request["time_limit"])
+                        if not math.isfinite(requested) or requested <= 0:
+                            raise ValueError
+                        time_limit = min(requested, time_limit)
+                except (ValueError, TypeError, AttributeError):
+                    future = loop.create_future()
+                    future.set_result(
+                        {
+                            "output": "",
+                            "error": {
+                                "type": "RequestError",
+                                "message": "Requests must be JSON objects with a "
+                                "'source' string, an optional positive "
+                                "'time_limit' and an optional 'input' string",
+                                "line": None,
+                            },
+                            "time": 0.0,
+                            "queued": 0.0,
+                        }
+                    )
+                    if not isinstance(request, dict):
+                        request = {}
+                else:
+                    future = loop.create_future()
+                    # Blocks while the queue is full, which stops us reading any more
+                    # of this client's requests until a worker is free
+                    await self.queue.put((request, time_limit, future, loop.time()))
+
+                reply = asyncio.ensure_future(
+                    self._reply(future, request.get("id"), writer, write_lock)
+                )
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+
+            if replies:
+                await asyncio.gather(*replies)
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host="127.0.0.1", port=8750, unix_path=None):
+        """
+        Starts the workers and serves clients until cancelled.
+
+        Args:
+            host (string): TCP host to bind.
+            port (int): TCP port to bind.
+            unix_path (string): Path of a Unix socket to listen on instead of TCP.
+        """
+        self.queue = asyncio.Queue(self.queue_size)
+        # Workers are started by a fork server rather than forked from this process,
+        # so those restarted while clients are connected don't inherit the listening
+        # socket, clients' connections or other workers' pipes (which would stop a
+        # closed connection reaching the client). The fork server imports this module
+        # once, so workers still start with it and run already imported
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        self.workers = [
+            Worker(context, self.grammar_options, self.cache_options)
+            for _ in range(self.worker_count)
+        ]
+        dispatchers = [
+            asyncio.ensure_future(self._dispatch(worker)) for worker in self.workers
+        ]
+
+        if unix_path is not None:
+            listener = await asyncio.start_unix_server(
+                self._handle_client, unix_path, limit=MAX_REQUEST_BYTES
+            )
+            print(f"Serving on {unix_path}")
+        else:
+            listener = await asyncio.start_server(
+                self._handle_client, host, port, limit=MAX_REQUEST_BYTES
+            )
+            print(f"Serving on {host}:{port}")
+
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+            for worker in self.workers:
+                worker.close()
+
+
+def serve(
+    host="127.0.0.1",
+    port=8750,
+    unix_path=None,
+    workers=1,
+    queue_size=64,
+    time_limit=10,
+    grammar_options=None,
+    cache_options=None,
+):
+    """
+    Runs an execution server until interrupted. See ExecutionServer.
+    """
+    execution_server = ExecutionServer(
+        workers, queue_size, time_limit, grammar_options, cache_options
+    )
+    try:
+        asyncio.run(execution_server.serve_forever(host, port, unix_path))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,165 @@
+import mmap
+from array import array
+
+# Mapped pages more than this many bytes behind the furthest line read are released,
+# so they stop counting towards resident memory (they are read back in if needed)
+RELEASE_WINDOW = 8 * 1024 * 1024
+
+
+class MappedSource:
+    """
+    A source file which is memory-mapped rather than read into memory. Only the start
+    offset of each line is kept (in a compact array), and lines are decoded one at a
+    time when they're needed, so memory use doesn't grow with the size of the file.
+
+    Lines keep their trailing newline and Windows line endings are read as plain
+    newlines, as with readlines(). Use as a context manager (which gives a view of
+    every line), or call close() once finished.
+
+    Args:
+        filename (string): Path of the source file.
+        encoding (string): Encoding of the source file.
+    """
+
+    def __init__(self, filename, encoding="utf-8"):
+        self.encoding = encoding
+        self.file = open(filename, "rb")
+        size = self.file.seek(0, 2)
+
+        # mmap can't map an empty file
+        self.map = b""
+        if size > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Start offset of every line, plus the end of the file
+        self.offsets = array("I" if size < 2**32 else "Q", [0])
+        self.released = 0  # End of the mapped pages released so far
+        find = self.map.find
+        append = self.offsets.append
+        pos = find(b"\n")
+        while pos != -1:
+            append(pos + 1)
+            if pos - self.released > 2 * RELEASE_WINDOW:
+                self._release(pos - RELEASE_WINDOW)
+            pos = find(b"\n", pos + 1)
+        if self.offsets[-1] != size:
+            append(size)
+
+        # Nothing has been executed yet, so none of the file needs to stay resident
+        self._release(size)
+        self.released = 0
+        self.furthest = 0  # End of the furthest line read
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, lineno):
+        """
+        Decodes a single line.
+
+        Args:
+            lineno (int): Index of the line, starting from 0.
+
+        Returns:
+            (string): The line, including its trailing newline if it has one.
+        """
+        end = self.offsets[lineno + 1]
+        if end > self.furthest:
+            self.furthest = end
+            if end - self.released > 2 * RELEASE_WINDOW:
+                self._release(end - RELEASE_WINDOW)
+
+        line = self.map[self.offsets[lineno] : end]
+        if line.endswith(b"\r\n"):
+            line = line[:-2] + b"\n"
+        return line.decode(self.encoding)
+
+    def _release(self, end):
+        # madvise() is only available from Python 3.8, and not on every platform
+        if not hasattr(self.map, "madvise") or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        end -= end % mmap.PAGESIZE
+        self.map.madvise(mmap.MADV_DONTNEED, self.released, end - self.released)
+        self.released = end
+
+    def lines(self):
+        """
+        Returns:
+            (SourceLines): A view of every line in the file.
+        """
+        return SourceLines(self, 0, len(self))
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self.lines()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SourceLines:
+    """
+    A read-only view of a range of lines in a MappedSource, which can stand in for the
+    list of lines passed around by run.Session. Slicing gives another view rather than
+    a copy, and lines are only decoded when they are read.
+
+    Args:
+        source (MappedSource): File the lines are in.
+        start (int): Index of the first line in the view.
+        stop (int): Index just after the last line in the view.
+        dedent (int): Number of tabs to remove from each line, for views of an indent
+            block.
+    """
+
+    __slots__ = ("source", "start", "stop", "dedent")
+
+    def __init__(self, source, start, stop, dedent=0):
+        self.source = source
+        self.start = start
+        self.stop = stop
+        self.dedent = dedent
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("SourceLines can only be sliced with a step of 1")
+            return SourceLines(
+                self.source,
+                self.start + start,
+                self.start + max(start, stop),
+                self.dedent,
+            )
+
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("line index out of range")
+        return self._line(self.start + key)
+
+    def __iter__(self):
+        for lineno in range(self.start, self.stop):
+            yield self._line(lineno)
+
+    def _line(self, lineno):
+        line = self.source.line(lineno)
+        for _ in range(self.dedent):
+            line = line.replace("\t", "", 1)
+        return line
+
+    def indent_block(self, length):
+        """
+        Returns:
+            (SourceLines): A view of the first length lines with one less level of
+                indentation, as run.Session.get_indent_block() would build.
+        """
+        return SourceLines(
+            self.source, self.start, self.start + length, self.dedent + 1
+        )
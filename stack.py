@@ -0,0 +1,282 @@
+from array import array
+from ast_nodes import Integer
+from rply.errors import LexingError
+from run import Session, block_ends, box_counter, dedent_line, find_indent_level
+from copy import copy
+
+# Kinds of loop a block can be the body of
+REPEAT = 0
+REPEAT_UNTIL = 1
+REPEAT_FOR = 2
+
+
+class Extents:
+    """
+    The indent level of every line of a program, and where the block after each line
+    ends, worked out in one pass so that finding a block (see
+    StackSession.get_indent_block()) doesn't lex its lines again.
+
+    Args:
+        lines (list): Lines of the program. May also be a source.SourceLines view.
+        lexer: Lexer to find each line's indent level with.
+    """
+
+    def __init__(self, lines, lexer):
+        self.lines = lines
+        levels = []
+        # Number of lines before each which couldn't be lexed
+        self.broken = array("l", [0]) * (len(lines) + 1)
+        for idx, line in enumerate(lines):
+            self.broken[idx + 1] = self.broken[idx]
+            try:
+                levels.append(find_indent_level(lexer.lex(line)))
+            except LexingError:
+                # Blocks which reach this line are found by get_indent_block(), which
+                # raises the error there
+                self.broken[idx + 1] += 1
+                levels.append(0)
+        self.levels = levels
+        self.ends = block_ends(levels)
+
+
+class Lines:
+    """
+    A view of some of a program's lines, which stands in for the list of lines passed
+    around by run.Session as source.SourceLines does. Slicing gives another view
+    rather than a copy, and the blocks StackSession.get_indent_block() finds in it
+    are views of the same lines with one more tab removed from each.
+
+    Args:
+        extents (Extents): The program's lines and blocks.
+        start (int): Index of the first line in the view.
+        stop (int): Index just after the last line in the view.
+        dedent (int): Number of tabs to remove from each line.
+    """
+
+    __slots__ = ("extents", "start", "stop", "dedent")
+
+    def __init__(self, extents, start, stop, dedent=0):
+        self.extents = extents
+        self.start = start
+        self.stop = stop
+        self.dedent = dedent
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("Lines can only be sliced with a step of 1")
+            return Lines(
+                self.extents,
+                self.start + start,
+                self.start + max(start, stop),
+                self.dedent,
+            )
+
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("line index out of range")
+        return self._line(self.start + key)
+
+    def __iter__(self):
+        for index in range(self.start, self.stop):
+            yield self._line(index)
+
+    def _line(self, index):
+        return dedent_line(self.extents.lines[index], self.dedent)
+
+    def indent_block(self, initial_indent_level):
+        """
+        Returns:
+            (Lines): A view of the block at the start of this one, after a line at
+                initial_indent_level, as run.Session.get_indent_block() would build,
+                or None if it has to be found by lexing its lines (because it's not
+                after the line the view starts after, or reaches a line which can't be
+                lexed).
+        """
+        extents = self.extents
+        header = self.start - 1
+        if header < 0 or extents.levels[header] != initial_indent_level + self.dedent:
+            return None
+        stop = min(extents.ends[header], self.stop)
+        # The line after the block is lexed too, to find that the block has ended
+        if extents.broken[min(stop + 1, self.stop)] != extents.broken[self.start]:
+            return None
+        return Lines(extents, self.start, stop, self.dedent + 1)
+
+
+class StackSession(Session):
+    """
+    Runs a program exactly as Session does, but without recursion: instead of each
+    loop and 'if' calling parse() on its block, the blocks being run are kept on an
+    explicit stack, each with its own position. Programs can be nested as deeply as
+    memory allows, rather than until Python's recursion limit, and each iteration of a
+    loop restarts its block rather than making several Python calls.
+
+    Args:
+        grammar (run.Grammar): Built lexer and parser. A new one is built if not given.
+        output (file): Stream the program prints to. Defaults to sys.stdout.
+    """
+
+    def get_indent_block(self, initial_indent_level, input, state):
+        # Looks the block up in the program's Extents rather than lexing its lines
+        if type(input) is Lines:
+            block = input.indent_block(initial_indent_level)
+            if block is not None:
+                return block
+        return super().get_indent_block(initial_indent_level, input, state)
+
+    def parse_if_elseif_else(
+        self,
+        start_lineno,
+        state,
+        conditional_statements_length,
+        if_condition,
+        if_code_block,
+        elseif_tokens=[],
+        elseif_code_blocks=[],
+        else_code_block=[],
+        elseif_pos=[],
+        else_pos=None,
+        elseif_lines=[],
+    ):
+        """
+        Picks the block of an 'if' statement to run, as Session.parse_if_elseif_else()
+        does, but leaves running it to parse().
+
+        Returns:
+            (tuple): Number of lines parse() will have to skip, the block to run (None
+                if no block runs), the line number of its first line and the loop it's
+                the body of (None, as it isn't a loop's).
+        """
+        code_block_length = (
+            len(if_code_block)
+            + sum(len(block) for block in elseif_code_blocks)
+            + len(else_code_block)
+        )
+        lines_skipped = code_block_length + conditional_statements_length - 1
+
+        block, block_lineno = next(
+            self.if_blocks(
+                start_lineno,
+                state,
+                if_condition,
+                if_code_block,
+                elseif_tokens,
+                elseif_code_blocks,
+                else_code_block,
+                elseif_pos,
+                else_pos,
+                elseif_lines,
+            ),
+            (None, None),
+        )
+        return lines_skipped, block, block_lineno, None
+
+    def repeat(self, repeat_count, repeat_indent_level, input, start_lineno, state):
+        # Leaves running the block to parse(), as the methods below do
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input, state)
+        return (
+            len(repeat_code_block),
+            repeat_code_block,
+            start_lineno,
+            [REPEAT, repeat_count],
+        )
+
+    def repeatuntil(
+        self, repeatuntil_condition, repeat_indent_level, input, start_lineno, state
+    ):
+        repeatuntil_tokens = self.lexer.lex(input[0])
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input[1:], state)
+        return (
+            len(repeat_code_block),
+            None if repeatuntil_condition.value else repeat_code_block,
+            start_lineno,
+            [REPEAT_UNTIL, repeatuntil_tokens, start_lineno - 1],
+        )
+
+    def repeatfor(self, name, counts, repeat_indent_level, input, start_lineno, state):
+        repeat_code_block = self.get_indent_block(repeat_indent_level, input, state)
+        reads = box_counter(name, counts, repeat_code_block, state)
+        counts = iter(counts)
+        count = next(counts, None)
+        if count is not None and reads:
+            state.variables[name] = Integer(count)
+        return (
+            len(repeat_code_block),
+            None if count is None else repeat_code_block,
+            start_lineno,
+            [REPEAT_FOR, counts, name, reads],
+        )
+
+    def parse(self, input, start_lineno, state):
+        parser = self.parser
+        if type(input) is not Lines:
+            # The blocks of the program (or of the lines run_statements() gives) are
+            # found once, rather than again at each level they're nested in
+            input = Lines(Extents(input, self.lexer), 0, len(input))
+
+        # The block running is kept in local variables, and the blocks it's nested in
+        # on the stack. loop is [REPEAT, iterations left], [REPEAT_UNTIL, tokens of
+        # the condition, its line number] or [REPEAT_FOR, the counter's values left,
+        # its name, whether the block reads it] if the block is a loop's body
+        stack = []
+        loop = None
+        idx = 0
+
+        while True:
+            if idx >= len(input):
+                # End of the block: run it again, or carry on with the block it's in
+                if loop is not None:
+                    if loop[0] == REPEAT:
+                        loop[1] -= 1
+                        again = loop[1] > 0
+                    elif loop[0] == REPEAT_FOR:
+                        count = next(loop[1], None)
+                        again = count is not None
+                        if again and loop[3]:
+                            state.variables[loop[2]] = Integer(count)
+                    else:
+                        try:
+                            condition = parser.parse(copy(loop[1]), state=state).eval()
+                        except:
+                            self.error_at(loop[2], state)
+                            raise
+                        again = not condition.value
+                    if again:
+                        idx = 0
+                        continue
+                if not stack:
+                    return
+                input, start_lineno, idx, loop = stack.pop()
+                continue
+
+            line = input[idx]
+            tokens = self.lexer.lex(line)
+            lineno = idx + start_lineno
+            current_indent_level = find_indent_level(copy(tokens))
+
+            if current_indent_level is not None:
+                self.begin(lineno, line, state)
+            # Loops and 'if' statements give the block to run (see the methods above)
+            # rather than running it, and other statements the lines to skip
+            result = self.statement_method(tokens)(
+                tokens, current_indent_level, input, idx, lineno, state
+            )
+            if type(result) is int:
+                idx += 1 + result
+                continue
+            lines_skipped, block, block_lineno, block_loop = result
+            idx += 1 + lines_skipped
+
+            if block:
+                # Run the block, then carry on from here
+                stack.append((input, start_lineno, idx, loop))
+                input = block
+                start_lineno = block_lineno
+                loop = block_loop
+                idx = 0
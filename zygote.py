@@ -0,0 +1,371 @@
+import array
+import contextlib
+import json
+import os
+import signal
+import socket
+import sys
+
+# Only the standard library is imported here, so the client starts as quickly as
+# Python does. The zygote imports run (and RPly) when it starts.
+
+# Socket the zygote listens on and the client connects to, unless TRAVERSAL_ZYGOTE
+# gives another
+DEFAULT_PATH = os.path.join(
+    os.environ.get("TMPDIR", "/tmp"), f"traversal-zygote-{os.getuid()}.sock"
+)
+
+# Largest request (the arguments and working directory) accepted from a client
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Seconds the rest of a request may take to arrive once its first part has. Clients
+# send it all at once, so this only stops one that doesn't holding up the others
+REQUEST_TIMEOUT = 1.0
+
+# Signals the client passes on to the process running its program, so Ctrl-C and
+# --checkpoint's SIGUSR1 and SIGTERM work as they do when run.py runs it directly
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1)
+
+
+def exit_code(status):
+    # Exit code of a child from its wait status, negative if a signal killed it
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def receive_request(conn):
+    """
+    Receives a client's request: a line of JSON, sent with the client's stdin, stdout
+    and stderr.
+
+    Args:
+        conn (socket.socket): Connection from the client.
+
+    Returns:
+        (tuple): The request, and the three file descriptors.
+    """
+    fds = array.array("i")
+    data, ancdata, _, _ = conn.recvmsg(
+        MAX_REQUEST_BYTES, socket.CMSG_LEN(3 * fds.itemsize)
+    )
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[: len(cmsg_data) - len(cmsg_data) % fds.itemsize])
+    try:
+        while data and not data.endswith(b"\n"):
+            if len(data) > MAX_REQUEST_BYTES:
+                raise ValueError("The request is too large")
+            more = conn.recv(MAX_REQUEST_BYTES)
+            if not more:
+                raise ValueError("The client closed the connection")
+            data += more
+        if len(fds) != 3:
+            raise ValueError("Requests must be sent with stdin, stdout and stderr")
+        request = json.loads(data)
+        if not isinstance(request, dict):
+            raise ValueError("Requests must be JSON objects")
+        if not isinstance(request.get("argv"), list) or not all(
+            isinstance(arg, str) for arg in request["argv"]
+        ):
+            raise ValueError("Requests must give the arguments as strings")
+        if not isinstance(request.get("cwd"), str):
+            raise ValueError("Requests must give the working directory")
+    except Exception:
+        for fd in fds:
+            os.close(fd)
+        raise
+    return request, list(fds)
+
+
+class Zygote:
+    """
+    A process which builds the lexer and parser for every backend once, then forks a
+    child for each program a client (see run_remote()) asks it to run. The child
+    starts with everything already imported and built, takes over the client's stdin,
+    stdout and stderr, and runs run.main() with the client's arguments in the
+    client's working directory, so it prints straight to the client's streams and
+    behaves exactly as run.py would. Once the child exits, the zygote sends its exit
+    status to the client.
+
+    Programs run with the zygote's environment, not the client's.
+
+    Args:
+        path (string): Path of the Unix socket to listen on.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        import run
+
+        self.path = path
+        self.main = run.main
+        self.grammars = {
+            (lexer, parser): run.Grammar(lexer_backend=lexer, parser_backend=parser)
+            for lexer in run.Grammar.LEXER_BACKENDS
+            for parser in run.Grammar.PARSER_BACKENDS
+        }
+        self.children = {}  # Connection to the client of each child, by process ID
+        self.waiting = set()  # Connections whose requests haven't arrived yet
+
+    def serve_forever(self):
+        """
+        Listens for clients until interrupted.
+        """
+        import selectors
+
+        # Children exiting wake the loop up through a pipe, so they're reaped (and
+        # their clients told) straight away
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+        if os.path.exists(self.path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(self.path)
+                except OSError:
+                    os.unlink(self.path)  # Left behind by a zygote which was killed
+                else:
+                    raise OSError(f"A zygote is already listening on {self.path}")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(128)
+        print(f"Zygote ready on {self.path}", flush=True)
+
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        selector.register(wakeup_read, selectors.EVENT_READ)
+        self.selector = selector
+        # File descriptors of the zygote's own, which each child closes
+        self.closed_in_child = [
+            listener.fileno(),
+            wakeup_read,
+            wakeup_write,
+            selector.fileno(),
+        ]
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fileobj is listener:
+                        self.accept(listener)
+                    elif key.fileobj is wakeup_read:
+                        with contextlib.suppress(BlockingIOError):
+                            while os.read(wakeup_read, 512):
+                                pass
+                        self.reap()
+                    else:
+                        self.start(key.fileobj)
+        finally:
+            signal.set_wakeup_fd(-1)
+            for conn in self.waiting:
+                conn.close()
+            selector.close()
+            listener.close()
+            os.close(wakeup_read)
+            os.close(wakeup_write)
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+    def accept(self, listener):
+        # Waits for a new client's request without blocking, so a client which is slow
+        # to send it doesn't hold up any other
+        import selectors
+
+        conn, _ = listener.accept()
+        self.waiting.add(conn)
+        self.selector.register(conn, selectors.EVENT_READ)
+
+    def start(self, conn):
+        # Starts a child for a client's request, once it's started to arrive
+        self.selector.unregister(conn)
+        self.waiting.discard(conn)
+        conn.settimeout(REQUEST_TIMEOUT)
+        try:
+            request, fds = receive_request(conn)
+        except (OSError, ValueError):
+            conn.close()
+            return
+        conn.settimeout(None)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self.child(conn, request, fds)
+
+        for fd in fds:
+            os.close(fd)
+        self.children[pid] = conn
+        with contextlib.suppress(OSError):
+            conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+
+    def reap(self):
+        # Tells the client of each child which has exited its exit status
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = self.children.pop(pid, None)
+            if conn is None:
+                continue
+            with contextlib.suppress(OSError):
+                conn.sendall(json.dumps({"status": exit_code(status)}).encode() + b"\n")
+            conn.close()
+
+    def child(self, conn, request, fds):
+        # Runs a client's program in the forked child, then exits. The zygote reports
+        # the exit status, so nothing of the zygote's is used once the program starts
+        status = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # Even if the zygote was started ignoring Ctrl-C
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            conn.close()
+            for other in self.children.values():
+                other.close()
+            for other in self.waiting:
+                other.close()
+            for fd in self.closed_in_child:
+                os.close(fd)
+
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            sys.stdin = open(0, "r", closefd=False)
+            sys.stdout = open(1, "w", closefd=False)
+            sys.stderr = open(2, "w", closefd=False)
+            sys.argv = ["run.py"] + request["argv"]
+
+            status = self.run_main(request["argv"], request["cwd"])
+            if status < 0:
+                # Stopped by Ctrl-C, which Python exits with by killing itself
+                signal.signal(-status, signal.SIG_DFL)
+                os.kill(os.getpid(), -status)
+        finally:
+            os._exit(status)
+
+    def run_main(self, argv, cwd):
+        # Runs run.main() as if it were the main program, returning the exit code, or
+        # minus the signal to kill the child with
+        try:
+            os.chdir(cwd)
+            self.main(argv, self.grammars)
+            status = 0
+        except SystemExit as exit:
+            # Just as the Python interpreter treats SystemExit
+            if exit.code is None:
+                status = 0
+            elif isinstance(exit.code, int):
+                status = exit.code
+            else:
+                print(exit.code, file=sys.stderr)
+                status = 1
+        except BaseException:
+            # Python flushes stdout before printing an error which stops it
+            with contextlib.suppress(OSError):
+                sys.stdout.flush()
+            sys.excepthook(*sys.exc_info())
+            status = -signal.SIGINT if sys.exc_info()[0] is KeyboardInterrupt else 1
+
+        import atexit
+
+        atexit._run_exitfuncs()
+        with contextlib.suppress(OSError):
+            sys.stdout.flush()
+        with contextlib.suppress(OSError):
+            sys.stderr.flush()
+        return status
+
+
+def serve(path=DEFAULT_PATH):
+    """
+    Runs a zygote until interrupted. See Zygote.
+    """
+    zygote = Zygote(path)
+    # Stopped cleanly, removing the socket, on SIGTERM as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    try:
+        zygote.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_remote(argv, path=DEFAULT_PATH, fds=(0, 1, 2), started=None):
+    """
+    Runs run.py with some arguments in a child of the zygote, giving it this process's
+    working directory and streams.
+
+    Args:
+        argv (list): Arguments, as they would be given to run.py.
+        path (string): Path of the zygote's socket.
+        fds (tuple): File descriptors the program uses as its stdin, stdout and
+            stderr.
+        started (function): Called with the process ID of the child once it's
+            started, e.g. to pass signals on to it.
+
+    Returns:
+        (int): The child's exit code, negative if a signal killed it.
+
+    Raises:
+        OSError: If no zygote is listening on the socket.
+        ConnectionError: If the zygote stops before the child exits.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        request = json.dumps({"argv": list(argv), "cwd": os.getcwd()}).encode() + b"\n"
+        sock.sendmsg(
+            [request],
+            [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))],
+        )
+        with sock.makefile("rb") as replies:
+            for line in replies:
+                reply = json.loads(line)
+                if "pid" in reply and started is not None:
+                    started(reply["pid"])
+                elif "status" in reply:
+                    return reply["status"]
+    raise ConnectionError("The zygote stopped before the program finished")
+
+
+def main():
+    """
+    Client: runs run.py with this script's arguments on the zygote, passing signals on
+    to the program and exiting with its exit status. Runs run.py itself if there's
+    no zygote listening.
+    """
+    argv = sys.argv[1:]
+    path = os.environ.get("TRAVERSAL_ZYGOTE", DEFAULT_PATH)
+
+    def forward(pid):
+        def send(signum, frame):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signum)
+
+        for signum in FORWARDED_SIGNALS:
+            signal.signal(signum, send)
+
+    try:
+        status = run_remote(argv, path, started=forward)
+    except (FileNotFoundError, ConnectionRefusedError):
+        run_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py")
+        os.execv(sys.executable, [sys.executable, run_py] + argv)
+    except ConnectionError as err:
+        print(f"zygote.py: {err}", file=sys.stderr)
+        sys.exit(1)
+    if status < 0:
+        # Killed by the same signal as the program was
+        signal.signal(-status, signal.SIG_DFL)
+        os.kill(os.getpid(), -status)
+        status = 128 - status
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()